@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+"""
+行转换器性能基准：对比原有两遍处理与编译行转换器
+
+用法: python benchmark_row_converter.py [总行数] [批次大小]
+默认 1,000,000 行，按 10,000 行一批（与同步时分批处理一致）
+结果一致性由 test_row_conversion.py 验证，这里只计时
+"""
+
+import sys
+import time
+import random
+import logging
+from decimal import Decimal
+from datetime import datetime, timedelta
+
+# 添加当前目录到路径
+sys.path.append('.')
+
+from smart_sync_incremental_optimized import BatchDataProcessor, CompiledRowConverter
+
+# 基准测试时关闭逐批日志
+logging.getLogger().setLevel(logging.WARNING)
+
+FIELD_TYPES = {
+    'id': 'bigint(20)',
+    'order_no': 'varchar(32)',
+    'member_id': 'int(11)',
+    'amount': 'decimal(10,2)',
+    'discount': 'double',
+    'status': 'tinyint(4)',
+    'remark': 'text',
+    'created_at': 'datetime',
+    'updated_at': 'timestamp',
+    'biz_date': 'date',
+    'pay_time': 'time',
+}
+
+def generate_rows(start_id: int, count: int):
+    """生成与MySQL游标返回值类型一致的合成数据"""
+    base_time = datetime(2024, 1, 1)
+    rows = []
+    for i in range(start_id, start_id + count):
+        created_at = base_time + timedelta(seconds=i)
+        rows.append({
+            'id': i,
+            'order_no': f"NO{i:012d}",
+            'member_id': random.randint(1, 100000),
+            'amount': Decimal(random.randint(100, 999999)) / 100,
+            'discount': random.random(),
+            'status': random.randint(0, 5),
+            'remark': None if i % 3 else f"remark {i}",
+            'created_at': created_at,
+            'updated_at': created_at,
+            'biz_date': created_at.date(),
+            'pay_time': timedelta(seconds=i % 86400),
+        })
+    return rows
+
+def legacy_prepare_rows(rows, tenant_id, sync_timestamp, sync_mode):
+    """原有实现：添加系统字段 + 基础类型处理，再批量标准化"""
+    for row in rows:
+        row['tenant_id'] = tenant_id
+        row['sync_timestamp'] = sync_timestamp
+        row['sync_mode'] = sync_mode
+
+        for key, value in row.items():
+            if isinstance(value, datetime):
+                row[key] = value.isoformat()
+            elif isinstance(value, Decimal):
+                row[key] = float(value)
+
+    return BatchDataProcessor.batch_normalize_data_types(rows, FIELD_TYPES)
+
+def run_benchmark(total_rows: int, batch_size: int):
+    print("🧪 行转换器性能基准")
+    print("=" * 50)
+    print(f"📊 总行数: {total_rows:,}, 批次大小: {batch_size:,}")
+
+    random.seed(42)
+    sync_timestamp = datetime.now().isoformat()
+    legacy_seconds = 0.0
+    compiled_seconds = 0.0
+    converter = None
+
+    for start_id in range(0, total_rows, batch_size):
+        rows = generate_rows(start_id, min(batch_size, total_rows - start_id))
+        legacy_input = [dict(row) for row in rows]
+
+        started = time.perf_counter()
+        legacy_prepare_rows(legacy_input, 'shop1', sync_timestamp, 'FULL')
+        legacy_seconds += time.perf_counter() - started
+
+        started = time.perf_counter()
+        if converter is None:
+            converter = CompiledRowConverter(tuple(rows[0].keys()), FIELD_TYPES)
+        converter.convert(rows, 'shop1', sync_timestamp, 'FULL')
+        compiled_seconds += time.perf_counter() - started
+
+    print(f"\n⏱️ 原有两遍处理: {legacy_seconds:.2f} 秒 ({total_rows / legacy_seconds:,.0f} 行/秒)")
+    print(f"⏱️ 编译行转换器: {compiled_seconds:.2f} 秒 ({total_rows / compiled_seconds:,.0f} 行/秒)")
+    print(f"🚀 加速比: {legacy_seconds / compiled_seconds:.1f}x")
+
+if __name__ == "__main__":
+    total_rows = int(sys.argv[1]) if len(sys.argv) > 1 else 1000000
+    batch_size = int(sys.argv[2]) if len(sys.argv) > 2 else 10000
+    run_benchmark(total_rows, batch_size)
@@ -14,27 +14,19 @@ import logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
-def migrate_status_files(status_dir: str = "sync_status"):
-    """迁移状态文件"""
-    status_path = Path(status_dir)
-    
-    if not status_path.exists():
-        logger.info("状态目录不存在，无需迁移")
-        return
-    
-    # 扫描所有单表状态文件
-    single_table_files = list(status_path.glob("*_*.json"))
-    
-    if not single_table_files:
-        logger.info("未找到需要迁移的单表状态文件")
-        return
-    
-    logger.info(f"发现 {len(single_table_files)} 个单表状态文件，开始迁移...")
+def group_single_table_files(status_path: Path):
+    """将单表状态文件按数据库分组
     
-    # 按数据库分组
+    返回 (databases, migrated_files)：databases 为 {tenant_id: 按数据库分组的状态}，
+    migrated_files 为成功解析的单表文件（以下划线开头的CDC位置、表结构缓存等文件不在其中）。
+    """
     databases = {}
+    migrated_files = []
     
-    for file_path in single_table_files:
+    for file_path in status_path.glob("*_*.json"):
+        # 以下划线开头的是同步工具的内部文件
+        if file_path.stem.startswith('_'):
+            continue
         try:
             # 解析文件名：tenant_id_table_name.json
             filename = file_path.stem
@@ -78,12 +70,45 @@ def migrate_status_files(status_dir: str = "sync_status"):
                 'error_message': table_data.get('error_message'),
                 'updated_at': table_data.get('updated_at', datetime.now().isoformat())
             }
+            migrated_files.append(file_path)
             
             logger.info(f"  ✅ 迁移表: {tenant_id}.{table_name}")
             
         except Exception as e:
             logger.error(f"  ❌ 迁移失败 {file_path.name}: {e}")
     
+    return databases, migrated_files
+
+def load_database_files(status_path: Path):
+    """读取按数据库分组的状态文件 {tenant_id}.json"""
+    databases = {}
+    for file_path in status_path.glob("*.json"):
+        if '_' in file_path.stem:
+            continue
+        try:
+            with open(file_path, 'r', encoding='utf-8') as f:
+                databases[file_path.stem] = json.load(f)
+        except Exception as e:
+            logger.error(f"  ❌ 读取失败 {file_path.name}: {e}")
+    return databases
+
+def migrate_status_files(status_dir: str = "sync_status"):
+    """迁移状态文件"""
+    status_path = Path(status_dir)
+    
+    if not status_path.exists():
+        logger.info("状态目录不存在，无需迁移")
+        return
+    
+    # 扫描所有单表状态文件并按数据库分组
+    databases, single_table_files = group_single_table_files(status_path)
+    
+    if not single_table_files:
+        logger.info("未找到需要迁移的单表状态文件")
+        return
+    
+    logger.info(f"已解析 {len(single_table_files)} 个单表状态文件")
+    
     # 保存合并后的数据库状态文件
     migrated_count = 0
     for tenant_id, db_data in databases.items():
@@ -168,10 +193,48 @@ def preview_migration(status_dir: str = "sync_status"):
             except Exception as e:
                 logger.warning(f"  ⚠️ 读取失败 {file_path.name}: {e}")
 
+def migrate_to_sqlite(status_dir: str = "sync_status", db_path: str = None):
+    """一次性将JSON状态导入SQLite状态库（status_storage = "sqlite"）
+    
+    导入按数据库分组的状态文件（含断点）、旧的单表状态文件和CDC位置，JSON文件保留不动。
+    """
+    from smart_sync_incremental_optimized import SQLiteStatusManager
+    
+    status_path = Path(status_dir)
+    if not status_path.exists():
+        logger.info("状态目录不存在，无需导入")
+        return
+    
+    # 旧的单表文件先分组，按数据库分组的文件更新，覆盖同名表
+    databases, _ = group_single_table_files(status_path)
+    for tenant_id, db_data in load_database_files(status_path).items():
+        databases.setdefault(tenant_id, {'tables': {}})['tables'].update(db_data.get('tables', {}))
+    
+    status_manager = SQLiteStatusManager(db_path or str(status_path / "sync_status.db"))
+    try:
+        table_count = 0
+        for tenant_id, db_data in databases.items():
+            status_manager.import_tables(tenant_id, db_data['tables'])
+            table_count += len(db_data['tables'])
+            logger.info(f"✅ 导入数据库状态: {tenant_id} ({len(db_data['tables'])} 张表)")
+        
+        position_file = status_path / "_cdc_positions.json"
+        if position_file.exists():
+            with open(position_file, 'r', encoding='utf-8') as f:
+                positions = json.load(f)
+            for stream_id, entry in positions.items():
+                status_manager.save_cdc_position(stream_id, entry['position'])
+        
+        logger.info(f"🎉 导入完成！{len(databases)} 个数据库, {table_count} 张表 -> {status_manager.db_path}")
+    finally:
+        status_manager.close()
+
 if __name__ == "__main__":
     import sys
     
     if len(sys.argv) > 1 and sys.argv[1] == '--preview':
         preview_migration()
+    elif len(sys.argv) > 1 and sys.argv[1] == '--to-sqlite':
+        migrate_to_sqlite(db_path=sys.argv[2] if len(sys.argv) > 2 else None)
     else:
         migrate_status_files()
\ No newline at end of file
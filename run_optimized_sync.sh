@@ -4,6 +4,7 @@
 # 使用方法：
 #   ./run_optimized_sync.sh          # 增量同步
 #   ./run_optimized_sync.sh --full   # 强制全量同步
+#   ./run_optimized_sync.sh --shard 4 [--run-id ID]   # 多进程分片同步（可与 --full 组合）
 
 echo "🚀 启动智能增量同步工具 - 性能优化版"
 echo "=================================="
@@ -43,15 +44,13 @@ echo "  🎯 智能写入策略 - 根据数据量选择最优方式"
 # 执行同步
 echo ""
 echo "⚡ 开始同步..."
-if [ "$1" = "--full" ]; then
+if [[ " $* " == *" --full "* ]]; then
     echo "🔄 强制全量同步模式"
-    python3 smart_sync_incremental_optimized.py --full 2>&1 | tee "$LOG_FILE"
-    SYNC_RESULT=${PIPESTATUS[0]}
 else
     echo "⚡ 智能增量同步模式"
-    python3 smart_sync_incremental_optimized.py 2>&1 | tee "$LOG_FILE"
-    SYNC_RESULT=${PIPESTATUS[0]}
 fi
+python3 smart_sync_incremental_optimized.py "$@" 2>&1 | tee "$LOG_FILE"
+SYNC_RESULT=${PIPESTATUS[0]}
 
 # 显示结果
 echo ""
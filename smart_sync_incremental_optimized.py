@@ -7,18 +7,62 @@
 import mysql.connector
 import mysql.connector.pooling
 from google.cloud import bigquery
+from google.api_core.exceptions import BadRequest, Conflict, GoogleAPIError, NotFound
 import json
+import multiprocessing
+import os
+import random
+import re
+import socket
+import sqlite3
 import sys
-from datetime import datetime, timedelta
+import io
+import base64
+from datetime import date, datetime, timedelta, timezone
 from decimal import Decimal
 import time
 import logging
-from typing import Dict, List, Optional, Tuple
+from typing import Callable, Dict, Iterator, List, Optional, Set, Tuple
 import traceback
+import uuid
 from concurrent.futures import ThreadPoolExecutor, as_completed
 import threading
+import queue
+from collections import deque
+from contextlib import contextmanager
 from pathlib import Path
 
+# 可选依赖：binlog CDC 数据源 (pip install mysql-replication)
+try:
+    from pymysqlreplication import BinLogStreamReader
+    from pymysqlreplication.event import XidEvent
+    from pymysqlreplication.row_event import DeleteRowsEvent, UpdateRowsEvent, WriteRowsEvent
+except ImportError:
+    BinLogStreamReader = None
+
+# 可选依赖：列式加载文件 (pip install pyarrow)
+try:
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+
+# 可选依赖：Storage Write API 写入 (pip install google-cloud-bigquery-storage)
+try:
+    from google.cloud import bigquery_storage_v1
+    from google.cloud.bigquery_storage_v1 import types as storage_types
+    from google.cloud.bigquery_storage_v1 import writer as storage_writer
+    from google.protobuf import descriptor_pb2, descriptor_pool, message_factory
+except ImportError:
+    bigquery_storage_v1 = None
+
+# 文件锁（POSIX）：多进程分片时保护本地状态文件的读-改-写，Windows 下不可用
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
 # 配置日志
 logging.basicConfig(
     level=logging.INFO,
@@ -58,18 +102,110 @@ MYSQL_TO_BQ_TYPE = {
     "set": "STRING"
 }
 
+# BigQuery NUMERIC 最多 29 位整数、9 位小数；BIGNUMERIC 最多 38 位整数
+NUMERIC_MAX_INTEGER_DIGITS = 29
+BIGNUMERIC_MAX_INTEGER_DIGITS = 38
+
+def mysql_to_bq_type(mysql_type: str) -> str:
+    """MySQL 字段类型（如 decimal(40,2)）-> BigQuery 类型
+    
+    DECIMAL 按声明的整数位数选择：NUMERIC 放不下时用 BIGNUMERIC，BIGNUMERIC 也放不下时只能用 FLOAT64。
+    小数位超过 9 位仍映射为 NUMERIC，写入时按 BigQuery 的规则四舍五入（远离零）到 9 位。
+    """
+    bq_type = MYSQL_TO_BQ_TYPE.get(mysql_type.split("(")[0].strip().lower(), "STRING")
+    if bq_type == "NUMERIC":
+        match = re.match(r"\w+\((\d+)(?:,\s*(\d+))?\)", mysql_type.strip().lower())
+        if match:
+            integer_digits = int(match.group(1)) - int(match.group(2) or 0)
+            if integer_digits > BIGNUMERIC_MAX_INTEGER_DIGITS:
+                return "FLOAT64"
+            if integer_digits > NUMERIC_MAX_INTEGER_DIGITS:
+                return "BIGNUMERIC"
+    return bq_type
+
+# binlog CDC 位置在状态存储中的流ID
+BINLOG_STREAM_ID = "binlog"
+
 # 常见时间戳字段名（按优先级排序）
 TIMESTAMP_FIELDS = [
     'updated_at', 'update_time', 'last_updated', 'modified_at', 'last_modified',
     'created_at', 'create_time', 'insert_time', 'timestamp', 'sync_time'
 ]
 
+# 行过滤条件中允许出现的SQL关键字（其余标识符必须是表字段或函数调用）
+ROW_FILTER_KEYWORDS = {
+    'AND', 'OR', 'NOT', 'XOR', 'IN', 'IS', 'NULL', 'LIKE', 'REGEXP', 'RLIKE', 'BETWEEN', 'ESCAPE',
+    'TRUE', 'FALSE', 'DIV', 'MOD', 'CASE', 'WHEN', 'THEN', 'ELSE', 'END', 'INTERVAL', 'AS', 'BINARY',
+    'CHAR', 'SIGNED', 'UNSIGNED', 'DECIMAL', 'DATE', 'DATETIME', 'TIME',
+    'CURRENT_DATE', 'CURRENT_TIME', 'CURRENT_TIMESTAMP', 'UTC_DATE', 'UTC_TIME', 'UTC_TIMESTAMP',
+    'MICROSECOND', 'SECOND', 'MINUTE', 'HOUR', 'DAY', 'WEEK', 'MONTH', 'QUARTER', 'YEAR'
+}
+
+# 行过滤条件中允许调用的函数（SLEEP、BENCHMARK、GET_LOCK、LOAD_FILE 等有副作用或耗时的函数不在其中）
+ROW_FILTER_FUNCTIONS = {
+    'NOW', 'SYSDATE', 'CURDATE', 'CURTIME', 'UTC_DATE', 'UTC_TIMESTAMP', 'CURRENT_DATE', 'CURRENT_TIMESTAMP',
+    'DATE', 'TIMESTAMP', 'DATE_ADD', 'DATE_SUB', 'ADDDATE', 'SUBDATE', 'DATE_FORMAT', 'STR_TO_DATE',
+    'FROM_UNIXTIME', 'UNIX_TIMESTAMP', 'TIMESTAMPDIFF', 'DATEDIFF', 'YEAR', 'MONTH', 'DAY', 'HOUR',
+    'COALESCE', 'IFNULL', 'NULLIF', 'IF', 'LOWER', 'UPPER', 'TRIM', 'LENGTH', 'CHAR_LENGTH',
+    'SUBSTRING', 'SUBSTR', 'LEFT', 'RIGHT', 'CONCAT', 'CAST', 'CONVERT', 'ABS', 'ROUND', 'FLOOR',
+    'CEIL', 'CEILING', 'JSON_EXTRACT', 'JSON_UNQUOTE', 'JSON_CONTAINS', 'FIND_IN_SET', 'LEAST', 'GREATEST'
+}
+
+# 字符串字面量中的反斜杠转义（\% 和 \_ 保留反斜杠，供 LIKE 匹配字面的 % 和 _）
+SQL_STRING_ESCAPES = {'0': '\0', "'": "'", '"': '"', 'b': '\b', 'n': '\n', 'r': '\r', 't': '\t',
+                      'Z': '\x1a', '\\': '\\', '%': '\\%', '_': '\\_'}
+
+def get_pooled_connection(connection_pool, timeout: float = 60.0):
+    """从连接池获取连接，连接池耗尽时等待而不是立即失败"""
+    deadline = time.time() + timeout
+    while True:
+        try:
+            return connection_pool.get_connection()
+        except mysql.connector.errors.PoolError:
+            if time.time() >= deadline:
+                raise
+            time.sleep(0.1)
+
+def write_file_atomic(path: Path, content: str):
+    """原子写文件：写临时文件并 fsync 后 rename 覆盖，崩溃时只会留下旧文件或新文件，不会是半截文件"""
+    path = Path(path)
+    # 临时文件名按进程和调用唯一：多个分片进程同时保存同一文件时不会写进同一个临时文件
+    temp_file = path.with_name(f".{path.name}.{os.getpid()}.{uuid.uuid4().hex[:8]}.tmp")
+    try:
+        with open(temp_file, 'w', encoding='utf-8') as f:
+            f.write(content)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_file, path)
+    except BaseException:
+        temp_file.unlink(missing_ok=True)
+        raise
+    # rename 本身也要落盘，否则掉电后目录项可能仍指向旧文件
+    try:
+        dir_fd = os.open(path.parent, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(dir_fd)
+    except OSError:
+        pass
+    finally:
+        os.close(dir_fd)
+
 class TableInfoCache:
-    """表信息缓存类"""
+    """表信息缓存类
     
-    def __init__(self):
+    指定 cache_file 时持久化到磁盘，每项附带表结构指纹（列名、类型、键的MD5）。
+    启动时一次查询比对所有表的指纹，结构未变的表直接复用，跳过 DESCRIBE 和主键查询。
+    """
+    
+    def __init__(self, cache_file: Optional[str] = None):
         self._cache = {}
+        self._fingerprints = {}
+        self._persisted = {}
         self._lock = threading.Lock()
+        self.cache_file = Path(cache_file) if cache_file else None
+        self._load()
     
     def get_table_info(self, db_name: str, table_name: str) -> Optional[Dict]:
         """获取缓存的表信息"""
@@ -84,49 +220,343 @@ class TableInfoCache:
             self._cache[key] = info
             logger.info(f"  💾 缓存表信息: {key}")
     
+    def set_many(self, entries: Dict[str, Dict]):
+        """批量设置表信息缓存 {"库.表": 表信息}"""
+        with self._lock:
+            self._cache.update(entries)
+    
+    @staticmethod
+    def _serialize_info(info: Dict) -> Dict:
+        return {
+            'schema': [[field.name, field.field_type, field.mode] for field in info['schema']],
+            'field_types': info['field_types'],
+            'timestamp_field': info['timestamp_field'],
+            'primary_keys': info['primary_keys'],
+            'columns': info.get('columns')
+        }
+    
+    @staticmethod
+    def _deserialize_info(data: Dict) -> Dict:
+        return {
+            'schema': [bigquery.SchemaField(name, field_type, mode=mode) for name, field_type, mode in data['schema']],
+            'field_types': data['field_types'],
+            'timestamp_field': data['timestamp_field'],
+            'primary_keys': data['primary_keys'],
+            'columns': data.get('columns')
+        }
+    
+    def _load(self):
+        """读取磁盘缓存（尚未校验，需经 validate 比对指纹后才会使用）"""
+        if self.cache_file is None or not self.cache_file.exists():
+            return
+        try:
+            with open(self.cache_file, 'r', encoding='utf-8') as f:
+                self._persisted = json.load(f)
+        except Exception as e:
+            logger.warning(f"⚠️ 读取表结构缓存失败 {self.cache_file}: {e}")
+            self._persisted = {}
+    
+    def validate(self, fingerprints: Dict[str, str]) -> int:
+        """用当前表结构指纹校验磁盘缓存，返回可复用的表数
+        
+        fingerprints: {"库.表": 指纹}，只包含本次同步范围内存在的表；
+        指纹不一致或表已不存在的条目被丢弃，之后分析的表按此指纹保存。
+        """
+        reused = 0
+        with self._lock:
+            self._fingerprints.update(fingerprints)
+            for key, fingerprint in fingerprints.items():
+                entry = self._persisted.get(key)
+                if entry is None:
+                    continue
+                if entry.get('fingerprint') != fingerprint:
+                    del self._persisted[key]
+                    continue
+                if key not in self._cache:
+                    self._cache[key] = self._deserialize_info(entry['info'])
+                reused += 1
+        return reused
+    
+    def save(self):
+        """将带指纹的缓存写入磁盘（先写临时文件再替换）"""
+        if self.cache_file is None:
+            return
+        with self._lock:
+            entries = dict(self._persisted)
+            for key, info in self._cache.items():
+                if key in self._fingerprints:
+                    entries[key] = {'fingerprint': self._fingerprints[key], 'info': self._serialize_info(info)}
+            self._persisted = entries
+        
+        try:
+            self.cache_file.parent.mkdir(parents=True, exist_ok=True)
+            write_file_atomic(self.cache_file, json.dumps(entries, ensure_ascii=False))
+            logger.info(f"💾 表结构缓存已保存: {len(entries)} 张表")
+        except Exception as e:
+            logger.warning(f"⚠️ 保存表结构缓存失败 {self.cache_file}: {e}")
+    
     def clear(self):
         """清空缓存"""
         with self._lock:
             self._cache.clear()
 
-class LocalFileStatusManager:
-    """本地文件状态管理器 - 按数据库分组"""
+class StatusManagerBase:
+    """状态管理器公共逻辑：断点值编码、断点结构的合并与解析
+    
+    后端实现 update_sync_status / get_last_sync_time / get_watermark / get_checkpoint / save_checkpoint /
+    clear_checkpoint / get_cdc_position / save_cdc_position / get_database_summary。
+    """
+    
+    @staticmethod
+    def _encode_checkpoint_value(value):
+        """将主键/时间戳值编码为可JSON序列化的形式（保留类型）"""
+        if isinstance(value, datetime):
+            return {'$datetime': value.isoformat()}
+        if isinstance(value, date):
+            return {'$date': value.isoformat()}
+        if isinstance(value, Decimal):
+            return {'$decimal': str(value)}
+        if isinstance(value, (bytes, bytearray)):
+            return {'$bytes': base64.b64encode(bytes(value)).decode('ascii')}
+        if isinstance(value, (list, tuple)):
+            return [StatusManagerBase._encode_checkpoint_value(v) for v in value]
+        return value
+    
+    @staticmethod
+    def _decode_checkpoint_value(value):
+        """还原 _encode_checkpoint_value 编码的值，列表还原为元组"""
+        if isinstance(value, dict):
+            if '$datetime' in value:
+                return datetime.fromisoformat(value['$datetime'])
+            if '$date' in value:
+                return date.fromisoformat(value['$date'])
+            if '$decimal' in value:
+                return Decimal(value['$decimal'])
+            if '$bytes' in value:
+                return base64.b64decode(value['$bytes'])
+        if isinstance(value, list):
+            return tuple(StatusManagerBase._decode_checkpoint_value(v) for v in value)
+        return value
+    
+    @classmethod
+    def _encode_watermark(cls, watermark: Optional[Dict]) -> Optional[Dict]:
+        """编码增量水位 {'ts', 'pk', 'inclusive'}"""
+        if not watermark:
+            return None
+        return {
+            'ts': cls._encode_checkpoint_value(watermark['ts']),
+            'pk': cls._encode_checkpoint_value(watermark.get('pk')),
+            'inclusive': bool(watermark.get('inclusive'))
+        }
+    
+    @classmethod
+    def _decode_watermark(cls, data: Optional[Dict]) -> Optional[Dict]:
+        """还原增量水位，pk 为元组或 None"""
+        if not data:
+            return None
+        return {
+            'ts': cls._decode_checkpoint_value(data['ts']),
+            'pk': cls._decode_checkpoint_value(data.get('pk')),
+            'inclusive': data.get('inclusive', False)
+        }
+    
+    @classmethod
+    def _merge_checkpoint(cls, checkpoint: Optional[Dict], sync_mode: str, run_started_at: datetime,
+                          last_sync_time: datetime = None, segment_id: str = None, position: tuple = None,
+                          chunk_seq: int = 0, records_synced: int = 0, done: bool = False,
+                          key_ranges: List[Tuple] = None) -> Dict:
+        """在已有断点上记录一个分段的进度（不同运行的旧断点被替换），返回新的断点结构"""
+        if not checkpoint or checkpoint.get('run_started_at') != run_started_at.isoformat():
+            checkpoint = {
+                'sync_mode': sync_mode,
+                'run_started_at': run_started_at.isoformat(),
+                'last_sync_time': last_sync_time.isoformat() if last_sync_time else None,
+                'key_ranges': None,
+                'segments': {}
+            }
+        
+        if key_ranges is not None:
+            checkpoint['key_ranges'] = cls._encode_checkpoint_value(key_ranges)
+        
+        if segment_id is not None:
+            checkpoint['segments'][segment_id] = {
+                'position': cls._encode_checkpoint_value(position),
+                'chunk_seq': chunk_seq,
+                'records_synced': records_synced,
+                'done': done
+            }
+        
+        checkpoint['updated_at'] = datetime.now().isoformat()
+        return checkpoint
+    
+    def _parse_checkpoint(self, tenant_id: str, table_name: str, checkpoint: Optional[Dict]) -> Optional[Dict]:
+        """将存储的断点结构还原为 get_checkpoint 的返回格式"""
+        if not checkpoint:
+            return None
+        
+        try:
+            return {
+                'sync_mode': checkpoint['sync_mode'],
+                'run_started_at': datetime.fromisoformat(checkpoint['run_started_at']),
+                'last_sync_time': (datetime.fromisoformat(checkpoint['last_sync_time'])
+                                   if checkpoint.get('last_sync_time') else None),
+                'key_ranges': self._decode_checkpoint_value(checkpoint.get('key_ranges')),
+                'segments': {
+                    segment_id: {
+                        'position': self._decode_checkpoint_value(segment.get('position')),
+                        'chunk_seq': segment.get('chunk_seq', 0),
+                        'records_synced': segment.get('records_synced', 0),
+                        'done': segment.get('done', False)
+                    }
+                    for segment_id, segment in checkpoint.get('segments', {}).items()
+                }
+            }
+        except Exception as e:
+            logger.warning(f"⚠️ 解析断点信息失败 {tenant_id}.{table_name}: {e}")
+            return None
+    
+    def flush(self, tenant_id: str = None):
+        """将缓冲的状态写入存储（无缓冲的后端为空操作）"""
     
-    def __init__(self, status_dir: str = "sync_status"):
+    def close(self):
+        """释放后端资源"""
+    
+class LocalFileStatusManager(StatusManagerBase):
+    """本地文件状态管理器 - 按数据库分组
+    
+    write_behind=True 时状态更新只修改内存中的副本，由后台线程每 flush_interval 秒、
+    或在租户同步结束时调用 flush() 批量落盘，热路径上没有同步磁盘IO。
+    全量同步的断点例外：它决定了重启后从哪里继续追加数据，保存和清除时都会立即落盘。
+    
+    process_lock=True 时每次读-改-写都持有租户状态文件的 flock 文件锁，
+    多个分片工作进程可共享同一个状态目录（与写缓冲互斥：缓冲的副本会覆盖其他进程的更新）。
+    """
+    
+    def __init__(self, status_dir: str = "sync_status", write_behind: bool = False,
+                 flush_interval: float = 5.0, process_lock: bool = False):
+        if process_lock and write_behind:
+            raise ValueError("状态文件跨进程锁与写缓冲不能同时开启")
+        if process_lock and fcntl is None:
+            raise RuntimeError("当前平台不支持 fcntl 文件锁，多进程共享状态请使用 status_storage=sqlite")
         self.status_dir = Path(status_dir)
         self.status_dir.mkdir(exist_ok=True)
         self._lock = threading.Lock()
-        logger.info(f"✅ 本地状态目录已准备就绪: {self.status_dir}")
+        self.process_lock = process_lock
+        self.write_behind = write_behind
+        self.flush_interval = flush_interval
+        self._databases: Dict[str, Dict] = {}  # 写缓冲模式下已加载的租户状态
+        self._dirty: Set[str] = set()
+        self._flush_lock = threading.Lock()  # 串行化落盘，保证后写入的快照不会被先写入的覆盖
+        self._stop_flush = threading.Event()
+        self._flush_thread = None
+        if write_behind:
+            self._flush_thread = threading.Thread(target=self._flush_loop, name="status-flush", daemon=True)
+            self._flush_thread.start()
+            logger.info(f"✅ 本地状态目录已准备就绪: {self.status_dir}（写缓冲，每 {flush_interval}s 落盘）")
+        elif process_lock:
+            logger.info(f"✅ 本地状态目录已准备就绪: {self.status_dir}（跨进程文件锁）")
+        else:
+            logger.info(f"✅ 本地状态目录已准备就绪: {self.status_dir}")
+    
+    @contextmanager
+    def _locked(self, name: str):
+        """读-改-写临界区：线程锁 + （process_lock 时）状态文件对应的 flock 锁"""
+        with self._lock:
+            if not self.process_lock:
+                yield
+                return
+            with open(self.status_dir / f".{name}.lock", 'a') as lock_file:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+                try:
+                    yield
+                finally:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
     
     def _get_status_file(self, tenant_id: str) -> Path:
         """获取数据库状态文件路径"""
         return self.status_dir / f"{tenant_id}.json"
     
-    def _load_database_status(self, tenant_id: str) -> Dict:
-        """加载数据库的所有表状态"""
-        status_file = self._get_status_file(tenant_id)
+    @staticmethod
+    def _read_json_file(path: Path) -> Dict:
+        """读取JSON状态文件；文件不存在返回 {}，损坏时抛出异常
         
-        if not status_file.exists():
+        损坏的状态文件不能当作空状态，否则所有表都会被误判为首次同步而触发全量同步。
+        """
+        if not path.exists():
             return {}
-            
         try:
-            with open(status_file, 'r', encoding='utf-8') as f:
+            with open(path, 'r', encoding='utf-8') as f:
                 return json.load(f)
-        except Exception as e:
-            logger.warning(f"⚠️ 读取状态文件失败 {status_file}: {e}")
-            return {}
+        except (OSError, ValueError) as e:
+            raise RuntimeError(f"状态文件损坏或不可读 {path}: {e}（请检查文件或从备份恢复后重试）") from e
+    
+    def _load_database_status(self, tenant_id: str) -> Dict:
+        """加载数据库的所有表状态（写缓冲模式下返回内存副本）"""
+        if self.write_behind and tenant_id in self._databases:
+            return self._databases[tenant_id]
+        
+        status_data = self._read_json_file(self._get_status_file(tenant_id))
+        if self.write_behind:
+            self._databases[tenant_id] = status_data
+        return status_data
     
     def _save_database_status(self, tenant_id: str, status_data: Dict):
-        """保存数据库的所有表状态"""
-        status_file = self._get_status_file(tenant_id)
+        """保存数据库的所有表状态（写缓冲模式下只标记为待落盘）"""
+        if self.write_behind:
+            self._databases[tenant_id] = status_data
+            self._dirty.add(tenant_id)
+            return
         
+        status_file = self._get_status_file(tenant_id)
         try:
-            with open(status_file, 'w', encoding='utf-8') as f:
-                json.dump(status_data, f, indent=2, ensure_ascii=False)
+            write_file_atomic(status_file, json.dumps(status_data, indent=2, ensure_ascii=False))
             logger.info(f"  💾 更新数据库状态文件: {status_file.name}")
         except Exception as e:
             logger.error(f"❌ 写入状态文件失败 {status_file}: {e}")
     
+    def flush(self, tenant_id: str = None):
+        """将缓冲的状态原子写入磁盘（tenant_id 为空时写入所有待落盘的租户）"""
+        if not self.write_behind:
+            return
+        
+        with self._flush_lock:
+            # 在落盘锁内取快照，保证文件上的状态只会前进
+            with self._lock:
+                tenants = [tenant_id] if tenant_id is not None else list(self._dirty)
+                snapshots = {
+                    tenant: json.dumps(self._databases[tenant], indent=2, ensure_ascii=False)
+                    for tenant in tenants if tenant in self._dirty
+                }
+                self._dirty.difference_update(snapshots)
+            
+            for tenant, content in snapshots.items():
+                status_file = self._get_status_file(tenant)
+                try:
+                    write_file_atomic(status_file, content)
+                    logger.debug(f"  💾 落盘数据库状态文件: {status_file.name}")
+                except Exception as e:
+                    logger.error(f"❌ 写入状态文件失败 {status_file}: {e}")
+                    with self._lock:
+                        self._dirty.add(tenant)
+    
+    def _flush_loop(self):
+        """后台定时落盘"""
+        while not self._stop_flush.wait(self.flush_interval):
+            self.flush()
+    
+    def close(self):
+        """停止后台落盘线程并写入所有缓冲的状态"""
+        if self._flush_thread is not None:
+            self._stop_flush.set()
+            self._flush_thread.join()
+            self._flush_thread = None
+        self.flush()
+    
+    @staticmethod
+    def _is_full_checkpoint(checkpoint: Optional[Dict]) -> bool:
+        """全量同步的断点：丢失后重启会从旧位置重新追加数据，必须立即落盘"""
+        return bool(checkpoint) and checkpoint.get('sync_mode') == 'FULL'
+    
     def get_last_sync_time(self, tenant_id: str, table_name: str) -> Optional[datetime]:
         """获取上次同步时间"""
         with self._lock:
@@ -141,27 +571,36 @@ class LocalFileStatusManager:
                     
         return None
     
+    @staticmethod
+    def _init_database_status(db_status: Dict, tenant_id: str) -> Dict:
+        """初始化数据库状态结构"""
+        if 'database_info' not in db_status:
+            db_status['database_info'] = {
+                'tenant_id': tenant_id,
+                'last_updated': datetime.now().isoformat()
+            }
+        
+        if 'tables' not in db_status:
+            db_status['tables'] = {}
+        
+        return db_status
+    
     def update_sync_status(self, tenant_id: str, table_name: str,
                           sync_time: datetime, sync_mode: str, 
                           records_synced: int, status: str = 'SUCCESS', 
-                          error_message: str = None):
-        """更新同步状态"""
-        with self._lock:
+                          error_message: str = None, watermark: Dict = None):
+        """更新同步状态
+        
+        失败时保留上次成功的同步时间、水位和断点，下次运行从断点继续而不是跳过未同步的数据。
+        watermark 为增量水位（见 get_watermark），成功时与同步时间一起更新。
+        """
+        with self._locked(tenant_id):
             # 加载现有状态
-            db_status = self._load_database_status(tenant_id)
-            
-            # 初始化结构
-            if 'database_info' not in db_status:
-                db_status['database_info'] = {
-                    'tenant_id': tenant_id,
-                    'last_updated': datetime.now().isoformat()
-                }
-            
-            if 'tables' not in db_status:
-                db_status['tables'] = {}
+            db_status = self._init_database_status(self._load_database_status(tenant_id), tenant_id)
+            previous_status = db_status['tables'].get(table_name, {})
             
             # 更新表状态
-            db_status['tables'][table_name] = {
+            table_status = {
                 'table_name': table_name,
                 'last_sync_time': sync_time.isoformat(),
                 'sync_status': status,
@@ -171,12 +610,114 @@ class LocalFileStatusManager:
                 'updated_at': datetime.now().isoformat()
             }
             
+            if status != 'SUCCESS':
+                table_status['last_sync_time'] = previous_status.get('last_sync_time')
+                if previous_status.get('watermark'):
+                    table_status['watermark'] = previous_status['watermark']
+                if previous_status.get('checkpoint'):
+                    table_status['checkpoint'] = previous_status['checkpoint']
+            elif watermark:
+                table_status['watermark'] = self._encode_watermark(watermark)
+            
+            db_status['tables'][table_name] = table_status
+            
             # 更新数据库级别信息
             db_status['database_info']['last_updated'] = datetime.now().isoformat()
             db_status['database_info']['total_tables'] = len(db_status['tables'])
             
             # 保存状态
             self._save_database_status(tenant_id, db_status)
+            durable = status == 'SUCCESS' and self._is_full_checkpoint(previous_status.get('checkpoint'))
+        
+        if durable:
+            self.flush(tenant_id)
+    
+    def get_watermark(self, tenant_id: str, table_name: str) -> Optional[Dict]:
+        """获取增量水位 {'ts', 'pk', 'inclusive'}：下次增量从 (ts, pk) 之后（inclusive 时从 ts 起）读取"""
+        with self._lock:
+            db_status = self._load_database_status(tenant_id)
+            watermark = db_status.get('tables', {}).get(table_name, {}).get('watermark')
+        
+        try:
+            return self._decode_watermark(watermark)
+        except Exception as e:
+            logger.warning(f"⚠️ 解析增量水位失败 {tenant_id}.{table_name}: {e}")
+            return None
+    
+    def get_checkpoint(self, tenant_id: str, table_name: str) -> Optional[Dict]:
+        """获取表的断点信息（未完成的同步）
+        
+        返回 {'sync_mode', 'run_started_at', 'last_sync_time', 'key_ranges', 'segments'}，
+        segments 为 {分段ID: {'position', 'chunk_seq', 'records_synced', 'done'}}。
+        """
+        with self._lock:
+            db_status = self._load_database_status(tenant_id)
+            checkpoint = db_status.get('tables', {}).get(table_name, {}).get('checkpoint')
+        
+        return self._parse_checkpoint(tenant_id, table_name, checkpoint)
+    
+    def save_checkpoint(self, tenant_id: str, table_name: str, sync_mode: str,
+                        run_started_at: datetime, last_sync_time: datetime = None,
+                        segment_id: str = None, position: tuple = None,
+                        chunk_seq: int = 0, records_synced: int = 0,
+                        done: bool = False, key_ranges: List[Tuple] = None):
+        """保存断点：记录已提交到BigQuery的最后位置（主键或时间戳）和块序号
+        
+        segment_id 为空时只初始化断点（例如记录主键范围切分结果）。
+        """
+        with self._locked(tenant_id):
+            db_status = self._init_database_status(self._load_database_status(tenant_id), tenant_id)
+            table_status = db_status['tables'].setdefault(table_name, {'table_name': table_name})
+            
+            table_status['checkpoint'] = self._merge_checkpoint(
+                table_status.get('checkpoint'), sync_mode, run_started_at, last_sync_time,
+                segment_id, position, chunk_seq, records_synced, done, key_ranges
+            )
+            db_status['database_info']['last_updated'] = datetime.now().isoformat()
+            db_status['database_info']['total_tables'] = len(db_status['tables'])
+            
+            self._save_database_status(tenant_id, db_status)
+        
+        if self._is_full_checkpoint(table_status['checkpoint']):
+            self.flush(tenant_id)
+    
+    def _get_cdc_position_file(self) -> Path:
+        """CDC位置文件路径（以下划线开头，不会被当作数据库状态文件）"""
+        return self.status_dir / "_cdc_positions.json"
+    
+    def get_cdc_position(self, stream_id: str) -> Optional[Dict]:
+        """获取CDC流已提交的位置，例如 {'log_file': 'mysql-bin.000012', 'log_pos': 4567}"""
+        with self._lock:
+            return self._read_json_file(self._get_cdc_position_file()).get(stream_id, {}).get('position')
+    
+    def save_cdc_position(self, stream_id: str, position: Dict):
+        """保存CDC流已提交的位置（不经过写缓冲，立即原子落盘）"""
+        with self._locked("_cdc_positions"):
+            position_file = self._get_cdc_position_file()
+            positions = self._read_json_file(position_file)
+            
+            positions[stream_id] = {
+                'position': position,
+                'updated_at': datetime.now().isoformat()
+            }
+            try:
+                write_file_atomic(position_file, json.dumps(positions, indent=2, ensure_ascii=False))
+                logger.info(f"  💾 更新CDC位置: {stream_id} -> {position}")
+            except Exception as e:
+                logger.error(f"❌ 写入CDC位置失败 {position_file}: {e}")
+                raise
+    
+    def clear_checkpoint(self, tenant_id: str, table_name: str):
+        """清除表的断点信息"""
+        with self._locked(tenant_id):
+            db_status = self._load_database_status(tenant_id)
+            table_status = db_status.get('tables', {}).get(table_name)
+            checkpoint = table_status.pop('checkpoint', None) if table_status else None
+            if checkpoint is not None:
+                self._save_database_status(tenant_id, db_status)
+        
+        if self._is_full_checkpoint(checkpoint):
+            self.flush(tenant_id)
     
     def get_database_summary(self, tenant_id: str) -> Dict:
         """获取数据库同步摘要"""
@@ -184,8 +725,10 @@ class LocalFileStatusManager:
             db_status = self._load_database_status(tenant_id)
             
             if not db_status:
-                return {'tenant_id': tenant_id, 'total_tables': 0, 'tables': {}}
+                return {'tenant_id': tenant_id, 'total_tables': 0, 'tables': {}, 'last_updated': None}
             
+            # 写缓冲模式下返回的是内存副本，复制一份避免调用方修改
+            db_status = json.loads(json.dumps(db_status))
             return {
                 'tenant_id': tenant_id,
                 'database_info': db_status.get('database_info', {}),
@@ -194,108 +737,995 @@ class LocalFileStatusManager:
                 'last_updated': db_status.get('database_info', {}).get('last_updated')
             }
 
+class SQLiteStatusManager(StatusManagerBase):
+    """SQLite 状态管理器 - WAL 模式，每个 (租户, 表) 一行
+
+    状态更新是单行 upsert，不再整文件重写；每个线程使用自己的连接，WAL 下读写互不阻塞，
+    多个进程可共享同一个数据库文件（写入由 SQLite 文件锁串行，busy_timeout 内等待）。
+    """
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS table_status (
+            tenant_id TEXT NOT NULL,
+            table_name TEXT NOT NULL,
+            last_sync_time TEXT,
+            sync_status TEXT,
+            sync_mode TEXT,
+            records_synced INTEGER NOT NULL DEFAULT 0,
+            error_message TEXT,
+            checkpoint TEXT,
+            watermark TEXT,
+            updated_at TEXT NOT NULL,
+            PRIMARY KEY (tenant_id, table_name)
+        );
+        CREATE TABLE IF NOT EXISTS cdc_positions (
+            stream_id TEXT PRIMARY KEY,
+            position TEXT NOT NULL,
+            updated_at TEXT NOT NULL
+        );
+    """
+
+    def __init__(self, db_path: str = "sync_status/sync_status.db", busy_timeout: float = 30.0):
+        self.db_path = Path(db_path)
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self.busy_timeout = busy_timeout
+        self._local = threading.local()
+        self._connections = []
+        self._connections_lock = threading.Lock()
+
+        conn = self._connection()
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.executescript(self.SCHEMA)
+        # 早期版本创建的状态库没有水位列
+        columns = {row['name'] for row in conn.execute("PRAGMA table_info(table_status)")}
+        if 'watermark' not in columns:
+            conn.execute("ALTER TABLE table_status ADD COLUMN watermark TEXT")
+        logger.info(f"✅ SQLite状态库已准备就绪: {self.db_path} (WAL)")
+
+    def _connection(self) -> sqlite3.Connection:
+        """当前线程的连接（自动提交，显式 BEGIN IMMEDIATE 开启写事务）"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(str(self.db_path), timeout=self.busy_timeout,
+                                   isolation_level=None, check_same_thread=False)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+            with self._connections_lock:
+                self._connections.append(conn)
+        return conn
+
+    @contextmanager
+    def _transaction(self):
+        """写事务：读-改-写期间持有写锁，避免其他线程/进程的更新被覆盖"""
+        conn = self._connection()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield conn
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+
+    @staticmethod
+    def _row_to_table_status(row: sqlite3.Row) -> Dict:
+        """行转换为与JSON状态文件相同结构的表状态"""
+        table_status = {
+            'table_name': row['table_name'],
+            'last_sync_time': row['last_sync_time'],
+            'sync_status': row['sync_status'],
+            'sync_mode': row['sync_mode'],
+            'records_synced': row['records_synced'],
+            'error_message': row['error_message'],
+            'updated_at': row['updated_at']
+        }
+        if row['watermark']:
+            table_status['watermark'] = json.loads(row['watermark'])
+        if row['checkpoint']:
+            table_status['checkpoint'] = json.loads(row['checkpoint'])
+        return table_status
+
+    def get_last_sync_time(self, tenant_id: str, table_name: str) -> Optional[datetime]:
+        """获取上次同步时间"""
+        row = self._connection().execute(
+            "SELECT last_sync_time FROM table_status WHERE tenant_id = ? AND table_name = ?",
+            (tenant_id, table_name)
+        ).fetchone()
+        if row and row['last_sync_time']:
+            try:
+                return datetime.fromisoformat(row['last_sync_time'])
+            except Exception as e:
+                logger.warning(f"⚠️ 解析同步时间失败 {tenant_id}.{table_name}: {e}")
+        return None
+
+    def update_sync_status(self, tenant_id: str, table_name: str,
+                          sync_time: datetime, sync_mode: str,
+                          records_synced: int, status: str = 'SUCCESS',
+                          error_message: str = None, watermark: Dict = None):
+        """更新同步状态（失败时保留上次成功的同步时间、水位和断点，成功时清除断点）"""
+        succeeded = status == 'SUCCESS'
+        encoded_watermark = self._encode_watermark(watermark) if succeeded else None
+        with self._transaction() as conn:
+            conn.execute("""
+                INSERT INTO table_status (tenant_id, table_name, last_sync_time, sync_status, sync_mode,
+                                          records_synced, error_message, checkpoint, watermark, updated_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?, NULL, ?, ?)
+                ON CONFLICT (tenant_id, table_name) DO UPDATE SET
+                    last_sync_time = CASE WHEN ? THEN excluded.last_sync_time ELSE table_status.last_sync_time END,
+                    sync_status = excluded.sync_status,
+                    sync_mode = excluded.sync_mode,
+                    records_synced = excluded.records_synced,
+                    error_message = excluded.error_message,
+                    checkpoint = CASE WHEN ? THEN NULL ELSE table_status.checkpoint END,
+                    watermark = CASE WHEN ? THEN excluded.watermark ELSE table_status.watermark END,
+                    updated_at = excluded.updated_at
+            """, (tenant_id, table_name, sync_time.isoformat() if succeeded else None, status, sync_mode,
+                  records_synced, error_message,
+                  json.dumps(encoded_watermark, ensure_ascii=False) if encoded_watermark else None,
+                  datetime.now().isoformat(), succeeded, succeeded, succeeded))
+
+    def get_watermark(self, tenant_id: str, table_name: str) -> Optional[Dict]:
+        """获取增量水位，格式同 LocalFileStatusManager"""
+        row = self._connection().execute(
+            "SELECT watermark FROM table_status WHERE tenant_id = ? AND table_name = ?",
+            (tenant_id, table_name)
+        ).fetchone()
+        if not row or not row['watermark']:
+            return None
+        try:
+            return self._decode_watermark(json.loads(row['watermark']))
+        except Exception as e:
+            logger.warning(f"⚠️ 解析增量水位失败 {tenant_id}.{table_name}: {e}")
+            return None
+
+    def get_checkpoint(self, tenant_id: str, table_name: str) -> Optional[Dict]:
+        """获取表的断点信息（未完成的同步），格式同 LocalFileStatusManager"""
+        row = self._connection().execute(
+            "SELECT checkpoint FROM table_status WHERE tenant_id = ? AND table_name = ?",
+            (tenant_id, table_name)
+        ).fetchone()
+        checkpoint = json.loads(row['checkpoint']) if row and row['checkpoint'] else None
+        return self._parse_checkpoint(tenant_id, table_name, checkpoint)
+
+    def save_checkpoint(self, tenant_id: str, table_name: str, sync_mode: str,
+                        run_started_at: datetime, last_sync_time: datetime = None,
+                        segment_id: str = None, position: tuple = None,
+                        chunk_seq: int = 0, records_synced: int = 0,
+                        done: bool = False, key_ranges: List[Tuple] = None):
+        """保存断点：只读写该表的一行"""
+        with self._transaction() as conn:
+            row = conn.execute(
+                "SELECT checkpoint FROM table_status WHERE tenant_id = ? AND table_name = ?",
+                (tenant_id, table_name)
+            ).fetchone()
+            checkpoint = self._merge_checkpoint(
+                json.loads(row['checkpoint']) if row and row['checkpoint'] else None,
+                sync_mode, run_started_at, last_sync_time,
+                segment_id, position, chunk_seq, records_synced, done, key_ranges
+            )
+            conn.execute("""
+                INSERT INTO table_status (tenant_id, table_name, checkpoint, updated_at)
+                VALUES (?, ?, ?, ?)
+                ON CONFLICT (tenant_id, table_name) DO UPDATE SET checkpoint = excluded.checkpoint
+            """, (tenant_id, table_name, json.dumps(checkpoint, ensure_ascii=False), datetime.now().isoformat()))
+
+    def clear_checkpoint(self, tenant_id: str, table_name: str):
+        """清除表的断点信息"""
+        with self._transaction() as conn:
+            conn.execute(
+                "UPDATE table_status SET checkpoint = NULL WHERE tenant_id = ? AND table_name = ?",
+                (tenant_id, table_name)
+            )
+
+    def get_cdc_position(self, stream_id: str) -> Optional[Dict]:
+        """获取CDC流已提交的位置"""
+        row = self._connection().execute(
+            "SELECT position FROM cdc_positions WHERE stream_id = ?", (stream_id,)
+        ).fetchone()
+        return json.loads(row['position']) if row else None
+
+    def save_cdc_position(self, stream_id: str, position: Dict):
+        """保存CDC流已提交的位置"""
+        with self._transaction() as conn:
+            conn.execute("""
+                INSERT INTO cdc_positions (stream_id, position, updated_at) VALUES (?, ?, ?)
+                ON CONFLICT (stream_id) DO UPDATE SET position = excluded.position, updated_at = excluded.updated_at
+            """, (stream_id, json.dumps(position, ensure_ascii=False), datetime.now().isoformat()))
+        logger.info(f"  💾 更新CDC位置: {stream_id} -> {position}")
+
+    def get_database_summary(self, tenant_id: str) -> Dict:
+        """获取数据库同步摘要（结构同 LocalFileStatusManager）"""
+        rows = self._connection().execute(
+            "SELECT * FROM table_status WHERE tenant_id = ? ORDER BY table_name", (tenant_id,)
+        ).fetchall()
+        if not rows:
+            return {'tenant_id': tenant_id, 'total_tables': 0, 'tables': {}, 'last_updated': None}
+
+        tables = {row['table_name']: self._row_to_table_status(row) for row in rows}
+        last_updated = max(row['updated_at'] for row in rows)
+        return {
+            'tenant_id': tenant_id,
+            'database_info': {'tenant_id': tenant_id, 'last_updated': last_updated, 'total_tables': len(tables)},
+            'total_tables': len(tables),
+            'tables': tables,
+            'last_updated': last_updated
+        }
+
+    def import_tables(self, tenant_id: str, tables: Dict[str, Dict]):
+        """导入JSON格式的表状态 {表名: 表状态}（一次性迁移用，已存在的行被覆盖）"""
+        with self._transaction() as conn:
+            for table_name, table_status in tables.items():
+                checkpoint = table_status.get('checkpoint')
+                watermark = table_status.get('watermark')
+                conn.execute("""
+                    INSERT OR REPLACE INTO table_status (tenant_id, table_name, last_sync_time, sync_status, sync_mode,
+                                                         records_synced, error_message, checkpoint, watermark,
+                                                         updated_at)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                """, (tenant_id, table_name, table_status.get('last_sync_time'), table_status.get('sync_status'),
+                      table_status.get('sync_mode'), table_status.get('records_synced') or 0,
+                      table_status.get('error_message'),
+                      json.dumps(checkpoint, ensure_ascii=False) if checkpoint else None,
+                      json.dumps(watermark, ensure_ascii=False) if watermark else None,
+                      table_status.get('updated_at') or datetime.now().isoformat()))
+
+    def close(self):
+        """关闭所有线程的连接"""
+        with self._connections_lock:
+            connections, self._connections = self._connections, []
+        for conn in connections:
+            conn.close()
+        self._local = threading.local()
+
+def create_status_manager(params: Dict) -> StatusManagerBase:
+    """按 status_storage 创建状态管理器：local_file（JSON文件，默认）或 sqlite"""
+    storage = params.get('status_storage', 'local_file')
+    status_dir = params.get('status_dir', 'sync_status')
+    if storage == 'sqlite':
+        return SQLiteStatusManager(params.get('status_db', str(Path(status_dir) / "sync_status.db")))
+    if storage != 'local_file':
+        raise ValueError(f"不支持的状态存储: {storage}")
+    write_behind = params.get('status_write_behind', False)
+    sharded = bool(params.get('shard_run_id'))
+    if sharded and write_behind:
+        logger.warning("⚠️ 多进程分片模式下关闭状态写缓冲，每次更新持锁直接落盘")
+        write_behind = False
+    return LocalFileStatusManager(status_dir,
+                                  write_behind=write_behind,
+                                  flush_interval=params.get('status_flush_interval_seconds', 5.0),
+                                  process_lock=sharded)
+
 class TableAnalyzer:
-    """表结构分析器 - 优化版"""
+    """表结构分析器 - 优化版
     
-    def __init__(self, connection_pool, cache: TableInfoCache):
+    column_rules: {表名: {'include': [字段...]} 或 {'exclude': [字段...]}}，所有租户的同名表共用，
+    只同步选中的字段（主键和时间戳字段始终保留）。
+    """
+    
+    def __init__(self, connection_pool, cache: TableInfoCache, column_rules: Dict[str, Dict] = None):
         self.connection_pool = connection_pool
         self.cache = cache
+        self.column_rules = column_rules or {}
     
-    def get_table_info(self, db_name: str, table_name: str) -> Dict:
-        """获取表的完整信息（使用缓存）"""
-        # 检查缓存
-        cached_info = self.cache.get_table_info(db_name, table_name)
-        if cached_info:
-            logger.info(f"  💾 使用缓存表信息: {db_name}.{table_name}")
-            return cached_info
+    @staticmethod
+    def validate_column_rules(column_rules: Dict) -> Dict[str, Dict]:
+        """校验 table_columns 配置格式，返回规范化后的规则"""
+        if not isinstance(column_rules, dict):
+            raise ValueError("table_columns 必须是 {表名: {'include'/'exclude': [字段...]}}")
+        normalized = {}
+        for table_name, rule in column_rules.items():
+            if not isinstance(rule, dict) or not rule or set(rule) - {'include', 'exclude'}:
+                raise ValueError(f"table_columns.{table_name} 只能包含 include / exclude")
+            for key, fields in rule.items():
+                if not isinstance(fields, list) or not all(isinstance(field, str) for field in fields):
+                    raise ValueError(f"table_columns.{table_name}.{key} 必须是字段名列表")
+            normalized[table_name] = {key: list(fields) for key, fields in rule.items()}
+        return normalized
+    
+    @staticmethod
+    def project_columns(column_names: List[str], primary_keys: List[str], timestamp_field: Optional[str],
+                        column_rule: Optional[Dict]) -> List[str]:
+        """按字段规则选择要同步的字段（保持表中顺序，字段名不区分大小写）
         
-        # 缓存未命中，查询数据库
-        logger.info(f"  🔍 分析表结构: {db_name}.{table_name}")
+        主键（MERGE/分页）和时间戳字段（增量条件/水位）始终保留：include 未列出时自动加入，
+        exclude 显式排除时抛出 ValueError；规则中不存在的字段记录警告后忽略。
+        """
+        if not column_rule:
+            return list(column_names)
+        
+        include = {field.lower() for field in column_rule['include']} if 'include' in column_rule else None
+        exclude = {field.lower() for field in column_rule.get('exclude', [])}
+        existing = {name.lower() for name in column_names}
+        unknown = ((include or set()) | exclude) - existing
+        if unknown:
+            logger.warning(f"⚠️ 字段配置中的字段不存在，已忽略: {sorted(unknown)}")
+        
+        required = {field.lower() for field in primary_keys}
+        if timestamp_field:
+            required.add(timestamp_field.lower())
+        if required & exclude:
+            raise ValueError(f"字段配置不能排除主键或时间戳字段: {sorted(required & exclude)}")
+        forced = required & (existing - include) if include is not None else set()
+        if forced:
+            logger.info(f"  ℹ️ 主键和时间戳字段始终同步，已加入 include: {sorted(forced)}")
         
-        conn = self.connection_pool.get_connection()
+        return [name for name in column_names
+                if name.lower() in required or
+                ((include is None or name.lower() in include) and name.lower() not in exclude)]
+    
+    @staticmethod
+    def validate_row_filters(table_filters: Dict, tenant_table_filters: Dict):
+        """校验 table_filters {表名: 条件} 和 tenant_table_filters {租户: {表名: 条件}} 的配置格式"""
+        if not isinstance(table_filters, dict) or not all(
+                isinstance(predicate, str) and predicate.strip() for predicate in table_filters.values()):
+            raise ValueError("table_filters 必须是 {表名: SQL条件}")
+        if not isinstance(tenant_table_filters, dict) or not all(
+                isinstance(filters, dict) and all(isinstance(predicate, str) and predicate.strip()
+                                                  for predicate in filters.values())
+                for filters in tenant_table_filters.values()):
+            raise ValueError("tenant_table_filters 必须是 {租户: {表名: SQL条件}}")
+    
+    @staticmethod
+    def validate_filter_predicate(predicate: str, field_types: Dict[str, str]) -> Tuple[str, tuple]:
+        """按表字段校验行过滤条件，返回加括号的 (条件SQL, 参数)
+        
+        条件只能是单个表达式：不允许多语句、注释和子查询；函数只能调用 ROW_FILTER_FUNCTIONS 中的函数，
+        除SQL关键字外出现的标识符都必须是（同步的）表字段。
+        字符串字面量改为 %s 查询参数传入：驱动替换占位符时不区分字面量，
+        字面量中的 %s（如 LIKE '%sale%'）会被当作占位符而打乱参数。
+        """
+        literal_pattern = r"'(?:[^'\\]|\\.|'')*'|\"(?:[^\"\\]|\\.|\"\")*\""
+        
+        # 字符串字面量不参与语句和标识符检查
+        expression = re.sub(literal_pattern, "''", predicate)
+        if any(token in expression for token in (';', '--', '/*', '#')) or "'" in expression.replace("''", "") \
+                or '"' in expression:
+            raise ValueError(f"行过滤条件不能包含多条语句、注释或未闭合的字符串: {predicate}")
+        if '%s' in expression:
+            # 与查询参数占位符冲突（取模请写成 % 后加空格或 MOD）
+            raise ValueError(f"行过滤条件不能包含 %s: {predicate}")
+        if re.search(r"\bselect\b", expression, re.IGNORECASE):
+            raise ValueError(f"行过滤条件不能包含子查询: {predicate}")
+        
+        columns = {field.lower() for field in field_types}
+        for match in re.finditer(r"`([^`]+)`(\s*\()?|\b([A-Za-z_][A-Za-z0-9_]*)\b(\s*\()?", expression):
+            quoted, quoted_call, name, call = match.groups()
+            if quoted is not None:
+                if quoted_call:
+                    raise ValueError(f"行过滤条件不能调用函数: {quoted}")
+                if quoted.lower() not in columns:
+                    raise ValueError(f"行过滤条件引用了不存在（或未同步）的字段: {quoted}")
+            elif call:
+                if name.upper() not in ROW_FILTER_FUNCTIONS and name.upper() not in ROW_FILTER_KEYWORDS:
+                    raise ValueError(f"行过滤条件不能调用函数: {name}")
+            elif name.upper() not in ROW_FILTER_KEYWORDS and name.lower() not in columns:
+                raise ValueError(f"行过滤条件引用了不存在（或未同步）的字段: {name}")
+        
+        params = tuple(TableAnalyzer._decode_string_literal(literal.group())
+                       for literal in re.finditer(literal_pattern, predicate))
+        return f"({re.sub(literal_pattern, '%s', predicate)})", params
+    
+    @staticmethod
+    def _decode_string_literal(literal: str) -> str:
+        """SQL字符串字面量（含引号）对应的字符串值：处理重复引号和反斜杠转义"""
+        quote = literal[0]
+        return re.sub(r"\\(.)|" + quote * 2,
+                      lambda match: SQL_STRING_ESCAPES.get(match.group(1), match.group(1)) if match.group(1) else quote,
+                      literal[1:-1], flags=re.DOTALL)
+    
+    def _rule_fingerprint(self, table_name: str) -> str:
+        """字段规则参与缓存指纹：修改 table_columns 后缓存的表信息失效"""
+        rule = self.column_rules.get(table_name)
+        return json.dumps(rule, sort_keys=True) if rule else ""
+
+    def load_schema_fingerprints(self, db_names: List[str], table_names: List[str]) -> Dict[str, str]:
+        """一次查询获取所有 (库, 表) 的结构指纹：按字段顺序拼接 列名:类型:键 后取MD5"""
+        conn = get_pooled_connection(self.connection_pool)
         try:
             cursor = conn.cursor()
-            cursor.execute(f"USE {db_name}")
-            
-            # 一次性获取所有表信息
-            table_info = {
-                'schema': [],
-                'field_types': {},
-                'timestamp_field': None,
-                'primary_keys': []
-            }
-            
-            # 1. 获取字段信息
-            cursor.execute(f"DESCRIBE {table_name}")
-            describe_results = cursor.fetchall()
-            
-            for field, ftype, *_ in describe_results:
-                base_type = ftype.split("(")[0].lower()
-                bq_type = MYSQL_TO_BQ_TYPE.get(base_type, "STRING")
-                table_info['schema'].append(bigquery.SchemaField(field, bq_type, mode="NULLABLE"))
-                table_info['field_types'][field] = ftype.lower()
-            
-            # 添加系统字段
-            table_info['schema'].extend([
-                bigquery.SchemaField("tenant_id", "STRING", mode="NULLABLE"),
-                bigquery.SchemaField("sync_timestamp", "TIMESTAMP", mode="NULLABLE"),
-                bigquery.SchemaField("sync_mode", "STRING", mode="NULLABLE")
-            ])
-            
-            # 2. 检测时间戳字段
-            available_timestamp_fields = []
-            for field, ftype in table_info['field_types'].items():
-                field_lower = field.lower()
-                if any(ts_field in field_lower for ts_field in ['time', 'date', 'created', 'updated', 'modified']):
-                    if (any(ftype.startswith(dt) for dt in ['datetime', 'timestamp']) or
-                        ('int' in ftype and any(kw in field_lower for kw in ['time', 'created', 'updated']))):
-                        available_timestamp_fields.append((field, ftype))
-            
-            # 按优先级选择时间戳字段
-            for preferred_field in TIMESTAMP_FIELDS:
-                for available_field, field_type in available_timestamp_fields:
-                    if preferred_field.lower() == available_field.lower():
-                        table_info['timestamp_field'] = available_field
-                        break
-                if table_info['timestamp_field']:
-                    break
-            
-            if not table_info['timestamp_field'] and available_timestamp_fields:
-                table_info['timestamp_field'] = available_timestamp_fields[0][0]
-            
-            # 3. 获取主键信息
+            # GROUP_CONCAT 默认只保留1024字节，宽表会被截断导致结构变化检测不到
+            cursor.execute("SET SESSION group_concat_max_len = 1048576")
             cursor.execute(f"""
-                SELECT COLUMN_NAME 
-                FROM INFORMATION_SCHEMA.KEY_COLUMN_USAGE 
-                WHERE TABLE_SCHEMA = '{db_name}' 
-                AND TABLE_NAME = '{table_name}' 
-                AND CONSTRAINT_NAME = 'PRIMARY'
-                ORDER BY ORDINAL_POSITION
-            """)
-            table_info['primary_keys'] = [row[0] for row in cursor.fetchall()]
-            
+                SELECT TABLE_SCHEMA, TABLE_NAME,
+                       MD5(GROUP_CONCAT(CONCAT_WS(':', COLUMN_NAME, COLUMN_TYPE, COLUMN_KEY)
+                                        ORDER BY ORDINAL_POSITION SEPARATOR ','))
+                FROM INFORMATION_SCHEMA.COLUMNS
+                WHERE TABLE_SCHEMA IN ({', '.join(['%s'] * len(db_names))})
+                AND TABLE_NAME IN ({', '.join(['%s'] * len(table_names))})
+                GROUP BY TABLE_SCHEMA, TABLE_NAME
+            """, tuple(db_names) + tuple(table_names))
+            fingerprints = {f"{schema}.{table}": fingerprint + self._rule_fingerprint(table)
+                            for schema, table, fingerprint in cursor.fetchall()}
             cursor.close()
-            
-            # 缓存结果
-            self.cache.set_table_info(db_name, table_name, table_info)
-            
-            logger.info(f"  📊 表分析完成:")
-            logger.info(f"    🕐 时间戳字段: {table_info['timestamp_field'] or '无'}")
-            logger.info(f"    🔑 主键字段: {table_info['primary_keys'] or '无'}")
-            logger.info(f"    📋 字段数量: {len(table_info['field_types'])}")
-            
-            return table_info
-            
+            return fingerprints
         finally:
             conn.close()
 
-class BatchDataProcessor:
-    """批量数据处理器"""
-    
-    @staticmethod
-    def batch_normalize_data_types(rows: List[Dict], field_types: Dict[str, str]) -> List[Dict]:
-        """批量标准化数据类型"""
-        if not rows:
+    def warm_cache(self, db_names: List[str], table_names: List[str]):
+        """启动时准备表结构缓存：结构未变的表复用磁盘缓存，其余表一次批量分析"""
+        try:
+            fingerprints = self.load_schema_fingerprints(db_names, table_names)
+        except Exception as e:
+            logger.warning(f"⚠️ 获取表结构指纹失败，逐表分析: {e}")
+            return
+        reused = self.cache.validate(fingerprints)
+        logger.info(f"💾 表结构缓存: {reused}/{len(fingerprints)} 张表结构未变，跳过分析")
+        
+        # 其余表（首次运行或结构已变化）批量分析，不再逐表 DESCRIBE
+        missing = [key.split('.', 1) for key in fingerprints
+                   if self.cache.get_table_info(*key.split('.', 1)) is None]
+        if not missing:
+            return
+        try:
+            self.analyze_tables_bulk(sorted({db for db, _ in missing}), sorted({table for _, table in missing}))
+        except Exception as e:
+            logger.warning(f"⚠️ 批量分析表结构失败，逐表分析: {e}")
+
+    @staticmethod
+    def build_table_info(columns: List[Tuple[str, str]], primary_keys: List[str],
+                         column_rule: Dict = None) -> Dict:
+        """由字段列表 [(字段名, MySQL类型)] 和主键构建表信息：BigQuery schema、字段类型、时间戳字段
+        
+        column_rule 为该表的字段规则；有字段被排除时 columns 为选中的字段列表（读取时 SELECT 这些字段），
+        否则为 None（SELECT *）。
+        """
+        table_info = {
+            'schema': [],
+            'field_types': {},
+            'timestamp_field': None,
+            'primary_keys': list(primary_keys),
+            'columns': None
+        }
+        
+        # 检测时间戳字段（在所有字段中检测，排除规则不影响增量条件）
+        all_field_types = {field: ftype.lower() for field, ftype in columns}
+        available_timestamp_fields = []
+        for field, ftype in all_field_types.items():
+            field_lower = field.lower()
+            if any(ts_field in field_lower for ts_field in ['time', 'date', 'created', 'updated', 'modified']):
+                if (any(ftype.startswith(dt) for dt in ['datetime', 'timestamp']) or
+                    ('int' in ftype and any(kw in field_lower for kw in ['time', 'created', 'updated']))):
+                    available_timestamp_fields.append((field, ftype))
+        
+        # 按优先级选择时间戳字段
+        for preferred_field in TIMESTAMP_FIELDS:
+            for available_field, field_type in available_timestamp_fields:
+                if preferred_field.lower() == available_field.lower():
+                    table_info['timestamp_field'] = available_field
+                    break
+            if table_info['timestamp_field']:
+                break
+        
+        if not table_info['timestamp_field'] and available_timestamp_fields:
+            table_info['timestamp_field'] = available_timestamp_fields[0][0]
+        
+        selected = TableAnalyzer.project_columns(
+            list(all_field_types), primary_keys, table_info['timestamp_field'], column_rule
+        )
+        if len(selected) < len(all_field_types):
+            table_info['columns'] = selected
+        
+        for field in selected:
+            ftype = all_field_types[field]
+            bq_type = mysql_to_bq_type(ftype)
+            table_info['schema'].append(bigquery.SchemaField(field, bq_type, mode="NULLABLE"))
+            table_info['field_types'][field] = ftype
+        
+        # 添加系统字段
+        table_info['schema'].extend([
+            bigquery.SchemaField("tenant_id", "STRING", mode="NULLABLE"),
+            bigquery.SchemaField("sync_timestamp", "TIMESTAMP", mode="NULLABLE"),
+            bigquery.SchemaField("sync_mode", "STRING", mode="NULLABLE")
+        ])
+        
+        return table_info
+
+    def analyze_tables_bulk(self, db_names: List[str], table_names: List[str]) -> int:
+        """批量分析表结构：一次查询 COLUMNS、一次查询 KEY_COLUMN_USAGE 覆盖所有 (库, 表)，结果写入缓存
+        
+        不同租户的同名表结构相同（字段、类型、主键一致）时共享同一个表信息对象。返回分析的表数。
+        """
+        db_placeholders = ', '.join(['%s'] * len(db_names))
+        table_placeholders = ', '.join(['%s'] * len(table_names))
+        query_params = tuple(db_names) + tuple(table_names)
+        
+        conn = get_pooled_connection(self.connection_pool)
+        try:
+            cursor = conn.cursor()
+            cursor.execute(f"""
+                SELECT TABLE_SCHEMA, TABLE_NAME, COLUMN_NAME, COLUMN_TYPE
+                FROM INFORMATION_SCHEMA.COLUMNS
+                WHERE TABLE_SCHEMA IN ({db_placeholders})
+                AND TABLE_NAME IN ({table_placeholders})
+                ORDER BY TABLE_SCHEMA, TABLE_NAME, ORDINAL_POSITION
+            """, query_params)
+            columns = {}
+            for schema, table, column, column_type in cursor.fetchall():
+                columns.setdefault((schema, table), []).append((column, column_type))
+            
+            cursor.execute(f"""
+                SELECT TABLE_SCHEMA, TABLE_NAME, COLUMN_NAME
+                FROM INFORMATION_SCHEMA.KEY_COLUMN_USAGE
+                WHERE TABLE_SCHEMA IN ({db_placeholders})
+                AND TABLE_NAME IN ({table_placeholders})
+                AND CONSTRAINT_NAME = 'PRIMARY'
+                ORDER BY TABLE_SCHEMA, TABLE_NAME, ORDINAL_POSITION
+            """, query_params)
+            primary_keys = {}
+            for schema, table, column in cursor.fetchall():
+                primary_keys.setdefault((schema, table), []).append(column)
+            cursor.close()
+        finally:
+            conn.close()
+        
+        # 按 (表名, 字段, 主键) 归并相同结构
+        shared = {}
+        entries = {}
+        for (schema, table), table_columns in columns.items():
+            table_primary_keys = primary_keys.get((schema, table), [])
+            signature = (table, tuple(table_columns), tuple(table_primary_keys))
+            if signature not in shared:
+                try:
+                    shared[signature] = self.build_table_info(table_columns, table_primary_keys,
+                                                              self.column_rules.get(table))
+                except ValueError as e:
+                    # 字段配置错误：不缓存，同步该表时由 get_table_info 报错
+                    logger.error(f"❌ {schema}.{table} 字段配置错误: {e}")
+                    shared[signature] = None
+            if shared[signature] is not None:
+                entries[f"{schema}.{table}"] = shared[signature]
+        
+        self.cache.set_many(entries)
+        logger.info(f"🔍 批量分析表结构: {len(entries)} 张表, {sum(info is not None for info in shared.values())} 种不同结构")
+        return len(entries)
+
+    def get_table_info(self, db_name: str, table_name: str) -> Dict:
+        """获取表的完整信息（使用缓存）"""
+        # 检查缓存
+        cached_info = self.cache.get_table_info(db_name, table_name)
+        if cached_info:
+            logger.info(f"  💾 使用缓存表信息: {db_name}.{table_name}")
+            return cached_info
+        
+        # 缓存未命中，查询数据库
+        logger.info(f"  🔍 分析表结构: {db_name}.{table_name}")
+        
+        conn = get_pooled_connection(self.connection_pool)
+        try:
+            cursor = conn.cursor()
+            cursor.execute(f"USE {db_name}")
+            
+            # 1. 获取字段信息
+            cursor.execute(f"DESCRIBE {table_name}")
+            columns = [(field, ftype) for field, ftype, *_ in cursor.fetchall()]
+            
+            # 2. 获取主键信息
+            cursor.execute(f"""
+                SELECT COLUMN_NAME 
+                FROM INFORMATION_SCHEMA.KEY_COLUMN_USAGE 
+                WHERE TABLE_SCHEMA = '{db_name}' 
+                AND TABLE_NAME = '{table_name}' 
+                AND CONSTRAINT_NAME = 'PRIMARY'
+                ORDER BY ORDINAL_POSITION
+            """)
+            primary_keys = [row[0] for row in cursor.fetchall()]
+            
+            cursor.close()
+            
+            table_info = self.build_table_info(columns, primary_keys, self.column_rules.get(table_name))
+            
+            # 缓存结果
+            self.cache.set_table_info(db_name, table_name, table_info)
+            
+            logger.info(f"  📊 表分析完成:")
+            logger.info(f"    🕐 时间戳字段: {table_info['timestamp_field'] or '无'}")
+            logger.info(f"    🔑 主键字段: {table_info['primary_keys'] or '无'}")
+            logger.info(f"    📋 字段数量: {len(table_info['field_types'])}"
+                        f"{f' (共 {len(columns)} 个，按配置投影)' if table_info['columns'] else ''}")
+            
+            return table_info
+            
+        finally:
+            conn.close()
+
+class PKRangeSplitter:
+    """主键范围切分器 - 将大表按第一个主键列切分为互不相交的范围"""
+    
+    def __init__(self, connection_pool):
+        self.connection_pool = connection_pool
+    
+    def split(self, db_name: str, table_name: str, table_info: Dict,
+              parallelism: int, min_rows: int = 0) -> List[Tuple[Optional[object], Optional[object]]]:
+        """切分主键范围，返回 [(下界, 上界), ...]，下界包含、上界不包含，None 表示无界
+        
+        整数主键按 MIN/MAX 等分；其他类型按估算行数在主键索引上采样分界点。
+        表太小或无法切分时返回空列表。
+        """
+        if parallelism <= 1 or not table_info['primary_keys']:
+            return []
+        
+        split_key = table_info['primary_keys'][0]
+        split_key_type = table_info['field_types'].get(split_key, '')
+        
+        conn = get_pooled_connection(self.connection_pool)
+        try:
+            cursor = conn.cursor()
+            cursor.execute(
+                "SELECT TABLE_ROWS FROM INFORMATION_SCHEMA.TABLES WHERE TABLE_SCHEMA = %s AND TABLE_NAME = %s",
+                (db_name, table_name)
+            )
+            row = cursor.fetchone()
+            estimated_rows = int(row[0] or 0) if row else 0
+            
+            if estimated_rows < max(min_rows, parallelism):
+                cursor.close()
+                return []
+            
+            cursor.execute(f"USE {db_name}")
+            if 'int' in split_key_type:
+                cursor.execute(f"SELECT MIN({split_key}), MAX({split_key}) FROM {table_name}")
+                min_value, max_value = cursor.fetchone()
+                if min_value is None:
+                    cursor.close()
+                    return []
+                step = (max_value - min_value + 1) / parallelism
+                boundaries = [min_value + int(step * i) for i in range(1, parallelism)]
+            else:
+                # 非整数主键：在索引上按偏移量采样分界点
+                boundaries = []
+                for i in range(1, parallelism):
+                    cursor.execute(
+                        f"SELECT {split_key} FROM {table_name} ORDER BY {split_key} LIMIT 1 OFFSET %s",
+                        (estimated_rows * i // parallelism,)
+                    )
+                    sample = cursor.fetchone()
+                    if sample is not None:
+                        boundaries.append(sample[0])
+            cursor.close()
+        finally:
+            conn.close()
+        
+        boundaries = sorted(set(boundaries))
+        lower_bounds = [None] + boundaries
+        upper_bounds = boundaries + [None]
+        ranges = list(zip(lower_bounds, upper_bounds))
+        
+        logger.info(f"  ✂️ 主键范围切分: {db_name}.{table_name} 按 {split_key} 切分为 {len(ranges)} 段 (估算 {estimated_rows} 行)")
+        return ranges
+    
+    @staticmethod
+    def build_range_condition(split_key: str, key_range: Tuple) -> Tuple[str, tuple]:
+        """构建主键范围条件 (lower <= pk < upper)"""
+        lower, upper = key_range
+        conditions = []
+        params = []
+        if lower is not None:
+            conditions.append(f"{split_key} >= %s")
+            params.append(lower)
+        if upper is not None:
+            conditions.append(f"{split_key} < %s")
+            params.append(upper)
+        return " AND ".join(conditions) or "1 = 1", tuple(params)
+
+class BinlogCDCSource:
+    """MySQL binlog CDC数据源 - 从指定位置读取行格式binlog，按事务边界产出变更批次
+    
+    事件统一转换为字典:
+      {'type': 'insert'|'update'|'delete', 'schema', 'table', 'rows': [列值字典], 'log_file', 'log_pos'}
+      {'type': 'commit', 'log_file', 'log_pos'}
+    测试时可通过 event_stream_factory 注入录制好的事件序列，无需真实MySQL。
+    """
+    
+    def __init__(self, params: Dict, db_names: List[str], table_names: List[str],
+                 batch_size: int = 1000,
+                 event_stream_factory: Callable[[Dict], Iterator[Dict]] = None):
+        self.params = params
+        self.db_names = db_names
+        self.table_names = table_names
+        self.batch_size = batch_size
+        self.event_stream_factory = event_stream_factory or self._open_binlog_stream
+    
+    def _open_binlog_stream(self, position: Dict) -> Iterator[Dict]:
+        """打开真实的binlog流（非阻塞，读到当前末尾即结束）"""
+        if BinLogStreamReader is None:
+            raise RuntimeError("binlog CDC 需要安装 mysql-replication: pip install mysql-replication")
+        
+        stream_kwargs = {
+            'connection_settings': {
+                'host': self.params['db_host'],
+                'port': int(self.params['db_port']),
+                'user': self.params['db_user'],
+                'passwd': self.params['db_pass']
+            },
+            'server_id': int(self.params.get('cdc_server_id', 4379)),
+            'only_events': [WriteRowsEvent, UpdateRowsEvent, DeleteRowsEvent, XidEvent],
+            'only_schemas': self.db_names,
+            'only_tables': self.table_names,
+            'resume_stream': True,
+            'blocking': False
+        }
+        if position.get('gtid_set'):
+            stream_kwargs['auto_position'] = position['gtid_set']
+        else:
+            stream_kwargs['log_file'] = position['log_file']
+            stream_kwargs['log_pos'] = position['log_pos']
+        
+        stream = BinLogStreamReader(**stream_kwargs)
+        try:
+            for event in stream:
+                yield self._normalize_event(event, stream)
+        finally:
+            stream.close()
+    
+    @staticmethod
+    def _normalize_event(event, stream) -> Dict:
+        """将 python-mysql-replication 事件转换为统一的事件字典"""
+        position = {'log_file': stream.log_file, 'log_pos': stream.log_pos}
+        if isinstance(event, XidEvent):
+            return {'type': 'commit', **position}
+        
+        if isinstance(event, UpdateRowsEvent):
+            # 更新前的行用于识别主键变更：旧主键对应的行需要删除
+            return {'type': 'update', 'schema': event.schema, 'table': event.table,
+                    'rows': [row['after_values'] for row in event.rows],
+                    'before_rows': [row['before_values'] for row in event.rows], **position}
+        
+        event_type = 'insert' if isinstance(event, WriteRowsEvent) else 'delete'
+        return {'type': event_type, 'schema': event.schema, 'table': event.table,
+                'rows': [row['values'] for row in event.rows], **position}
+    
+    @staticmethod
+    def get_current_position(connection_pool) -> Dict:
+        """读取源库当前的binlog位置，作为首次全量同步后的CDC起点"""
+        conn = get_pooled_connection(connection_pool)
+        try:
+            cursor = conn.cursor()
+            try:
+                cursor.execute("SHOW BINARY LOG STATUS")
+            except mysql.connector.Error:
+                # MySQL 8.2 之前的语法
+                cursor.execute("SHOW MASTER STATUS")
+            row = cursor.fetchone()
+            cursor.close()
+        finally:
+            conn.close()
+        
+        if not row:
+            raise RuntimeError("无法读取binlog位置，请确认源库已开启 log_bin 且 binlog_format=ROW")
+        
+        return {'log_file': row[0], 'log_pos': int(row[1])}
+    
+    def read_batches(self, position: Dict,
+                     primary_keys_lookup: Callable[[str, str], List[str]]) -> Iterator[Dict]:
+        """从 position 开始读取变更，按事务边界产出批次
+        
+        批次: {'changes': {(schema, table): {'upserts': [...], 'deletes': [...]}},
+               'position': 批次最后一个事务提交后的位置, 'rows': 事件行数}
+        同一主键在批次内多次变更时只保留最后一次（插入/更新 → upsert，删除 → delete）。
+        更新改变了主键时，旧主键记为 delete、新主键记为 upsert。
+        无主键的表只能追加，删除事件被忽略。
+        """
+        pending = {}
+        pending_rows = 0
+        committed_position = None
+        skipped_deletes = 0
+        
+        def build_batch() -> Dict:
+            changes = {}
+            for table_key, row_changes in pending.items():
+                changes[table_key] = {
+                    'upserts': [values for op, values in row_changes.values() if op != 'delete'],
+                    'deletes': [values for op, values in row_changes.values() if op == 'delete']
+                }
+            return {'changes': changes, 'position': committed_position, 'rows': pending_rows}
+        
+        for event in self.event_stream_factory(position):
+            if event['type'] == 'commit':
+                committed_position = {'log_file': event['log_file'], 'log_pos': event['log_pos']}
+                if pending_rows >= self.batch_size:
+                    yield build_batch()
+                    pending = {}
+                    pending_rows = 0
+                    committed_position = None
+                continue
+            
+            table_key = (event['schema'], event['table'])
+            primary_keys = primary_keys_lookup(*table_key)
+            row_changes = pending.setdefault(table_key, {})
+            
+            before_rows = event.get('before_rows') or [None] * len(event['rows'])
+            for values, before_values in zip(event['rows'], before_rows):
+                pending_rows += 1
+                if primary_keys:
+                    row_key = tuple(values.get(pk) for pk in primary_keys)
+                    old_key = tuple(before_values.get(pk) for pk in primary_keys) if before_values else row_key
+                    if old_key != row_key:
+                        row_changes.pop(old_key, None)
+                        row_changes[old_key] = ('delete', before_values)
+                    # 删除后重新插入：保证字典顺序反映最后一次变更
+                    row_changes.pop(row_key, None)
+                elif event['type'] == 'delete':
+                    skipped_deletes += 1
+                    continue
+                else:
+                    row_key = ('__row__', pending_rows)
+                row_changes[row_key] = (event['type'], values)
+        
+        if skipped_deletes:
+            logger.warning(f"⚠️ 无主键表无法应用删除事件，已忽略 {skipped_deletes} 行")
+        
+        # binlog按事务整体写入，最后一个提交之后不会有残留事件；未提交部分下次从已保存位置重读
+        if committed_position is not None:
+            yield build_batch()
+
+class ColumnarLoadWriter:
+    """列式加载文件写入器 - 将数据块构建为Arrow记录批次并序列化为Parquet"""
+    
+    # BigQuery -> Arrow 类型映射（NUMERIC 为 38 位精度、9 位小数；BIGNUMERIC 为 76 位精度、38 位小数）
+    BQ_TO_ARROW_TYPE = {
+        "STRING": lambda: pa.string(),
+        "INT64": lambda: pa.int64(),
+        "FLOAT64": lambda: pa.float64(),
+        "NUMERIC": lambda: pa.decimal128(38, 9),
+        "BIGNUMERIC": lambda: pa.decimal256(76, 38),
+        "BOOLEAN": lambda: pa.bool_(),
+        "TIMESTAMP": lambda: pa.timestamp('us', tz='UTC'),
+        "DATE": lambda: pa.date32(),
+        "BYTES": lambda: pa.binary()
+    }
+    
+    def __init__(self, compression: str = 'snappy'):
+        if pa is None:
+            raise RuntimeError("列式加载需要安装 pyarrow: pip install pyarrow")
+        self.compression = compression or 'none'
+    
+    @staticmethod
+    def arrow_type(bq_type: str):
+        """获取BigQuery类型对应的Arrow类型"""
+        type_factory = ColumnarLoadWriter.BQ_TO_ARROW_TYPE.get(bq_type, ColumnarLoadWriter.BQ_TO_ARROW_TYPE["STRING"])
+        return type_factory()
+    
+    def _build_column(self, values: List, bq_type: str):
+        """按列构建Arrow数组：时间/日期/NUMERIC 用向量化转换，避免逐行处理"""
+        target_type = self.arrow_type(bq_type)
+        
+        if bq_type == "TIMESTAMP":
+            # 标准化后为ISO字符串（无时区，按UTC解释，与JSON加载一致）
+            naive = pc.cast(pa.array(values, pa.string()), pa.timestamp('us'))
+            return naive.cast(target_type)
+        if bq_type == "DATE":
+            return pc.cast(pa.array(values, pa.string()), target_type)
+        if bq_type == "NUMERIC":
+            # 按十进制文本解析，不经过 float64；小数位超过9位的按 BigQuery 规则（远离零）舍入，
+            # 超出 NUMERIC 范围或无法解析的值（NaN、inf）使本批转换失败，而不是被截断成错误的值
+            decimals = pc.cast(pa.array([None if value is None else str(value) for value in values], pa.string()),
+                               self.arrow_type("BIGNUMERIC"))
+            return pc.cast(pc.round(decimals, ndigits=target_type.scale, round_mode='half_towards_infinity'),
+                           target_type)
+        if bq_type == "BIGNUMERIC":
+            # 行转换器以十进制字符串保存 BIGNUMERIC
+            return pc.cast(pa.array([None if value is None else str(value) for value in values], pa.string()),
+                           target_type)
+        if bq_type == "BYTES":
+            values = [value.encode('utf-8') if isinstance(value, str) else value for value in values]
+        
+        return pa.array(values, target_type)
+    
+    def build_record_batch(self, rows, schema: List[bigquery.SchemaField]):
+        """将标准化后的行构建为Arrow记录批次（每列只遍历一次），已是记录批次时直接返回"""
+        if isinstance(rows, pa.RecordBatch):
+            return rows
+        
+        columns = []
+        fields = []
+        for field in schema:
+            values = [row.get(field.name) for row in rows]
+            columns.append(self._build_column(values, field.field_type))
+            fields.append(pa.field(field.name, self.arrow_type(field.field_type)))
+        
+        return pa.RecordBatch.from_arrays(columns, schema=pa.schema(fields))
+    
+    def write_parquet(self, record_batch) -> io.BytesIO:
+        """将记录批次序列化为内存中的Parquet文件"""
+        buffer = io.BytesIO()
+        pq.write_table(pa.Table.from_batches([record_batch]), buffer, compression=self.compression)
+        buffer.seek(0)
+        return buffer
+
+class ColumnarNormalizer:
+    """列式类型标准化器 - 直接从MySQL原始值按列构建目标类型的Arrow记录批次
+    
+    每列只遍历一次：先由Arrow推断原始类型，再向量化转换为BigQuery目标类型；
+    小数位超出目标精度的 DECIMAL 先按 BigQuery 规则（远离零）舍入，
+    转换统计为转换前后取值不同的值个数（如被舍入的小数），与 JSON 路径的统计口径一致。
+    """
+    
+    @staticmethod
+    def _changed_count(source, converted) -> int:
+        """转换前后取值不同的值个数；两种类型无法比较时返回0"""
+        try:
+            changed = pc.not_equal(converted.cast(source.type, safe=False), source)
+        except (pa.ArrowException, TypeError, ValueError):
+            return 0
+        return pc.sum(pc.fill_null(changed, False).cast(pa.int64())).as_py() or 0
+    
+    @staticmethod
+    def _normalize_column(values: List, bq_type: str) -> Tuple[object, int]:
+        """标准化单列，返回 (Arrow数组, 取值发生变化的值个数)"""
+        target_type = ColumnarLoadWriter.arrow_type(bq_type)
+        
+        try:
+            source = pa.array(values)
+        except (pa.ArrowException, TypeError, ValueError):
+            source = None
+        
+        if source is not None:
+            if source.type == target_type:
+                return source, 0
+            if pa.types.is_null(source.type):
+                return pa.nulls(len(values), target_type), 0
+        
+        if source is None or pa.types.is_string(target_type):
+            # 混合类型以及 TIME(timedelta)、SET(set) 等值保持原有的 str() 表示
+            converted = pa.array([None if value is None else str(value) for value in values], pa.string())
+            if not pa.types.is_string(target_type):
+                converted = pc.cast(converted, target_type)
+        elif pa.types.is_timestamp(target_type) and pa.types.is_timestamp(source.type):
+            # MySQL DATETIME 无时区，按UTC解释（与JSON加载一致）
+            converted = source.cast(pa.timestamp('us')).cast(target_type)
+        elif (pa.types.is_decimal(source.type) and pa.types.is_decimal(target_type)
+              and source.type.scale > target_type.scale):
+            # 如 DECIMAL(20,12) -> NUMERIC：直接转换会因丢失小数位报错，先舍入到9位
+            rounded = pc.round(source, ndigits=target_type.scale, round_mode='half_towards_infinity')
+            converted = pc.cast(rounded, target_type)
+        else:
+            converted = pc.cast(source, target_type)
+        
+        if source is None:
+            return converted, 0
+        return converted, ColumnarNormalizer._changed_count(source, converted)
+    
+    @staticmethod
+    def normalize(rows: List[Dict], table_info: Dict, tenant_id: str,
+                  sync_mode: str, sync_time: datetime):
+        """将原始行标准化为与目标表schema一致的Arrow记录批次"""
+        if not rows:
+            return rows
+        
+        logger.info(f"  🔄 列式数据类型标准化: {len(rows)} 行")
+        
+        row_count = len(rows)
+        system_values = {
+            'tenant_id': pa.array([tenant_id] * row_count, pa.string()),
+            'sync_timestamp': pa.array([sync_time] * row_count, pa.timestamp('us')).cast(pa.timestamp('us', tz='UTC')),
+            'sync_mode': pa.array([sync_mode] * row_count, pa.string())
+        }
+        
+        columns = []
+        fields = []
+        for field in table_info['schema']:
+            if field.name in system_values:
+                column = system_values[field.name]
+            else:
+                column, converted_count = ColumnarNormalizer._normalize_column(
+                    [row.get(field.name) for row in rows], field.field_type
+                )
+                if converted_count:
+                    mysql_type = table_info['field_types'].get(field.name, 'unknown')
+                    logger.info(f"    🔄 {field.name}: {mysql_type} → {field.field_type} ({converted_count} 个值被舍入/截断)")
+            columns.append(column)
+            fields.append(pa.field(field.name, column.type))
+        
+        logger.info(f"  ✅ 列式数据类型标准化完成")
+        return pa.RecordBatch.from_arrays(columns, schema=pa.schema(fields))
+
+class BatchDataProcessor:
+    """批量数据处理器"""
+    
+    @staticmethod
+    def batch_normalize_data_types(rows: List[Dict], field_types: Dict[str, str]) -> List[Dict]:
+        """批量标准化数据类型"""
+        if not rows:
             return rows
         
         logger.info(f"  🔄 批量处理数据类型标准化: {len(rows)} 行")
@@ -303,9 +1733,7 @@ class BatchDataProcessor:
         # 预计算类型转换映射
         type_converters = {}
         for field, mysql_type in field_types.items():
-            base_type = mysql_type.split("(")[0].lower()
-            bq_type = MYSQL_TO_BQ_TYPE.get(base_type, "STRING")
-            type_converters[field] = (bq_type, mysql_type)
+            type_converters[field] = (mysql_to_bq_type(mysql_type), mysql_type)
         
         # 批量处理
         normalized_rows = []
@@ -360,6 +1788,9 @@ class BatchDataProcessor:
                 return float(value) if value != '' else None
             elif bq_type == "NUMERIC":
                 return float(value) if value != '' else None
+            elif bq_type == "BIGNUMERIC":
+                # 超出 float 精度，以十进制字符串加载
+                return str(value) if value != '' else None
             elif bq_type == "BOOLEAN":
                 if isinstance(value, bool):
                     return value
@@ -385,243 +1816,2429 @@ class BatchDataProcessor:
         except (ValueError, TypeError) as e:
             logger.warning(f"⚠️ 类型转换失败 {value} -> {bq_type}: {e}, 使用字符串类型")
             return str(value)
-    
 
+class CompiledRowConverter:
+    """按表编译的行转换器 - 由 table_info['field_types'] 一次性生成每列的转换函数
 
-class OptimizedIncrementalSyncer:
-    """优化版增量同步器"""
+    结果与"基础类型处理 + batch_normalize_data_types"两遍处理一致，但每个值只经过
+    一次专用函数调用：常见Python类型走快速路径，其余值回退到
+    BatchDataProcessor._convert_value_to_bq_type；系统字段作为常量填充。
+    """
+
+    SYSTEM_FIELDS = ('tenant_id', 'sync_timestamp', 'sync_mode')
+
+    def __init__(self, column_names: Tuple[str, ...], field_types: Dict[str, str]):
+        self.column_names = tuple(name for name in column_names if name not in self.SYSTEM_FIELDS)
+        self.output_names = self.column_names + self.SYSTEM_FIELDS
+        self.conversions = {}
+
+        converters = []
+        for name in self.column_names:
+            mysql_type = field_types.get(name)
+            if mysql_type is None:
+                # 未知字段转为字符串
+                bq_type, mysql_type = 'STRING', 'unknown'
+            else:
+                bq_type = mysql_to_bq_type(mysql_type)
+            self.conversions[name] = (mysql_type, bq_type)
+            converters.append(self._compile_column(bq_type, mysql_type))
+        self.converters = tuple(converters)
+
+    @staticmethod
+    def _prepass(value):
+        """与原"基础类型处理"一致：datetime转ISO字符串，Decimal转float"""
+        if isinstance(value, datetime):
+            return value.isoformat()
+        if isinstance(value, Decimal):
+            return float(value)
+        return value
+
+    @staticmethod
+    def _compile_column(bq_type: str, mysql_type: str) -> Callable:
+        """生成单列转换函数"""
+        prepass = CompiledRowConverter._prepass
+        convert_value = BatchDataProcessor._convert_value_to_bq_type
+
+        def generic(value):
+            if value is None:
+                return None
+            return convert_value(prepass(value), bq_type, mysql_type)
+
+        if bq_type == "STRING":
+            def convert(value):
+                if value is None or type(value) is str:
+                    return value
+                return generic(value)
+        elif bq_type == "INT64":
+            def convert(value):
+                if value is None or type(value) is int:
+                    return value
+                return generic(value)
+        elif bq_type in ("FLOAT64", "NUMERIC"):
+            def convert(value):
+                value_type = type(value)
+                if value is None or value_type is float:
+                    return value
+                if value_type is Decimal or value_type is int:
+                    return float(value)
+                return generic(value)
+        elif bq_type == "BIGNUMERIC":
+            def convert(value):
+                if value is None or type(value) is str:
+                    return value
+                if type(value) is Decimal or type(value) is int:
+                    return str(value)
+                return generic(value)
+        elif bq_type == "TIMESTAMP":
+            def convert(value):
+                value_type = type(value)
+                if value is None or value_type is str:
+                    return value
+                if value_type is datetime:
+                    return value.isoformat()
+                return generic(value)
+        elif bq_type == "DATE":
+            def convert(value):
+                value_type = type(value)
+                if value is None or value_type is str:
+                    return value
+                if value_type is date or value_type is datetime:
+                    return value.isoformat()
+                return generic(value)
+        elif bq_type == "BOOLEAN":
+            def convert(value):
+                if value is None or type(value) is bool:
+                    return value
+                return generic(value)
+        else:
+            convert = generic
+        return convert
+
+    def describe(self) -> List[str]:
+        """返回非字符串目标列的类型映射描述"""
+        return [f"{name}: {mysql_type} → {bq_type}"
+                for name, (mysql_type, bq_type) in self.conversions.items()
+                if bq_type != 'STRING']
+
+    def convert(self, rows: List[Dict], tenant_id: str, sync_timestamp: str, sync_mode: str) -> List[Dict]:
+        """单遍转换一批行（同一游标返回的行列顺序一致）"""
+        names = self.column_names
+        output_names = self.output_names
+        converters = self.converters
+        system_values = [tenant_id, sync_timestamp, sync_mode]
+
+        if rows and tuple(rows[0].keys()) != names:
+            # 行中含系统字段或列顺序不同，按列名取值
+            return [dict(zip(output_names,
+                             [convert(row.get(name)) for convert, name in zip(converters, names)] + system_values))
+                    for row in rows]
+
+        return [dict(zip(output_names,
+                         [convert(value) for convert, value in zip(converters, row.values())] + system_values))
+                for row in rows]
+
+
+
+class BigQueryTableRegistry:
+    """BigQuery 数据集/表登记 - 进程内所有工作线程共享
     
-    def __init__(self, params: Dict):
-        self.params = params
+    已确认存在的数据集和表（及其schema）记录在内存中，之后的租户不再调用 get_dataset/get_table；
+    首次检查/创建按对象单飞：同一对象只有一个线程访问BigQuery，其他线程等待其结果。
+    """
+    
+    def __init__(self, bq_client):
+        self.bq_client = bq_client
+        self._lock = threading.Lock()
+        self._datasets = {}
+        self._tables = {}
+        self._in_flight = {}
+    
+    def _single_flight(self, key: str, known: Dict, load: Callable):
+        """已登记时直接返回；否则同一 key 只有一个线程执行 load()"""
+        with self._lock:
+            if key in known:
+                return known[key]
+            key_lock = self._in_flight.setdefault(key, threading.Lock())
         
-        # 解析数据库列表
-        db_names = [db.strip() for db in params['db_list'].split(",")]
+        with key_lock:
+            with self._lock:
+                if key in known:
+                    return known[key]
+            value = load()
+            with self._lock:
+                known[key] = value
+                self._in_flight.pop(key, None)
+            return value
+    
+    def ensure_dataset(self, dataset_id: str, location: str = "US"):
+        """确保数据集存在（project.dataset）"""
+        def load():
+            try:
+                return self.bq_client.get_dataset(dataset_id)
+            except NotFound:
+                dataset = bigquery.Dataset(dataset_id)
+                dataset.location = location
+                dataset = self.bq_client.create_dataset(dataset, exists_ok=True)
+                logger.info(f"🆕 创建数据集: {dataset_id}")
+                return dataset
         
-        # 创建连接池（不指定默认数据库）
-        self.connection_pool = mysql.connector.pooling.MySQLConnectionPool(
-            pool_name="sync_pool",
-            pool_size=params.get('pool_size', 5),
-            pool_reset_session=True,
-            host=params['db_host'],
-            port=int(params['db_port']),
-            user=params['db_user'],
-            password=params['db_pass']
-        )
-        logger.info(f"✅ 创建连接池: {params.get('pool_size', 5)} 个连接")
+        self._single_flight(dataset_id, self._datasets, load)
+    
+    def ensure_table(self, table_id: str, schema: List[bigquery.SchemaField],
+                     configure: Optional[Callable] = None) -> List[bigquery.SchemaField]:
+        """确保表存在，返回BigQuery中表的schema
         
-        # 初始化缓存和组件
-        self.table_cache = TableInfoCache()
-        self.status_manager = LocalFileStatusManager(params.get('status_dir', 'sync_status'))
-        self.table_analyzer = TableAnalyzer(self.connection_pool, self.table_cache)
-        self.bq_client = bigquery.Client(project=params['bq_project'])
+        configure: 创建前对 bigquery.Table 的设置（分区、聚簇等）；
+        其他进程先创建了同一张表（Conflict）时读取已有表。
+        """
+        def load():
+            try:
+                return list(self.bq_client.get_table(table_id).schema)
+            except NotFound:
+                pass
+            table = bigquery.Table(table_id, schema=schema)
+            if configure is not None:
+                configure(table)
+            try:
+                table = self.bq_client.create_table(table)
+                logger.info(f"🆕 创建表: {table_id}")
+            except Conflict:
+                table = self.bq_client.get_table(table_id)
+            return list(table.schema)
         
-        # 配置参数
-        self.lookback_minutes = params.get('lookback_minutes', 10)
-        self.batch_size = params.get('batch_size', 1000)
-        self.max_retries = params.get('max_retries', 3)
-        self.retry_delay = params.get('retry_delay', 5)
+        return self._single_flight(table_id, self._tables, load)
     
-    def get_table_data(self, db_name: str, table_name: str, table_info: Dict, 
-                      sync_mode: str, last_sync_time: datetime = None, 
-                      current_sync_time: datetime = None) -> List[Dict]:
-        """获取表数据（增量或全量）"""
-        conn = self.connection_pool.get_connection()
-        try:
-            cursor = conn.cursor(dictionary=True)
-            cursor.execute(f"USE {db_name}")
-            
-            if sync_mode == 'INCREMENTAL' and last_sync_time and table_info['timestamp_field']:
-                # 增量查询
-                timestamp_field = table_info['timestamp_field']
-                timestamp_field_type = table_info['field_types'].get(timestamp_field, '').lower()
-                
-                # 安全回退时间窗口
-                safe_start_time = last_sync_time - timedelta(minutes=self.lookback_minutes)
-                
-                if 'int' in timestamp_field_type:
-                    # Unix时间戳查询
-                    safe_start_timestamp = int(safe_start_time.timestamp())
-                    current_timestamp = int(current_sync_time.timestamp())
-                    
-                    query = f"""
-                        SELECT * FROM {table_name} 
-                        WHERE {timestamp_field} > %s 
-                        AND {timestamp_field} <= %s
-                        ORDER BY {timestamp_field} ASC
-                    """
-                    cursor.execute(query, (safe_start_timestamp, current_timestamp))
-                    logger.info(f"  🔍 Unix时间戳查询: {timestamp_field} > {safe_start_timestamp} AND <= {current_timestamp}")
-                else:
-                    # 日期时间查询
-                    query = f"""
-                        SELECT * FROM {table_name} 
-                        WHERE {timestamp_field} > %s 
-                        AND {timestamp_field} <= %s
-                        ORDER BY {timestamp_field} ASC
-                    """
-                    cursor.execute(query, (safe_start_time, current_sync_time))
-                    logger.info(f"  🔍 日期时间查询: {timestamp_field} > {safe_start_time} AND <= {current_sync_time}")
-            else:
-                # 全量查询
-                cursor.execute(f"SELECT * FROM {table_name}")
-                logger.info(f"  🔍 全量数据查询")
-            
-            rows = cursor.fetchall()
+    def forget_table(self, table_id: str):
+        """表被删除后移除登记"""
+        with self._lock:
+            self._tables.pop(table_id, None)
+
+class StagingTableManager:
+    """暂存表管理器 - 每个工作线程、每个目标表、每种用途一张暂存表，整个运行期间复用
+    
+    暂存表放在独立的暂存数据集中，加载时使用 WRITE_TRUNCATE 覆盖上一批数据，
+    不再每批创建/删除临时表；表名包含运行ID和线程编号，并发线程和并发运行互不冲突。
+    运行结束时统一删除，进程异常退出留下的表由数据集默认过期时间清理。
+    """
+    
+    def __init__(self, bq_client, project: str, dataset: str, expiration_hours: int = 24,
+                 run_id: Optional[str] = None):
+        self.bq_client = bq_client
+        self.project = project
+        self.dataset = f"{dataset}_staging"
+        self.expiration_hours = expiration_hours
+        self.run_id = run_id or f"{datetime.now().strftime('%Y%m%d%H%M%S')}_{uuid.uuid4().hex[:6]}"
+        self._lock = threading.Lock()
+        self._dataset_ready = False
+        self._worker_ids = {}
+        self._tables = set()
+    
+    def _ensure_dataset(self):
+        """创建暂存数据集（如果不存在），并确保设置了表默认过期时间"""
+        with self._lock:
+            if self._dataset_ready:
+                return
+            dataset_id = f"{self.project}.{self.dataset}"
+            expiration_ms = self.expiration_hours * 3600 * 1000
+            try:
+                dataset = self.bq_client.get_dataset(dataset_id)
+            except NotFound:
+                dataset = bigquery.Dataset(dataset_id)
+                dataset.location = "US"
+                dataset.default_table_expiration_ms = expiration_ms
+                self.bq_client.create_dataset(dataset, exists_ok=True)
+                logger.info(f"🆕 创建暂存数据集: {self.dataset} (表默认 {self.expiration_hours} 小时过期)")
+            else:
+                if not dataset.default_table_expiration_ms:
+                    # 已有的数据集没有默认过期时间时，异常退出留下的暂存表永远不会被清理
+                    dataset.default_table_expiration_ms = expiration_ms
+                    try:
+                        self.bq_client.update_dataset(dataset, ["default_table_expiration_ms"])
+                        logger.info(f"⏳ 暂存数据集 {self.dataset} 未设置表默认过期时间，已设为 {self.expiration_hours} 小时")
+                    except GoogleAPIError as e:
+                        logger.warning(f"⚠️ 暂存数据集 {self.dataset} 未设置表默认过期时间且无法修改，"
+                                       f"异常退出留下的暂存表需要手动清理: {e}")
+            self._dataset_ready = True
+    
+    def _worker_id(self) -> int:
+        """当前线程在本次运行中的编号"""
+        thread_id = threading.get_ident()
+        with self._lock:
+            if thread_id not in self._worker_ids:
+                self._worker_ids[thread_id] = len(self._worker_ids) + 1
+            return self._worker_ids[thread_id]
+    
+    def table_id(self, table_name: str, purpose: str) -> str:
+        """获取当前线程的暂存表ID，例如 orders_merge_20240101120000_ab12cd_w3"""
+        self._ensure_dataset()
+        staging_table_id = f"{self.project}.{self.dataset}.{table_name}_{purpose}_{self.run_id}_w{self._worker_id()}"
+        with self._lock:
+            self._tables.add(staging_table_id)
+        return staging_table_id
+    
+    def shared_table_id(self, table_name: str) -> str:
+        """跨运行复用的暂存表ID（例如全量同步暂存表），不属于本次运行，cleanup 时不删除"""
+        self._ensure_dataset()
+        return f"{self.project}.{self.dataset}.{table_name}"
+    
+    def cleanup(self):
+        """删除本次运行使用过的所有暂存表"""
+        with self._lock:
+            tables = sorted(self._tables)
+            self._tables.clear()
+        for staging_table_id in tables:
+            try:
+                self.bq_client.delete_table(staging_table_id, not_found_ok=True)
+            except Exception as e:
+                logger.warning(f"⚠️ 删除暂存表失败 {staging_table_id}: {e}（将由过期时间清理）")
+        if tables:
+            logger.info(f"🧹 已删除 {len(tables)} 张暂存表")
+
+class ProtoRowEncoder:
+    """Storage Write API 行编码器 - 根据BigQuery schema动态生成protobuf消息，并将行序列化"""
+
+    # BigQuery -> protobuf 字段类型（TIMESTAMP 为 UTC 微秒数，DATE 为距 1970-01-01 的天数）
+    BQ_TO_PROTO_TYPE = {
+        "STRING": "TYPE_STRING",
+        "INT64": "TYPE_INT64",
+        "FLOAT64": "TYPE_DOUBLE",
+        "NUMERIC": "TYPE_STRING",
+        "BIGNUMERIC": "TYPE_STRING",
+        "BOOLEAN": "TYPE_BOOL",
+        "TIMESTAMP": "TYPE_INT64",
+        "DATE": "TYPE_INT32",
+        "BYTES": "TYPE_BYTES"
+    }
+
+    def __init__(self, schema: List[bigquery.SchemaField], message_name: str = 'SyncRow'):
+        if bigquery_storage_v1 is None:
+            raise RuntimeError("Storage Write API 需要安装 google-cloud-bigquery-storage")
+
+        self.descriptor_proto = descriptor_pb2.DescriptorProto(name=message_name)
+        self._converters = []
+        for number, field in enumerate(schema, start=1):
+            bq_type = field.field_type if field.field_type in self.BQ_TO_PROTO_TYPE else "STRING"
+            self.descriptor_proto.field.add(
+                name=field.name, number=number,
+                type=getattr(descriptor_pb2.FieldDescriptorProto, self.BQ_TO_PROTO_TYPE[bq_type]),
+                label=descriptor_pb2.FieldDescriptorProto.LABEL_OPTIONAL
+            )
+            self._converters.append((field.name, self._compile_value(bq_type)))
+        self.message_class = self.message_class_for(self.descriptor_proto)
+
+    @staticmethod
+    def message_class_for(descriptor_proto):
+        """由消息描述生成消息类（每个描述使用独立的描述池，避免重名冲突）"""
+        file_proto = descriptor_pb2.FileDescriptorProto(
+            name=f"{descriptor_proto.name}.proto", package="smart_sync", syntax="proto2"
+        )
+        file_proto.message_type.add().CopyFrom(descriptor_proto)
+        pool = descriptor_pool.DescriptorPool()
+        pool.Add(file_proto)
+        return message_factory.GetMessageClass(pool.FindMessageTypeByName(f"smart_sync.{descriptor_proto.name}"))
+
+    @staticmethod
+    def _timestamp_micros(value) -> int:
+        """时间戳转为UTC微秒数（无时区的值按UTC解释，与JSON加载一致）"""
+        if isinstance(value, str):
+            value = datetime.fromisoformat(value)
+        if value.tzinfo is not None:
+            value = value.astimezone(timezone.utc).replace(tzinfo=None)
+        delta = value - datetime(1970, 1, 1)
+        return (delta.days * 86400 + delta.seconds) * 1000000 + delta.microseconds
+
+    @staticmethod
+    def _date_days(value) -> int:
+        if isinstance(value, str):
+            value = date.fromisoformat(value[:10])
+        elif isinstance(value, datetime):
+            value = value.date()
+        return (value - date(1970, 1, 1)).days
+
+    @staticmethod
+    def _to_bool(value) -> bool:
+        if isinstance(value, str):
+            return value.strip().lower() in ('1', 'true')
+        return bool(value)
+
+    @classmethod
+    def _compile_value(cls, bq_type: str) -> Callable:
+        """按BigQuery类型选择取值转换函数"""
+        return {
+            "STRING": str,
+            "INT64": int,
+            "FLOAT64": float,
+            "NUMERIC": str,
+            "BIGNUMERIC": str,
+            "BOOLEAN": cls._to_bool,
+            "TIMESTAMP": cls._timestamp_micros,
+            "DATE": cls._date_days,
+            "BYTES": lambda value: value.encode('utf-8') if isinstance(value, str) else bytes(value)
+        }[bq_type]
+
+    def encode(self, rows) -> List[bytes]:
+        """将标准化后的行（或Arrow记录批次）序列化，空值字段不设置"""
+        if not isinstance(rows, list):
+            rows = rows.to_pylist()
+
+        serialized_rows = []
+        for row in rows:
+            message = self.message_class()
+            for name, convert in self._converters:
+                value = row.get(name)
+                if value is not None:
+                    setattr(message, name, convert(value))
+            serialized_rows.append(message.SerializeToString())
+        return serialized_rows
+
+class StorageWriteStream:
+    """一次 Storage Write API 写入（对应一个数据块）
+
+    committed：写入表的 _default 流，每次追加成功即可见；
+    pending：创建待提交流，commit() 时 finalize + 批量提交，整块数据同时可见，失败时整块不可见。
+    """
+
+    def __init__(self, write_client, table_path: str, mode: str, descriptor_proto):
+        self.write_client = write_client
+        self.table_path = table_path
+        self.mode = mode
+        if mode == 'pending':
+            write_stream = storage_types.WriteStream(type_=storage_types.WriteStream.Type.PENDING)
+            self.stream_name = write_client.create_write_stream(parent=table_path, write_stream=write_stream).name
+        else:
+            self.stream_name = f"{table_path}/streams/_default"
+
+        # 请求模板只在连接的第一个请求中发送写入流和消息描述
+        request_template = storage_types.AppendRowsRequest(write_stream=self.stream_name)
+        proto_data = storage_types.AppendRowsRequest.ProtoData()
+        proto_data.writer_schema = storage_types.ProtoSchema(proto_descriptor=descriptor_proto)
+        request_template.proto_rows = proto_data
+        self._append_rows_stream = storage_writer.AppendRowsStream(write_client, request_template)
+        self._offset = 0
+        self._opened = False
+
+    def append(self, serialized_rows: List[bytes]):
+        """追加一批已序列化的行并等待确认"""
+        request = storage_types.AppendRowsRequest()
+        if self.mode == 'pending':
+            # 显式偏移量：重试时服务端拒绝重复追加
+            request.offset = self._offset
+        proto_data = storage_types.AppendRowsRequest.ProtoData()
+        proto_data.rows = storage_types.ProtoRows(serialized_rows=serialized_rows)
+        request.proto_rows = proto_data
+
+        self._opened = True
+        self._append_rows_stream.send(request).result()
+        self._offset += len(serialized_rows)
+
+    def commit(self):
+        """结束写入；pending 模式下提交整个流"""
+        self.close()
+        if self.mode != 'pending':
+            return
+        self.write_client.finalize_write_stream(name=self.stream_name)
+        response = self.write_client.batch_commit_write_streams(
+            storage_types.BatchCommitWriteStreamsRequest(parent=self.table_path, write_streams=[self.stream_name])
+        )
+        if response.stream_errors:
+            raise RuntimeError(f"提交写入流失败: {list(response.stream_errors)}")
+
+    def close(self):
+        if self._opened:
+            self._opened = False
+            self._append_rows_stream.close()
+
+class StorageWriteStreamFactory:
+    """打开 Storage Write API 写入流（测试时可替换为本地替身）"""
+
+    def __init__(self, write_client=None):
+        if bigquery_storage_v1 is None:
+            raise RuntimeError("Storage Write API 需要安装 google-cloud-bigquery-storage")
+        self.write_client = write_client or bigquery_storage_v1.BigQueryWriteClient()
+
+    def open_stream(self, table_path: str, mode: str, descriptor_proto) -> StorageWriteStream:
+        return StorageWriteStream(self.write_client, table_path, mode, descriptor_proto)
+
+class StorageWriteSink:
+    """Storage Write API 写入端 - 小批量增量数据直接追加，不经过加载作业排队
+
+    stream_factory 需提供 open_stream(table_path, mode, descriptor_proto)，返回带
+    append(serialized_rows) / commit() / close() 的写入流。
+    """
+
+    # 单个 AppendRows 请求上限 10 MB，按 9 MB 拆分
+    MAX_REQUEST_BYTES = 9 * 1024 * 1024
+
+    def __init__(self, mode: str = 'committed', stream_factory=None):
+        if mode not in ('committed', 'pending'):
+            raise ValueError(f"不支持的 Storage Write 模式: {mode}")
+        self.mode = mode
+        self.stream_factory = stream_factory or StorageWriteStreamFactory()
+        self._encoders = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def table_path(table_id: str) -> str:
+        """project.dataset.table -> projects/{project}/datasets/{dataset}/tables/{table}"""
+        project, dataset, table = table_id.split('.')
+        return f"projects/{project}/datasets/{dataset}/tables/{table}"
+
+    def _encoder(self, table_id: str, schema: List[bigquery.SchemaField]) -> ProtoRowEncoder:
+        """按 (表, schema) 缓存行编码器"""
+        key = (table_id, tuple((field.name, field.field_type) for field in schema))
+        with self._lock:
+            if key not in self._encoders:
+                self._encoders[key] = ProtoRowEncoder(schema)
+            return self._encoders[key]
+
+    def _split_requests(self, serialized_rows: List[bytes]) -> Iterator[List[bytes]]:
+        batch, batch_bytes = [], 0
+        for serialized_row in serialized_rows:
+            if batch and batch_bytes + len(serialized_row) > self.MAX_REQUEST_BYTES:
+                yield batch
+                batch, batch_bytes = [], 0
+            batch.append(serialized_row)
+            batch_bytes += len(serialized_row)
+        if batch:
+            yield batch
+
+    def append(self, table_id: str, rows, schema: List[bigquery.SchemaField]) -> int:
+        """将一个数据块写入表，返回写入行数"""
+        encoder = self._encoder(table_id, schema)
+        serialized_rows = encoder.encode(rows)
+        if not serialized_rows:
+            return 0
+
+        stream = self.stream_factory.open_stream(self.table_path(table_id), self.mode, encoder.descriptor_proto)
+        try:
+            for request_rows in self._split_requests(serialized_rows):
+                stream.append(request_rows)
+            stream.commit()
+        finally:
+            stream.close()
+        return len(serialized_rows)
+
+class GlobalSyncScheduler:
+    """全局调度器 - 所有 (租户, 表) 任务共享一个队列
+    
+    工作线程从共享队列中取出第一个未超过租户/表并发上限的任务执行，
+    慢表只占用一个线程，其余线程继续处理其他租户的表。
+    """
+    
+    def __init__(self, worker_count: int, max_per_tenant: Optional[int] = None,
+                 max_per_table: Optional[int] = None):
+        self.worker_count = max(1, worker_count)
+        self.max_per_tenant = max_per_tenant
+        self.max_per_table = max_per_table
+        self._condition = threading.Condition()
+        self._pending = deque()
+        self._running_by_tenant = {}
+        self._running_by_table = {}
+    
+    def _can_start(self, db_name: str, table_name: str) -> bool:
+        if self.max_per_tenant and self._running_by_tenant.get(db_name, 0) >= self.max_per_tenant:
+            return False
+        if self.max_per_table and self._running_by_table.get(table_name, 0) >= self.max_per_table:
+            return False
+        return True
+    
+    def _next_job(self) -> Optional[Tuple[str, str]]:
+        """取出下一个可执行任务；队列为空时返回 None"""
+        with self._condition:
+            while self._pending:
+                for job in self._pending:
+                    if self._can_start(*job):
+                        self._pending.remove(job)
+                        db_name, table_name = job
+                        self._running_by_tenant[db_name] = self._running_by_tenant.get(db_name, 0) + 1
+                        self._running_by_table[table_name] = self._running_by_table.get(table_name, 0) + 1
+                        return job
+                # 剩余任务都受并发上限限制，等待其他任务完成
+                self._condition.wait()
+            return None
+    
+    def _finish_job(self, db_name: str, table_name: str):
+        with self._condition:
+            self._running_by_tenant[db_name] -= 1
+            self._running_by_table[table_name] -= 1
+            self._condition.notify_all()
+    
+    def run(self, jobs: List[Tuple[str, str]], job_fn: Callable[[str, str], Dict]) -> List[Dict]:
+        """执行所有任务，返回按完成顺序排列的结果（job_fn 不应抛出异常）"""
+        self._pending = deque(jobs)
+        results = []
+        results_lock = threading.Lock()
+        
+        def worker():
+            while True:
+                job = self._next_job()
+                if job is None:
+                    return
+                try:
+                    result = job_fn(*job)
+                    with results_lock:
+                        results.append(result)
+                finally:
+                    self._finish_job(*job)
+        
+        worker_count = min(self.worker_count, len(jobs))
+        logger.info(f"🧵 全局调度: {len(jobs)} 个任务, {worker_count} 个工作线程 "
+                    f"(每租户上限: {self.max_per_tenant or '不限'}, 每表上限: {self.max_per_table or '不限'})")
+        
+        with ThreadPoolExecutor(max_workers=max(1, worker_count)) as executor:
+            for future in [executor.submit(worker) for _ in range(worker_count)]:
+                future.result()
+        
+        return results
+
+class ShardLeaseCoordinator:
+    """分片协调器 - 多个进程/主机通过共享的 SQLite 租约表领取 (租户, 表) 任务
+    
+    与 GlobalSyncScheduler 接口相同。同一 run_id 的工作进程各自登记全部任务（已存在则忽略），
+    再在 BEGIN IMMEDIATE 事务中领取一个待执行或租约已过期的任务；租户/表并发上限按所有进程
+    持有的有效租约计算。后台线程每 lease_seconds/3 续约，进程崩溃后租约过期，任务由其他进程
+    重新领取；同一任务租约过期超过 max_attempts 次视为失败，避免反复拖垮工作进程。
+    所有任务结束（完成或失败）后各进程的 run() 才返回。
+    """
+    
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS job_leases (
+            run_id TEXT NOT NULL,
+            tenant_id TEXT NOT NULL,
+            table_name TEXT NOT NULL,
+            status TEXT NOT NULL DEFAULT 'pending',
+            worker_id TEXT,
+            lease_expires_at REAL,
+            attempts INTEGER NOT NULL DEFAULT 0,
+            error_message TEXT,
+            updated_at TEXT NOT NULL,
+            PRIMARY KEY (run_id, tenant_id, table_name)
+        );
+        CREATE TABLE IF NOT EXISTS run_tasks (
+            run_id TEXT NOT NULL,
+            task TEXT NOT NULL,
+            worker_id TEXT NOT NULL,
+            updated_at TEXT NOT NULL,
+            PRIMARY KEY (run_id, task)
+        );
+    """
+    RETENTION_DAYS = 7  # 登记新运行时清理早于该天数的运行记录
+    
+    def __init__(self, db_path: str, run_id: str, worker_count: int = 1,
+                 max_per_tenant: Optional[int] = None, max_per_table: Optional[int] = None,
+                 lease_seconds: float = 300.0, max_attempts: int = 3,
+                 worker_id: Optional[str] = None, busy_timeout: float = 30.0):
+        if lease_seconds <= 0 or max_attempts < 1:
+            raise ValueError(f"租约时长必须大于0、最大尝试次数至少为1: {lease_seconds}, {max_attempts}")
+        self.db_path = Path(db_path)
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self.run_id = run_id
+        self.worker_count = max(1, worker_count)
+        self.max_per_tenant = max_per_tenant
+        self.max_per_table = max_per_table
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self.worker_id = worker_id or f"{socket.gethostname()}:{os.getpid()}"
+        self.poll_interval = min(5.0, lease_seconds / 3)
+        self.busy_timeout = busy_timeout
+        self._local = threading.local()
+        self._connections = []
+        self._connections_lock = threading.Lock()
+        
+        conn = self._connection()
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.executescript(self.SCHEMA)
+    
+    def _connection(self) -> sqlite3.Connection:
+        """当前线程的连接（自动提交，显式 BEGIN IMMEDIATE 开启写事务）"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(str(self.db_path), timeout=self.busy_timeout,
+                                   isolation_level=None, check_same_thread=False)
+            conn.row_factory = sqlite3.Row
+            self._local.conn = conn
+            with self._connections_lock:
+                self._connections.append(conn)
+        return conn
+    
+    @contextmanager
+    def _transaction(self):
+        conn = self._connection()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield conn
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+    
+    def register_jobs(self, jobs: List[Tuple[str, str]]):
+        """登记本次运行的所有任务（其他进程已登记的保持原状态）"""
+        now = datetime.now()
+        expired_before = (now - timedelta(days=self.RETENTION_DAYS)).isoformat()
+        with self._transaction() as conn:
+            conn.execute("DELETE FROM job_leases WHERE run_id != ? AND updated_at < ?",
+                         (self.run_id, expired_before))
+            conn.execute("DELETE FROM run_tasks WHERE run_id != ? AND updated_at < ?",
+                         (self.run_id, expired_before))
+            conn.executemany(
+                "INSERT OR IGNORE INTO job_leases (run_id, tenant_id, table_name, updated_at) VALUES (?, ?, ?, ?)",
+                [(self.run_id, db_name, table_name, now.isoformat()) for db_name, table_name in jobs]
+            )
+    
+    def claim(self) -> Optional[Tuple[str, str]]:
+        """领取一个待执行或租约已过期的任务；当前没有可领取的任务时返回 None"""
+        now = time.time()
+        updated_at = datetime.now().isoformat()
+        with self._transaction() as conn:
+            # 租约多次过期的任务（工作进程反复崩溃）标记为失败
+            conn.execute(
+                """UPDATE job_leases SET status = 'failed', updated_at = ?,
+                          error_message = '租约过期 ' || attempts || ' 次（工作进程 ' || worker_id || ' 未续约）'
+                   WHERE run_id = ? AND status = 'leased' AND lease_expires_at < ? AND attempts >= ?""",
+                (updated_at, self.run_id, now, self.max_attempts)
+            )
+            row = conn.execute(
+                """SELECT tenant_id, table_name, worker_id FROM job_leases j
+                   WHERE run_id = ? AND (status = 'pending' OR (status = 'leased' AND lease_expires_at < ?))
+                     AND (? IS NULL OR (SELECT COUNT(*) FROM job_leases l
+                                         WHERE l.run_id = j.run_id AND l.tenant_id = j.tenant_id
+                                           AND l.status = 'leased' AND l.lease_expires_at >= ?) < ?)
+                     AND (? IS NULL OR (SELECT COUNT(*) FROM job_leases l
+                                         WHERE l.run_id = j.run_id AND l.table_name = j.table_name
+                                           AND l.status = 'leased' AND l.lease_expires_at >= ?) < ?)
+                   ORDER BY attempts, rowid LIMIT 1""",
+                (self.run_id, now,
+                 self.max_per_tenant, now, self.max_per_tenant,
+                 self.max_per_table, now, self.max_per_table)
+            ).fetchone()
+            if row is None:
+                return None
+            conn.execute(
+                """UPDATE job_leases SET status = 'leased', worker_id = ?, lease_expires_at = ?,
+                          attempts = attempts + 1, updated_at = ?
+                   WHERE run_id = ? AND tenant_id = ? AND table_name = ?""",
+                (self.worker_id, now + self.lease_seconds, updated_at,
+                 self.run_id, row['tenant_id'], row['table_name'])
+            )
+        if row['worker_id']:
+            logger.warning(f"♻️ 接管租约过期的任务: {row['tenant_id']}.{row['table_name']} (原工作进程 {row['worker_id']})")
+        return row['tenant_id'], row['table_name']
+    
+    def heartbeat(self) -> int:
+        """为本进程持有的所有租约续期，返回续期的任务数"""
+        with self._transaction() as conn:
+            return conn.execute(
+                """UPDATE job_leases SET lease_expires_at = ?
+                   WHERE run_id = ? AND worker_id = ? AND status = 'leased'""",
+                (time.time() + self.lease_seconds, self.run_id, self.worker_id)
+            ).rowcount
+    
+    def complete(self, db_name: str, table_name: str, succeeded: bool, error_message: str = None) -> bool:
+        """结束任务；租约已被其他进程接管时返回 False（结果以接管者为准）"""
+        with self._transaction() as conn:
+            return conn.execute(
+                """UPDATE job_leases SET status = ?, error_message = ?, lease_expires_at = NULL, updated_at = ?
+                   WHERE run_id = ? AND tenant_id = ? AND table_name = ? AND worker_id = ? AND status = 'leased'""",
+                ('done' if succeeded else 'failed', error_message, datetime.now().isoformat(),
+                 self.run_id, db_name, table_name, self.worker_id)
+            ).rowcount == 1
+    
+    def open_jobs(self) -> int:
+        """尚未结束（待执行或执行中）的任务数"""
+        row = self._connection().execute(
+            "SELECT COUNT(*) AS n FROM job_leases WHERE run_id = ? AND status IN ('pending', 'leased')",
+            (self.run_id,)
+        ).fetchone()
+        return row['n']
+    
+    def summary(self) -> Dict[str, int]:
+        """本次运行各状态的任务数，例如 {'done': 8, 'failed': 1}"""
+        rows = self._connection().execute(
+            "SELECT status, COUNT(*) AS n FROM job_leases WHERE run_id = ? GROUP BY status", (self.run_id,)
+        ).fetchall()
+        return {row['status']: row['n'] for row in rows}
+    
+    def acquire_once(self, task: str) -> bool:
+        """本次运行中只需一个进程执行的收尾任务（如变更表MERGE）：第一个调用者返回 True"""
+        with self._transaction() as conn:
+            return conn.execute(
+                "INSERT OR IGNORE INTO run_tasks (run_id, task, worker_id, updated_at) VALUES (?, ?, ?, ?)",
+                (self.run_id, task, self.worker_id, datetime.now().isoformat())
+            ).rowcount == 1
+    
+    def _heartbeat_loop(self, stop: threading.Event):
+        while not stop.wait(self.lease_seconds / 3):
+            try:
+                self.heartbeat()
+            except sqlite3.Error as e:
+                logger.warning(f"⚠️ 租约续期失败: {e}（租约过期前重试）")
+    
+    def run(self, jobs: List[Tuple[str, str]], job_fn: Callable[[str, str], Dict]) -> List[Dict]:
+        """与其他进程共同执行所有任务，返回本进程执行的结果（job_fn 不应抛出异常）"""
+        self.register_jobs(jobs)
+        results = []
+        results_lock = threading.Lock()
+        
+        def worker():
+            while True:
+                job = self.claim()
+                if job is None:
+                    # 剩余任务都在其他进程执行中：继续等待，持有者崩溃时接管
+                    if self.open_jobs() == 0:
+                        return
+                    time.sleep(self.poll_interval)
+                    continue
+                result = job_fn(*job)
+                with results_lock:
+                    results.append(result)
+                if not self.complete(*job, result.get('status') == 'SUCCESS', result.get('error_message')):
+                    logger.warning(f"⚠️ 任务租约已被其他工作进程接管: {job[0]}.{job[1]}")
+        
+        worker_count = min(self.worker_count, len(jobs))
+        logger.info(f"🧩 分片调度: 运行 {self.run_id}, 工作进程 {self.worker_id}, {len(jobs)} 个任务, "
+                    f"{worker_count} 个工作线程 (租约 {self.lease_seconds:.0f}s, "
+                    f"每租户上限: {self.max_per_tenant or '不限'}, 每表上限: {self.max_per_table or '不限'})")
+        
+        stop_heartbeat = threading.Event()
+        heartbeat_thread = threading.Thread(target=self._heartbeat_loop, args=(stop_heartbeat,),
+                                            name="lease-heartbeat", daemon=True)
+        heartbeat_thread.start()
+        try:
+            with ThreadPoolExecutor(max_workers=max(1, worker_count)) as executor:
+                for future in [executor.submit(worker) for _ in range(worker_count)]:
+                    future.result()
+        finally:
+            stop_heartbeat.set()
+            heartbeat_thread.join()
+        
+        logger.info(f"🧩 分片运行 {self.run_id} 任务状态: {self.summary()}")
+        return results
+    
+    def close(self):
+        """关闭所有线程的连接"""
+        with self._connections_lock:
+            connections, self._connections = self._connections, []
+        for conn in connections:
+            conn.close()
+        self._local = threading.local()
+
+class TablePipeline:
+    """单表 抽取 → 转换 → 加载 三段流水线
+    
+    抽取线程、转换线程与加载（调用线程）之间用有界队列连接，下游变慢时上游在队列上阻塞（背压），
+    在途数据块数量受 queue_size 和 transform_workers 限制。多个转换线程乱序完成时，
+    加载阶段按块序号重排后顺序写入，断点仍按顺序推进。
+    各阶段分别统计忙碌（处理）与空闲（等待上下游）时间，用于判断瓶颈。
+    """
+    
+    STAGES = ('extract', 'transform', 'load')
+    _END = object()
+    
+    def __init__(self, transform_workers: int = 1, queue_size: int = 2):
+        self.transform_workers = max(1, transform_workers)
+        self.queue_size = max(1, queue_size)
+        self.stage_stats = {stage: {'busy': 0.0, 'idle': 0.0} for stage in self.STAGES}
+        self._stats_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._errors = []
+    
+    def _add_time(self, stage: str, kind: str, started: float):
+        with self._stats_lock:
+            self.stage_stats[stage][kind] += time.perf_counter() - started
+    
+    def _fail(self, error: Exception):
+        self._errors.append(error)
+        self._stop.set()
+    
+    def _put(self, target: queue.Queue, item, stage: str) -> bool:
+        """放入队列（满时阻塞），流水线已中止时返回 False"""
+        started = time.perf_counter()
+        try:
+            while not self._stop.is_set():
+                try:
+                    target.put(item, timeout=0.1)
+                    return True
+                except queue.Full:
+                    continue
+            return False
+        finally:
+            self._add_time(stage, 'idle', started)
+    
+    def _get(self, source: queue.Queue, stage: str):
+        """从队列取出（空时阻塞），流水线已中止时返回结束标记"""
+        started = time.perf_counter()
+        try:
+            while not self._stop.is_set():
+                try:
+                    return source.get(timeout=0.1)
+                except queue.Empty:
+                    continue
+            return self._END
+        finally:
+            self._add_time(stage, 'idle', started)
+    
+    def _extract(self, chunks: Iterator[Tuple[List[Dict], Optional[tuple]]], extract_queue: queue.Queue):
+        """抽取阶段：读取原始数据块并编号"""
+        chunk_seq = 0
+        try:
+            iterator = iter(chunks)
+            while not self._stop.is_set():
+                started = time.perf_counter()
+                item = next(iterator, None)
+                self._add_time('extract', 'busy', started)
+                if item is None:
+                    break
+                
+                rows, position = item
+                if not rows:
+                    continue
+                chunk_seq += 1
+                if not self._put(extract_queue, (chunk_seq, rows, position), 'extract'):
+                    break
+        except Exception as e:
+            self._fail(e)
+        finally:
+            # 在读取线程内关闭生成器，释放数据库连接
+            if hasattr(chunks, 'close'):
+                chunks.close()
+            for _ in range(self.transform_workers):
+                self._put(extract_queue, self._END, 'extract')
+    
+    def _transform(self, transform: Callable, extract_queue: queue.Queue, load_queue: queue.Queue):
+        """转换阶段：标准化数据块"""
+        try:
+            while True:
+                item = self._get(extract_queue, 'transform')
+                if item is self._END:
+                    break
+                
+                chunk_seq, rows, position = item
+                started = time.perf_counter()
+                chunk = transform(rows)
+                self._add_time('transform', 'busy', started)
+                if not self._put(load_queue, (chunk_seq, chunk, position), 'transform'):
+                    break
+        except Exception as e:
+            self._fail(e)
+        finally:
+            self._put(load_queue, self._END, 'transform')
+    
+    def run(self, chunks: Iterator[Tuple[List[Dict], Optional[tuple]]],
+            transform: Callable, load: Callable[[object, bool], int],
+            on_chunk_committed: Callable[[int, Optional[tuple], int], None] = None) -> int:
+        """运行流水线，加载阶段在调用线程中执行，返回写入行数
+        
+        load(数据块, 是否第一块) 返回写入行数；on_chunk_committed 按顺序回调 (块序号, 位置, 累计行数)。
+        """
+        extract_queue = queue.Queue(self.queue_size)
+        load_queue = queue.Queue(self.queue_size)
+        threads = [threading.Thread(target=self._extract, args=(chunks, extract_queue), daemon=True)]
+        threads += [
+            threading.Thread(target=self._transform, args=(transform, extract_queue, load_queue), daemon=True)
+            for _ in range(self.transform_workers)
+        ]
+        for thread in threads:
+            thread.start()
+        
+        records_written = 0
+        next_seq = 1
+        ready = {}
+        finished_workers = 0
+        try:
+            while finished_workers < self.transform_workers:
+                item = self._get(load_queue, 'load')
+                if item is self._END:
+                    if self._stop.is_set():
+                        break
+                    finished_workers += 1
+                    continue
+                
+                chunk_seq, chunk, position = item
+                ready[chunk_seq] = (chunk, position)
+                while next_seq in ready:
+                    chunk, position = ready.pop(next_seq)
+                    started = time.perf_counter()
+                    records_written += load(chunk, next_seq == 1)
+                    self._add_time('load', 'busy', started)
+                    if on_chunk_committed:
+                        on_chunk_committed(next_seq, position, records_written)
+                    next_seq += 1
+        except Exception as e:
+            self._fail(e)
+        finally:
+            self._stop.set()
+            for thread in threads:
+                thread.join()
+        
+        if self._errors:
+            raise self._errors[0]
+        return records_written
+    
+    @staticmethod
+    def merge_stage_stats(target: Dict, source: Dict):
+        """累加阶段耗时统计"""
+        for stage, times in source.items():
+            stage_times = target.setdefault(stage, {'busy': 0.0, 'idle': 0.0})
+            stage_times['busy'] += times['busy']
+            stage_times['idle'] += times['idle']
+    
+    @staticmethod
+    def format_stage_stats(stage_stats: Dict) -> str:
+        names = {'extract': '抽取', 'transform': '转换', 'load': '加载'}
+        return " | ".join(
+            f"{names[stage]} 忙碌 {stage_stats[stage]['busy']:.1f}秒/等待 {stage_stats[stage]['idle']:.1f}秒"
+            for stage in TablePipeline.STAGES if stage in stage_stats
+        )
+
+class OptimizedIncrementalSyncer:
+    """优化版增量同步器"""
+    
+    PER_DATABASE_MAX_WORKERS = 3  # per_database 调度下每个库同时同步的表数
+    
+    def __init__(self, params: Dict):
+        self.params = params
+        
+        # 解析数据库列表
+        db_names = [db.strip() for db in params['db_list'].split(",")]
+        
+        # 创建连接池（不指定默认数据库）
+        self.connection_pool = mysql.connector.pooling.MySQLConnectionPool(
+            pool_name="sync_pool",
+            pool_size=params.get('pool_size', 5),
+            pool_reset_session=True,
+            host=params['db_host'],
+            port=int(params['db_port']),
+            user=params['db_user'],
+            password=params['db_pass']
+        )
+        logger.info(f"✅ 创建连接池: {params.get('pool_size', 5)} 个连接")
+        
+        # 初始化缓存和组件
+        # 表结构缓存持久化到状态目录，按结构指纹校验后跨运行复用
+        table_cache_file = (Path(params.get('status_dir', 'sync_status')) / "_table_info_cache.json"
+                            if params.get('persist_table_cache', True) else None)
+        self.table_cache = TableInfoCache(table_cache_file)
+        self.status_manager = create_status_manager(params)
+        self.table_analyzer = TableAnalyzer(
+            self.connection_pool, self.table_cache,
+            TableAnalyzer.validate_column_rules(params.get('table_columns', {}))
+        )
+        self.bq_client = bigquery.Client(project=params['bq_project'])
+        self.table_registry = BigQueryTableRegistry(self.bq_client)
+        self.staging_tables = StagingTableManager(
+            self.bq_client, params['bq_project'], params['bq_dataset'],
+            params.get('staging_expiration_hours', 24)
+        )
+        
+        # 配置参数
+        self.lookback_minutes = params.get('lookback_minutes', 10)
+        # 增量水位：按源库时钟和实测提交延迟推进，lookback_minutes 只在无法测量时兜底
+        self.adaptive_lookback = params.get('adaptive_lookback', True)
+        self.watermark_safety_seconds = params.get('watermark_safety_seconds', 1)
+        self._innodb_trx_unavailable = False
+        # 源库会话时区相对UTC的偏移，由 read_source_clock 测得；Unix时间戳字段按它换算
+        self._source_utc_offset = None
+        self.batch_size = params.get('batch_size', 1000)
+        self.max_retries = params.get('max_retries', 3)
+        self.retry_delay = params.get('retry_delay', 5)
+        if self.max_retries < 0 or self.retry_delay < 0:
+            raise ValueError("max_retries 和 retry_delay 不能小于0")
+        self.keyset_full_sync = params.get('keyset_full_sync', True)
+        self.seek_incremental = params.get('seek_incremental', True)
+        
+        # 行过滤：所有租户共用的表级条件 + 租户专属条件，注入全量/增量/分段读取的 WHERE
+        self.table_filters = params.get('table_filters', {})
+        self.tenant_table_filters = params.get('tenant_table_filters', {})
+        TableAnalyzer.validate_row_filters(self.table_filters, self.tenant_table_filters)
+        self.range_split_parallelism = params.get('range_split_parallelism', 1)
+        self.range_split_min_rows = params.get('range_split_min_rows', 1000000)
+        
+        self.range_splitter = PKRangeSplitter(self.connection_pool)
+        self.sync_source = params.get('sync_source', 'polling')
+        if self.sync_source == 'binlog' and (self.table_filters or self.tenant_table_filters):
+            logger.warning("⚠️ binlog CDC 按行镜像写入，行过滤条件只作用于全量同步")
+        
+        # 调度方式：global（所有租户×表共享队列，默认）或 per_database（逐库串行、库内并行）
+        self.scheduler_mode = params.get('scheduler', 'global')
+        self.global_workers = params.get('global_workers', params.get('pool_size', 5))
+        self.max_concurrent_per_tenant = params.get('max_concurrent_per_tenant', 3)
+        self.max_concurrent_per_table = params.get('max_concurrent_per_table')
+        
+        # 主键范围并行读取的连接预算：每个表任务自身占用一个连接，范围读取的额外连接
+        # 只能借用连接池中表任务用不到的部分，预算耗尽时范围读取退化为串行而不是等待连接超时
+        table_workers = (self.global_workers if self.scheduler_mode != 'per_database'
+                         else self.PER_DATABASE_MAX_WORKERS)
+        spare_connections = max(0, params.get('pool_size', 5) - table_workers)
+        self._range_reader_slots = threading.Semaphore(spare_connections)
+        if self.range_split_parallelism > 1 and spare_connections < self.range_split_parallelism - 1:
+            logger.warning(f"⚠️ 连接池 {params.get('pool_size', 5)} 个连接、{table_workers} 个表任务，"
+                           f"只有 {spare_connections} 个空闲连接供主键范围并行读取"
+                           f"（range_split_parallelism={self.range_split_parallelism}），大表会降低并行度")
+        
+        # 多进程/多主机分片：同一 shard_run_id 的工作进程通过共享的 SQLite 租约表领取 (租户, 表) 任务
+        self.shard_coordinator = None
+        if params.get('shard_run_id'):
+            if self.sync_source == 'binlog':
+                raise ValueError("binlog CDC 是单一数据流，不支持多进程分片")
+            self.shard_coordinator = ShardLeaseCoordinator(
+                params.get('shard_coordination_db',
+                           str(Path(params.get('status_dir', 'sync_status')) / "_shard_leases.db")),
+                params['shard_run_id'], self.global_workers,
+                max_per_tenant=self.max_concurrent_per_tenant,
+                max_per_table=self.max_concurrent_per_table,
+                lease_seconds=params.get('shard_lease_seconds', 300),
+                max_attempts=params.get('shard_max_attempts', 3)
+            )
+        
+        # 加载文件格式：json（默认）或 parquet（需要 pyarrow）
+        self.columnar_writer = None
+        if params.get('load_format', 'json') == 'parquet':
+            if pa is None:
+                logger.warning("⚠️ 未安装 pyarrow，回退到 JSON 加载")
+            else:
+                self.columnar_writer = ColumnarLoadWriter(params.get('load_compression', 'snappy'))
+                logger.info(f"✅ 使用 Parquet 列式加载 (压缩: {self.columnar_writer.compression})")
+        self._table_write_locks = {}
+        self._table_write_locks_guard = threading.Lock()
+        self._row_converters = {}
+        
+        # 单表流水线：转换线程数、阶段间队列容量（块数）
+        self.transform_workers = params.get('transform_workers', 1)
+        self.pipeline_queue_size = params.get('pipeline_queue_size', 2)
+        self._pipeline_stats = {}
+        self._pipeline_stats_lock = threading.Lock()
+        self._high_marks = {}  # (租户, 表) -> 本次增量读取到的最大 (时间戳, 主键...)
+        
+        # 多租户批量MERGE：同一张表所有租户的增量数据合并为一次暂存加载 + 一次MERGE
+        self.tenant_batch_merge = params.get('tenant_batch_merge', False)
+        self.tenant_batch_max_rows = params.get('tenant_batch_max_rows', 100000)
+        self._tenant_batches = {}
+        self._tenant_batch_failures = {}
+        self._tenant_batches_lock = threading.Lock()
+        
+        # 全量同步写入方式：delete_append（先删除再追加，默认）或 staged_swap（写暂存表后事务替换，
+        # 没有空数据窗口，但多一次暂存表加载和一次暂存表扫描）
+        self.full_sync_strategy = params.get('full_sync_strategy', 'delete_append')
+        # 全量暂存表过期时间（小时）：中断的全量同步需在此时间内续传，过期后重新全量
+        self.full_staging_expiration_hours = params.get('full_staging_expiration_hours', 168)
+        if self.full_staging_expiration_hours <= 0:
+            raise ValueError("full_staging_expiration_hours 必须大于0")
+        
+        # MERGE目标表裁剪列：{表名: 写入后不变的列}，如 {"orders": "created_at"}
+        self.merge_prune_columns = params.get('merge_prune_columns', {})
+
+        # 增量写入方式：load_job（加载作业/MERGE，默认）或 storage_write（Storage Write API 低延迟追加，
+        # 有主键的表先追加到变更表，按 storage_write_merge_interval_minutes 延迟批量MERGE）
+        self.storage_write_sink = None
+        self.storage_write_merge_interval = timedelta(minutes=params.get('storage_write_merge_interval_minutes', 15))
+        self._storage_write_tables = {}
+        self._storage_write_pending_marked = set()
+        self._storage_write_last_append = {}
+        self._storage_write_appends = {}
+        self._storage_write_merging = set()
+        self._storage_write_cond = threading.Condition()
+        if params.get('write_sink', 'load_job') == 'storage_write':
+            if bigquery_storage_v1 is None:
+                logger.warning("⚠️ 未安装 google-cloud-bigquery-storage，回退到加载作业写入")
+            elif self.sync_source == 'binlog':
+                logger.warning("⚠️ binlog CDC 直接按事务MERGE/删除，不使用 Storage Write API")
+            else:
+                self.storage_write_sink = StorageWriteSink(params.get('storage_write_mode', 'committed'))
+                logger.info(f"✅ 增量数据使用 Storage Write API 写入 (模式: {self.storage_write_sink.mode})")
+
+    def _build_data_query(self, table_name: str, table_info: Dict, sync_mode: str,
+                          last_sync_time: datetime = None,
+                          current_sync_time: datetime = None,
+                          extra_condition: Tuple[str, tuple] = None,
+                          resume_after: tuple = None,
+                          watermark: Dict = None) -> Tuple[str, tuple]:
+        """构建数据查询SQL（增量或全量）
+        
+        extra_condition: 附加的 (条件SQL, 参数)，例如主键范围
+        resume_after: 增量断点 (已提交的最后时间戳, ...)，从该时间戳（含）继续，MERGE保证重复读取幂等
+        watermark: 上次增量的水位，有可用水位时从水位之后读取，不再按 lookback_minutes 回看
+        """
+        extra_sql, extra_params = extra_condition or ("", ())
+        
+        if sync_mode == 'INCREMENTAL' and last_sync_time and table_info['timestamp_field']:
+            # 增量查询
+            timestamp_field = table_info['timestamp_field']
+            upper_bound = self._incremental_upper_bound(table_info, current_sync_time)
+            lower_sql, lower_params = self._incremental_lower_bound(
+                table_info, last_sync_time, resume_after, watermark
+            )
+            logger.info(f"  🔍 增量查询: {lower_sql % lower_params} AND {timestamp_field} <= {upper_bound}")
+            
+            # 主键作为同一时间戳内的排序依据，水位和断点位置才是确定的
+            order_by = ", ".join([timestamp_field] + table_info['primary_keys'])
+            extra_clause = f"AND {extra_sql}" if extra_sql else ""
+            query = f"""
+                SELECT {self._select_list(table_info)} FROM {table_name} 
+                WHERE {lower_sql} 
+                AND {timestamp_field} <= %s
+                {extra_clause}
+                ORDER BY {order_by}
+            """
+            return query, lower_params + (upper_bound,) + extra_params
+        
+        # 全量查询
+        logger.info(f"  🔍 全量数据查询")
+        select_list = self._select_list(table_info)
+        if extra_sql:
+            return f"SELECT {select_list} FROM {table_name} WHERE {extra_sql}", extra_params
+        return f"SELECT {select_list} FROM {table_name}", ()
+    
+    @staticmethod
+    def _select_list(table_info: Dict) -> str:
+        """读取的字段列表：配置了字段投影时只读取选中的字段，被排除的大字段不经过网络和后续各阶段"""
+        columns = table_info.get('columns')
+        return ", ".join(f"`{column}`" for column in columns) if columns else "*"
+    
+    def _incremental_upper_bound(self, table_info: Dict, current_sync_time: datetime):
+        """增量读取上界：Unix时间戳字段用整数秒，否则用时间"""
+        field_type = table_info['field_types'].get(table_info['timestamp_field'], '').lower()
+        return int(self._source_unix_time(current_sync_time)) if 'int' in field_type else current_sync_time
+    
+    def _source_unix_time(self, source_time: datetime) -> float:
+        """源库会话时区的时间对应的Unix时间戳；尚未测得会话时区时按同步主机时区换算"""
+        if self._source_utc_offset is None:
+            return source_time.timestamp()
+        return (source_time - self._source_utc_offset).replace(tzinfo=timezone.utc).timestamp()
+    
+    def _incremental_lower_bound(self, table_info: Dict, last_sync_time: datetime,
+                                 resume_after: tuple = None, watermark: Dict = None) -> Tuple[str, tuple]:
+        """增量读取下界 (条件SQL, 参数)：断点 > 水位 > 固定回看窗口"""
+        timestamp_field = table_info['timestamp_field']
+        if resume_after:
+            return f"{timestamp_field} >= %s", (resume_after[0],)
+        if self._watermark_usable(watermark, table_info):
+            return self._build_watermark_predicate(table_info, watermark)
+        
+        # 没有水位（升级前的状态）：按固定窗口回看
+        safe_start_time = last_sync_time - timedelta(minutes=self.lookback_minutes)
+        if 'int' in table_info['field_types'].get(timestamp_field, '').lower():
+            return f"{timestamp_field} > %s", (int(self._source_unix_time(safe_start_time)),)
+        return f"{timestamp_field} > %s", (safe_start_time,)
+    
+    @staticmethod
+    def _watermark_usable(watermark: Optional[Dict], table_info: Dict) -> bool:
+        """水位与当前表结构一致（时间戳类型、主键列数）时才使用，否则回退到固定回看窗口"""
+        if not watermark:
+            return False
+        field_type = table_info['field_types'].get(table_info['timestamp_field'], '').lower()
+        if isinstance(watermark['ts'], datetime) == ('int' in field_type):
+            return False
+        return watermark['pk'] is None or len(watermark['pk']) == len(table_info['primary_keys'])
+    
+    def _build_watermark_predicate(self, table_info: Dict, watermark: Dict) -> Tuple[str, tuple]:
+        """水位条件：inclusive 时 ts >= 水位；有主键时 (ts, pk) > 水位；否则 ts > 水位"""
+        timestamp_field = table_info['timestamp_field']
+        if watermark['inclusive']:
+            return f"{timestamp_field} >= %s", (watermark['ts'],)
+        if watermark['pk']:
+            return self._build_keyset_predicate(
+                [timestamp_field] + table_info['primary_keys'], (watermark['ts'],) + tuple(watermark['pk'])
+            )
+        return f"{timestamp_field} > %s", (watermark['ts'],)
+    
+    def read_source_clock(self) -> Dict:
+        """读取源库时钟和当前提交延迟 {'now': 源库会话时区的当前时间, 'commit_lag': 秒或 None}
+        
+        提交延迟为最早一个写事务（持有锁或已修改行）已经持续的时间：这类事务之后提交的行，
+        时间戳不会早于 now - commit_lag，所以水位推进到这个位置之前不会漏数据。
+        没有 PROCESS 权限读取 INNODB_TRX 时返回 None，由调用方回退到 lookback_minutes。
+        """
+        conn = get_pooled_connection(self.connection_pool)
+        try:
+            cursor = conn.cursor()
+            # NOW(6) 是会话时区的时间，与 DATETIME 字段同一时区；不能经 Unix 时间戳按同步主机时区转换
+            cursor.execute("SELECT NOW(6), UTC_TIMESTAMP(6)")
+            now, utc_now = cursor.fetchone()
+            self._source_utc_offset = now - utc_now
+            
+            commit_lag = None
+            if self.adaptive_lookback and not self._innodb_trx_unavailable:
+                try:
+                    cursor.execute("""
+                        SELECT TIMESTAMPDIFF(MICROSECOND, MIN(trx_started), NOW(6))
+                        FROM information_schema.INNODB_TRX
+                        WHERE trx_lock_structs > 0 OR trx_rows_modified > 0
+                    """)
+                    lag_us = cursor.fetchone()[0]
+                    commit_lag = max(int(lag_us), 0) / 1e6 if lag_us is not None else 0.0
+                except mysql.connector.Error as e:
+                    self._innodb_trx_unavailable = True
+                    logger.warning(f"⚠️ 无法读取 INNODB_TRX（需要 PROCESS 权限），"
+                                   f"回退到固定回看窗口 {self.lookback_minutes} 分钟: {e}")
+            cursor.close()
+        finally:
+            conn.close()
+        
+        return {'now': now, 'commit_lag': commit_lag}
+    
+    def _record_high_mark(self, db_name: str, table_name: str, position: tuple):
+        """记录本次增量读取到的最大 (时间戳, 主键...)，并行范围读取取最大值"""
+        key = (db_name, table_name)
+        with self._pipeline_stats_lock:
+            current = self._high_marks.get(key)
+            if current is None or position > current:
+                self._high_marks[key] = position
+    
+    def _next_watermark(self, db_name: str, table_name: str, table_info: Dict,
+                        current_sync_time: datetime, source_clock: Optional[Dict]) -> Optional[Dict]:
+        """根据本次读取到的最大位置和安全点计算下次增量的水位
+        
+        安全点 = 源库时间 - 提交延迟 - watermark_safety_seconds：早于安全点的行都已提交且对本次读取可见。
+        读取到的最大时间戳早于安全点时，下次从 (ts, pk) 之后读取，不再重复读取任何行；
+        否则下次从安全点（含）开始，只重读提交延迟内的少量行。
+        断点续传的运行没有本次的时钟快照，按 lookback_minutes 计算安全点。
+        """
+        with self._pipeline_stats_lock:
+            high_mark = self._high_marks.pop((db_name, table_name), None)
+        
+        timestamp_field = table_info['timestamp_field']
+        if not timestamp_field:
+            return None
+        
+        commit_lag = source_clock['commit_lag'] if source_clock else None
+        if commit_lag is None:
+            commit_lag = self.lookback_minutes * 60
+            high_mark = high_mark if source_clock else None
+        
+        safe_time = current_sync_time - timedelta(seconds=commit_lag + self.watermark_safety_seconds)
+        if 'int' in table_info['field_types'].get(timestamp_field, '').lower():
+            safe_point = int(self._source_unix_time(safe_time))
+        else:
+            safe_point = safe_time.replace(microsecond=0)
+        
+        if high_mark is not None and type(high_mark[0]) is type(safe_point) and high_mark[0] < safe_point:
+            return {'ts': high_mark[0], 'pk': tuple(high_mark[1:]) or None, 'inclusive': False}
+        return {'ts': safe_point, 'pk': None, 'inclusive': True}
+    
+    def _prepare_rows(self, rows: List[Dict], db_name: str, table_info: Dict,
+                      sync_mode: str, current_sync_time: datetime):
+        """为一批原始行添加系统字段并标准化类型
+        
+        使用Parquet加载时直接按列标准化为Arrow记录批次，否则返回行字典列表。
+        """
+        if self.columnar_writer is not None:
+            return ColumnarNormalizer.normalize(rows, table_info, db_name, sync_mode, current_sync_time)
+        
+        if not rows:
+            return rows
+        
+        converter = self._get_row_converter(tuple(rows[0].keys()), table_info['field_types'])
+        logger.info(f"  🔄 编译转换器数据类型标准化: {len(rows)} 行")
+        return converter.convert(rows, db_name, current_sync_time.isoformat(), sync_mode)
+    
+    def _get_row_converter(self, column_names: Tuple[str, ...], field_types: Dict[str, str]) -> CompiledRowConverter:
+        """获取（或编译并缓存）列结构对应的行转换器，同结构的租户表共用"""
+        cache_key = (column_names, tuple(sorted(field_types.items())))
+        converter = self._row_converters.get(cache_key)
+        if converter is None:
+            converter = CompiledRowConverter(column_names, field_types)
+            self._row_converters[cache_key] = converter
+            for description in converter.describe():
+                logger.info(f"    🔄 {description}")
+        return converter
+    
+    def iter_table_data(self, db_name: str, table_name: str, table_info: Dict,
+                        sync_mode: str, last_sync_time: datetime = None,
+                        current_sync_time: datetime = None,
+                        extra_condition: Tuple[str, tuple] = None,
+                        resume_after: tuple = None,
+                        normalize: bool = True,
+                        watermark: Dict = None) -> Iterator[Tuple[List[Dict], Optional[tuple]]]:
+        """流式获取表数据，按 batch_size 分块产出 (数据块, 位置)
+        
+        使用非缓冲（服务端）游标逐块读取，内存占用只与 batch_size 有关，与表大小无关。
+        增量查询按 (时间戳, 主键) 排序，位置为本块最后一行的 (ts, pk...)，可作为断点和水位；
+        全量流式查询无法续传，位置为 None。
+        normalize=False 时产出原始行，由流水线的转换阶段标准化。
+        """
+        incremental = sync_mode == 'INCREMENTAL' and last_sync_time and table_info['timestamp_field']
+        conn = get_pooled_connection(self.connection_pool)
+        cursor = None
+        try:
+            cursor = conn.cursor(dictionary=True, buffered=False)
+            cursor.execute(f"USE {db_name}")
+            
+            query, query_params = self._build_data_query(
+                table_name, table_info, sync_mode, last_sync_time, current_sync_time,
+                extra_condition, resume_after, watermark
+            )
+            cursor.execute(query, query_params)
+            
+            total_rows = 0
+            chunk_count = 0
+            while True:
+                raw_rows = cursor.fetchmany(self.batch_size)
+                if not raw_rows:
+                    break
+                
+                total_rows += len(raw_rows)
+                chunk_count += 1
+                logger.info(f"  📥 获取数据块 #{chunk_count}: {len(raw_rows)} 行 (累计 {total_rows} 行)")
+                
+                # 标准化会改写行内容，先记录本块最后一行的原始时间戳和主键
+                position = None
+                if incremental:
+                    last_row = raw_rows[-1]
+                    position = tuple(last_row[field] for field in [table_info['timestamp_field']] + table_info['primary_keys'])
+                    self._record_high_mark(db_name, table_name, position)
+                
+                if normalize:
+                    raw_rows = self._prepare_rows(raw_rows, db_name, table_info, sync_mode, current_sync_time)
+                yield raw_rows, position
+            
+            if total_rows == 0:
+                logger.info(f"  ℹ️ 无数据返回")
+            
+        finally:
+            # 提前中止时丢弃未读结果，避免连接带着未读结果集归还连接池
+            try:
+                if conn.unread_result:
+                    conn.consume_results()
+                if cursor is not None:
+                    cursor.close()
+            except Exception as e:
+                logger.warning(f"⚠️ 关闭流式游标失败: {e}")
+            conn.close()
+    
+    def _build_keyset_predicate(self, primary_keys: List[str], last_key: tuple) -> Tuple[str, tuple]:
+        """构建键集分页条件 (pk1, pk2, ...) > (v1, v2, ...)
+        
+        展开为 OR 形式而不是行构造器比较，保证MySQL能按主键索引做范围扫描。
+        """
+        clauses = []
+        params = []
+        for i, pk in enumerate(primary_keys):
+            conditions = [f"{prev_pk} = %s" for prev_pk in primary_keys[:i]]
+            conditions.append(f"{pk} > %s")
+            clauses.append("(" + " AND ".join(conditions) + ")")
+            params.extend(last_key[:i + 1])
+        
+        return "(" + " OR ".join(clauses) + ")", tuple(params)
+    
+    def iter_table_data_keyset(self, db_name: str, table_name: str, table_info: Dict,
+                               current_sync_time: datetime,
+                               start_after: tuple = None,
+                               extra_condition: Tuple[str, tuple] = None,
+                               normalize: bool = True) -> Iterator[Tuple[List[Dict], tuple]]:
+        """按主键键集分页获取全量数据，分块产出 (数据块, 本块最后一行的主键)
+        
+        每页执行一条 WHERE pk > last_pk ORDER BY pk LIMIT n 的短查询，
+        不持有长事务；传入 start_after 可以从指定主键之后继续。
+        """
+        primary_keys = table_info['primary_keys']
+        order_by = ", ".join(primary_keys)
+        select_list = self._select_list(table_info)
+        last_key = tuple(start_after) if start_after else None
+        extra_sql, extra_params = extra_condition or ("", ())
+        
+        conn = get_pooled_connection(self.connection_pool)
+        try:
+            cursor = conn.cursor(dictionary=True)
+            cursor.execute(f"USE {db_name}")
+            
+            resume_info = f"，从主键 {last_key} 之后继续" if last_key else ""
+            logger.info(f"  🔍 键集分页全量查询: ORDER BY {order_by} LIMIT {self.batch_size}{resume_info}")
+            
+            total_rows = 0
+            page_count = 0
+            while True:
+                conditions = [extra_sql] if extra_sql else []
+                query_params = extra_params
+                if last_key is not None:
+                    predicate, keyset_params = self._build_keyset_predicate(primary_keys, last_key)
+                    conditions.append(predicate)
+                    query_params += keyset_params
+                
+                where_sql = f"WHERE {' AND '.join(conditions)} " if conditions else ""
+                query = f"SELECT {select_list} FROM {table_name} {where_sql}ORDER BY {order_by} LIMIT %s"
+                query_params += (self.batch_size,)
+                
+                cursor.execute(query, query_params)
+                raw_rows = cursor.fetchall()
+                # 每页结束即提交，释放一致性读视图，避免长事务
+                conn.commit()
+                
+                if not raw_rows:
+                    break
+                
+                # 标准化会改写行内容，先记录本页最后一行的原始主键值
+                last_key = tuple(raw_rows[-1][pk] for pk in primary_keys)
+                total_rows += len(raw_rows)
+                page_count += 1
+                logger.info(f"  📥 获取分页 #{page_count}: {len(raw_rows)} 行 (累计 {total_rows} 行, 最后主键 {last_key})")
+                
+                yield (self._prepare_rows(raw_rows, db_name, table_info, 'FULL', current_sync_time)
+                       if normalize else raw_rows), last_key
+                
+                if len(raw_rows) < self.batch_size:
+                    break
+            
             cursor.close()
             
-            if not rows:
+            if total_rows == 0:
                 logger.info(f"  ℹ️ 无数据返回")
-                return []
             
-            logger.info(f"  📥 获取数据: {len(rows)} 行")
+        finally:
+            conn.close()
+    
+    def iter_table_data_seek(self, db_name: str, table_name: str, table_info: Dict,
+                             last_sync_time: datetime, current_sync_time: datetime,
+                             start_after: tuple = None,
+                             extra_condition: Tuple[str, tuple] = None,
+                             normalize: bool = True,
+                             watermark: Dict = None) -> Iterator[Tuple[List[Dict], tuple]]:
+        """按 (时间戳, 主键) 元组游标分页获取增量数据，分块产出 (数据块, 本块最后一行的 (ts, pk...))
+        
+        每页执行 WHERE (ts, pk) > (last_ts, last_pk) AND ts <= 上界 ORDER BY ts, pk LIMIT n，
+        InnoDB 二级索引 (ts) 隐含主键，按该顺序分页是索引范围扫描。同一秒更新几百万行时
+        每页的内存和查询时间仍然有界；传入 start_after 可以从突发更新的中间继续。
+        """
+        timestamp_field = table_info['timestamp_field']
+        key_fields = [timestamp_field] + table_info['primary_keys']
+        order_by = ", ".join(key_fields)
+        select_list = self._select_list(table_info)
+        upper_bound = self._incremental_upper_bound(table_info, current_sync_time)
+        extra_sql, extra_params = extra_condition or ("", ())
+        
+        # 早期断点只记录了时间戳 (ts,)，从该时间戳（含）开始
+        last_key = tuple(start_after) if start_after and len(start_after) == len(key_fields) else None
+        lower_sql, lower_params = self._incremental_lower_bound(
+            table_info, last_sync_time, start_after if last_key is None else None, watermark
+        )
+        
+        conn = get_pooled_connection(self.connection_pool)
+        try:
+            cursor = conn.cursor(dictionary=True)
+            cursor.execute(f"USE {db_name}")
+            
+            resume_info = f"，从 {last_key} 之后继续" if last_key else ""
+            logger.info(f"  🔍 增量分页查询: {timestamp_field} <= {upper_bound} "
+                        f"ORDER BY {order_by} LIMIT {self.batch_size}{resume_info}")
             
-            # 批量添加系统字段
-            for row in rows:
-                row['tenant_id'] = db_name
-                row['sync_timestamp'] = current_sync_time.isoformat()
-                row['sync_mode'] = sync_mode
+            total_rows = 0
+            page_count = 0
+            while True:
+                if last_key is not None:
+                    page_sql, page_params = self._build_keyset_predicate(key_fields, last_key)
+                else:
+                    page_sql, page_params = lower_sql, lower_params
                 
-                # 基础类型处理
-                for key, value in row.items():
-                    if isinstance(value, datetime):
-                        row[key] = value.isoformat()
-                    elif isinstance(value, Decimal):
-                        row[key] = float(value)
+                conditions = [page_sql, f"{timestamp_field} <= %s"] + ([extra_sql] if extra_sql else [])
+                query = (f"SELECT {select_list} FROM {table_name} WHERE {' AND '.join(conditions)} "
+                         f"ORDER BY {order_by} LIMIT %s")
+                cursor.execute(query, page_params + (upper_bound,) + extra_params + (self.batch_size,))
+                raw_rows = cursor.fetchall()
+                # 每页结束即提交，释放一致性读视图，避免长事务
+                conn.commit()
+                
+                if not raw_rows:
+                    break
+                
+                # 标准化会改写行内容，先记录本页最后一行的原始时间戳和主键
+                last_key = tuple(raw_rows[-1][field] for field in key_fields)
+                self._record_high_mark(db_name, table_name, last_key)
+                total_rows += len(raw_rows)
+                page_count += 1
+                logger.info(f"  📥 获取分页 #{page_count}: {len(raw_rows)} 行 (累计 {total_rows} 行, 游标 {last_key})")
+                
+                yield (self._prepare_rows(raw_rows, db_name, table_info, 'INCREMENTAL', current_sync_time)
+                       if normalize else raw_rows), last_key
+                
+                if len(raw_rows) < self.batch_size:
+                    break
             
-            # 批量数据处理
-            rows = BatchDataProcessor.batch_normalize_data_types(rows, table_info['field_types'])
+            cursor.close()
             
-            return rows
+            if total_rows == 0:
+                logger.info(f"  ℹ️ 无数据返回")
             
         finally:
             conn.close()
     
-    def ensure_bq_table(self, table_name: str, schema: List[bigquery.SchemaField]):
-        """确保BigQuery表存在"""
-        dataset_id = self.params['bq_dataset']
+    def get_table_data(self, db_name: str, table_name: str, table_info: Dict, 
+                      sync_mode: str, last_sync_time: datetime = None, 
+                      current_sync_time: datetime = None) -> List[Dict]:
+        """获取表数据（增量或全量），一次性返回所有行"""
+        rows = []
+        for chunk, _ in self.iter_table_data(db_name, table_name, table_info, sync_mode,
+                                             last_sync_time, current_sync_time):
+            rows.extend(chunk if isinstance(chunk, list) else chunk.to_pylist())
+        return rows
+    
+    def ensure_bq_table(self, table_name: str, schema: List[bigquery.SchemaField]):
+        """确保BigQuery表存在（经表登记，每个进程每张表只访问一次BigQuery）"""
+        dataset_id = f"{self.params['bq_project']}.{self.params['bq_dataset']}"
+        
+        # 创建数据集（如果不存在）
+        self.table_registry.ensure_dataset(dataset_id)
+        
+        # 创建表（如果不存在）- 所有租户共享同一个表
+        def configure(table):
+            # 设置分区和聚簇
+            table.time_partitioning = bigquery.TimePartitioning(
+                type_=bigquery.TimePartitioningType.DAY,
+                field="sync_timestamp"
+            )
+            table.clustering_fields = ["tenant_id"]
+        
+        table_schema = self.table_registry.ensure_table(f"{dataset_id}.{table_name}", schema, configure)
+        missing_fields = [field.name for field in schema if field.name not in {f.name for f in table_schema}]
+        if missing_fields:
+            logger.warning(f"⚠️ BigQuery表 {table_name} 缺少字段: {missing_fields}")
+        existing_types = {f.name: f.field_type for f in table_schema}
+        for field in schema:
+            existing_type = existing_types.get(field.name)
+            if existing_type and existing_type != field.field_type:
+                # 如早期按 NUMERIC 建的超大 DECIMAL 列，需手动放宽类型
+                logger.warning(f"⚠️ BigQuery表 {table_name}.{field.name} 类型为 {existing_type}，源表映射为 {field.field_type}；"
+                               f"可执行 ALTER TABLE ... ALTER COLUMN {field.name} SET DATA TYPE {field.field_type}")
+    
+    def load_rows(self, rows: List[Dict], table_id: str,
+                  schema: List[bigquery.SchemaField], write_disposition: str):
+        """将行加载到BigQuery表：配置了列式写入器时上传Parquet，否则上传JSON"""
+        if self.columnar_writer is not None:
+            try:
+                record_batch = self.columnar_writer.build_record_batch(rows, schema)
+                parquet_file = self.columnar_writer.write_parquet(record_batch)
+            except (pa.ArrowException, TypeError, ValueError) as e:
+                logger.warning(f"⚠️ 构建Parquet失败，本批回退到 JSON 加载: {e}")
+            else:
+                logger.info(f"  📦 Parquet加载文件: {len(rows)} 行, {parquet_file.getbuffer().nbytes / 1024:.1f} KB")
+                job_config = bigquery.LoadJobConfig(
+                    source_format=bigquery.SourceFormat.PARQUET,
+                    write_disposition=write_disposition,
+                    schema=schema,
+                    # Parquet 的 decimal 默认只按 NUMERIC 解析，BIGNUMERIC 列需显式允许
+                    decimal_target_types=["NUMERIC", "BIGNUMERIC"]
+                )
+                job = self.bq_client.load_table_from_file(parquet_file, table_id, job_config=job_config)
+                job.result()
+                return job
+        
+        job_config = bigquery.LoadJobConfig(
+            write_disposition=write_disposition,
+            schema=schema
+        )
+        job = self.bq_client.load_table_from_json(rows, table_id, job_config=job_config)
+        job.result()
+        return job
+    
+    def write_to_bigquery(self, table_name: str, rows: List[Dict], 
+                         schema: List[bigquery.SchemaField], 
+                         primary_keys: List[str], sync_mode: str,
+                         replace_tenant_data: bool = True):
+        """写入BigQuery
+        
+        replace_tenant_data: 全量模式下是否先删除该租户的现有数据（分块写入时仅第一块需要）
+        """
+        if not rows:
+            return
+        
+        table_id = f"{self.params['bq_project']}.{self.params['bq_dataset']}.{table_name}"
+        
+        if sync_mode == 'FULL' and self.full_sync_strategy == 'staged_swap':
+            # 全量同步：写入该租户的暂存表，全部完成后由 swap_in_full_sync 原子替换
+            tenant_id = self._chunk_tenant_id(rows)
+            write_disposition = (bigquery.WriteDisposition.WRITE_TRUNCATE if replace_tenant_data
+                                 else bigquery.WriteDisposition.WRITE_APPEND)
+            self.load_rows(rows, self._full_staging_table_id(table_name, tenant_id), schema, write_disposition)
+            logger.info(f"✅ 全量写入暂存表: {len(rows)} 行 (租户: {tenant_id})")
+            
+        elif sync_mode == 'FULL':
+            # 全量同步：先删除该租户的数据，再插入新数据
+            tenant_id = self._chunk_tenant_id(rows)
+            if tenant_id and replace_tenant_data:
+                self.delete_tenant_data(table_name, tenant_id)
+            
+            # 插入新数据
+            self.load_rows(rows, table_id, schema, bigquery.WriteDisposition.WRITE_APPEND)
+            logger.info(f"✅ 全量写入完成: {len(rows)} 行 (租户: {tenant_id})")
+            
+        else:
+            # 增量同步：优先使用MERGE操作确保数据一致性
+            if primary_keys:
+                # 有主键：使用MERGE操作（支持插入和更新）
+                self._merge_data(table_id, rows, primary_keys, schema,
+                                 prune_column=self.merge_prune_columns.get(table_name))
+                logger.info(f"✅ MERGE操作完成: {len(rows)} 行")
+            else:
+                # 无主键：使用APPEND模式（仅追加）
+                self.load_rows(rows, table_id, schema, bigquery.WriteDisposition.WRITE_APPEND)
+                logger.info(f"✅ 增量追加完成: {len(rows)} 行（无主键，仅追加）")
+    
+    @staticmethod
+    def _chunk_tenant_id(rows) -> Optional[str]:
+        """获取数据块（行列表或Arrow记录批次）所属的租户"""
+        if not len(rows):
+            return None
+        if isinstance(rows, list):
+            return rows[0]['tenant_id']
+        return rows.column(rows.schema.get_field_index('tenant_id'))[0].as_py()
+    
+    def delete_tenant_data(self, table_name: str, tenant_id: str):
+        """删除该租户在BigQuery中的现有数据"""
+        table_id = f"{self.params['bq_project']}.{self.params['bq_dataset']}.{table_name}"
+        delete_sql = f"""
+        DELETE FROM `{table_id}` 
+        WHERE tenant_id = '{tenant_id}'
+        """
+        self._run_dml(table_id, delete_sql)
+        logger.info(f"🗑️ 已删除租户 {tenant_id} 的现有数据")
+    
+    def _full_staging_table_id(self, table_name: str, tenant_id: str) -> str:
+        """全量同步暂存表（在暂存数据集中，按表和租户固定命名，断点续传时继续追加）"""
+        return self.staging_tables.shared_table_id(f"{table_name}_full_{tenant_id}")
+    
+    def _full_staging_expires(self) -> datetime:
+        return datetime.now(timezone.utc) + timedelta(hours=self.full_staging_expiration_hours)
+    
+    def reset_full_sync_target(self, table_name: str, tenant_id: str, schema: List[bigquery.SchemaField]):
+        """全量写入前的准备：重建带过期时间的暂存表，或按 delete_append 方式删除租户数据"""
+        if self.full_sync_strategy != 'staged_swap':
+            self.delete_tenant_data(table_name, tenant_id)
+            return
+        
+        staging_table_id = self._full_staging_table_id(table_name, tenant_id)
+        self.bq_client.delete_table(staging_table_id, not_found_ok=True)
+        staging_table = bigquery.Table(staging_table_id, schema=schema)
+        # 进程崩溃且不再续传时由过期时间清理（覆盖暂存数据集的默认过期时间，留出续传的时间）
+        staging_table.expires = self._full_staging_expires()
+        self.bq_client.create_table(staging_table)
+        logger.info(f"🆕 创建全量暂存表: {staging_table_id} ({self.full_staging_expiration_hours} 小时后过期)")
+    
+    def renew_full_staging_table(self, table_name: str, tenant_id: str) -> bool:
+        """续传全量同步前延长暂存表的过期时间；暂存表已过期（不存在）时返回 False"""
+        staging_table_id = self._full_staging_table_id(table_name, tenant_id)
+        try:
+            staging_table = self.bq_client.get_table(staging_table_id)
+        except NotFound:
+            logger.warning(f"⚠️ 全量暂存表已不存在（可能已过期）: {staging_table_id}")
+            return False
+        staging_table.expires = self._full_staging_expires()
+        self.bq_client.update_table(staging_table, ["expires"])
+        return True
+    
+    def swap_in_full_sync(self, table_name: str, tenant_id: str, schema: List[bigquery.SchemaField]):
+        """在一个事务中用暂存表替换租户数据，读取方不会看到租户数据为空的中间状态
+        
+        所有租户共用一张按 sync_timestamp 分区的表，没有按租户划分的分区可以整体覆盖（WRITE_TRUNCATE），
+        因此替换仍是 DELETE + INSERT ... SELECT：比 delete_append 多一次暂存表加载和一次暂存表扫描，
+        换取替换的原子性。
+        """
+        table_id = f"{self.params['bq_project']}.{self.params['bq_dataset']}.{table_name}"
+        staging_table_id = self._full_staging_table_id(table_name, tenant_id)
+        columns = ", ".join(field.name for field in schema)
+        
+        swap_sql = f"""
+        BEGIN TRANSACTION;
+        DELETE FROM `{table_id}` WHERE tenant_id = {self._sql_literal(tenant_id, 'STRING')};
+        INSERT INTO `{table_id}` ({columns})
+        SELECT {columns} FROM `{staging_table_id}`;
+        COMMIT TRANSACTION;
+        """
+        
+        swap_job = self._run_dml(table_id, swap_sql)
+        self._log_query_job_stats("全量替换", swap_job)
+        logger.info(f"🔁 已用暂存表原子替换租户 {tenant_id} 的数据")
+    
+    def drop_full_staging_table(self, table_name: str, tenant_id: str):
+        """删除全量暂存表"""
+        self.bq_client.delete_table(self._full_staging_table_id(table_name, tenant_id), not_found_ok=True)
+    
+    def _table_write_lock(self, table_id: str) -> threading.Lock:
+        """获取表级DML锁：同一目标表的DELETE/MERGE串行执行，避免并发DML冲突"""
+        with self._table_write_locks_guard:
+            if table_id not in self._table_write_locks:
+                self._table_write_locks[table_id] = threading.Lock()
+            return self._table_write_locks[table_id]
+    
+    def _run_dml(self, table_id: str, sql: str):
+        """在表级DML锁内执行DML，遇到并发更新冲突时按指数退避重试，返回完成的查询作业
+        
+        表级锁只在本进程内有效：多个分片进程同时修改同一张表时，BigQuery 会以并发更新冲突
+        拒绝其中的DML。被拒绝的作业没有修改数据，重试是安全的。
+        """
+        with self._table_write_lock(table_id):
+            for attempt in range(self.max_retries + 1):
+                try:
+                    query_job = self.bq_client.query(sql)
+                    query_job.result()
+                    return query_job
+                except BadRequest as e:
+                    if attempt >= self.max_retries or 'concurrent update' not in str(e):
+                        raise
+                    # 加随机抖动，避免冲突的进程同时重试再次冲突
+                    delay = self.retry_delay * 2 ** attempt * random.uniform(1, 1.5)
+                    logger.warning(f"⚠️ {table_id} 并发DML冲突，{delay:.1f} 秒后重试 "
+                                   f"({attempt + 1}/{self.max_retries}): {e}")
+                    time.sleep(delay)
+    
+    def _merge_data(self, table_id: str, rows: List[Dict], primary_keys: List[str], schema: List[bigquery.SchemaField],
+                    dedupe: bool = False, dedupe_order_by: Optional[str] = None,
+                    prune_column: Optional[str] = None):
+        """使用MERGE操作更新数据
+        
+        dedupe: 暂存数据中同一 (tenant_id, 主键) 可能出现多次时只保留一行（按 dedupe_order_by 取最新）
+        prune_column: 写入后不再变化的业务列，按暂存数据的取值范围裁剪目标表扫描
+        """
+        # 上传数据到当前线程的暂存表（覆盖上一批），使用与目标表相同的schema
+        staging_table_id = self.staging_tables.table_id(table_id.split('.')[-1], 'merge')
+        self.load_rows(rows, staging_table_id, schema, bigquery.WriteDisposition.WRITE_TRUNCATE)
+        
+        source_sql = f"`{staging_table_id}`"
+        if dedupe:
+            partition_by = ", ".join(['tenant_id'] + primary_keys)
+            order_by = f"{dedupe_order_by} DESC" if dedupe_order_by else "sync_timestamp DESC"
+            source_sql = f"""(
+          SELECT * FROM `{staging_table_id}`
+          WHERE TRUE
+          QUALIFY ROW_NUMBER() OVER (PARTITION BY {partition_by} ORDER BY {order_by}) = 1
+        )"""
+
+        merge_sql = self._build_merge_sql(
+            table_id, source_sql, primary_keys, schema,
+            self._merge_prune_predicates(rows, schema, prune_column)
+        )
+
+        # 执行MERGE
+        query_job = self._run_dml(table_id, merge_sql)
+        self._log_query_job_stats("MERGE", query_job)
+        
+        logger.info(f"✅ MERGE操作完成: {len(rows)} 行")
+
+    @staticmethod
+    def _build_merge_sql(table_id: str, source_sql: str, primary_keys: List[str],
+                         schema: List[bigquery.SchemaField], extra_conditions: List[str] = ()) -> str:
+        """构建按 (主键, tenant_id) 匹配的MERGE语句，extra_conditions 为附加的ON条件"""
+        pk_conditions = " AND ".join([f"T.{pk} = S.{pk}" for pk in primary_keys])
+        pk_conditions += " AND T.tenant_id = S.tenant_id"
+        for predicate in extra_conditions:
+            pk_conditions += f" AND {predicate}"
+
+        # 获取所有字段（与目标表schema一致）
+        update_fields = []
+        insert_fields = []
+        insert_values = []
+
+        for field in [schema_field.name for schema_field in schema]:
+            # 所有字段都参与INSERT
+            insert_fields.append(field)
+            insert_values.append(f"S.{field}")
+
+            # UPDATE时排除主键字段（主键不能被更新）
+            if field not in primary_keys:
+                update_fields.append(f"{field} = S.{field}")
+
+        return f"""
+        MERGE `{table_id}` T
+        USING {source_sql} S
+        ON {pk_conditions}
+        WHEN MATCHED THEN
+          UPDATE SET {', '.join(update_fields)}
+        WHEN NOT MATCHED THEN
+          INSERT ({', '.join(insert_fields)})
+          VALUES ({', '.join(insert_values)})
+        """
+
+    @staticmethod
+    def _sql_literal(value, bq_type: str) -> Optional[str]:
+        """将Python值转为BigQuery SQL常量，不支持的类型返回 None"""
+        if bq_type == 'STRING':
+            escaped = str(value).replace('\\', '\\\\').replace("'", "\\'")
+            return f"'{escaped}'"
+        if bq_type in ('INT64', 'FLOAT64', 'NUMERIC'):
+            return repr(value) if isinstance(value, (int, float)) and not isinstance(value, bool) else None
+        if bq_type == 'BIGNUMERIC':
+            # 行路径为十进制字符串，列式路径为 Decimal
+            return f"BIGNUMERIC '{Decimal(value)}'" if isinstance(value, (str, Decimal, int)) and not isinstance(value, bool) else None
+        if bq_type == 'TIMESTAMP':
+            return f"TIMESTAMP '{value.isoformat()}'"
+        if bq_type == 'DATE':
+            return f"DATE '{value.isoformat()}'"
+        return None
+    
+    @staticmethod
+    def _column_values(rows, column: str) -> List:
+        """取数据块（行列表或Arrow记录批次）中一列的值"""
+        if isinstance(rows, list):
+            return [row.get(column) for row in rows]
+        return rows.column(rows.schema.get_field_index(column)).to_pylist()
+    
+    @staticmethod
+    def _comparable_value(value, bq_type: str):
+        """标准化后的时间值是ISO字符串，转回可比较的对象"""
+        if isinstance(value, str) and bq_type == 'TIMESTAMP':
+            return datetime.fromisoformat(value)
+        if isinstance(value, str) and bq_type == 'DATE':
+            return date.fromisoformat(value[:10])
+        if isinstance(value, datetime) and bq_type == 'DATE':
+            return value.date()
+        return value
+    
+    def _merge_prune_predicates(self, rows, schema: List[bigquery.SchemaField],
+                                prune_column: Optional[str] = None) -> List[str]:
+        """根据暂存数据生成目标表侧的裁剪条件
+        
+        - T.tenant_id IN (...)：目标表按 tenant_id 聚簇，只扫描本批涉及的租户
+        - prune_column 取值范围：仅适用于写入后不再变化的列（如 created_at/业务日期）
+        
+        不能使用暂存数据的 sync_timestamp 范围：目标表中的旧版本行是在以前的运行中写入的，
+        其 sync_timestamp（分区列）早于本批，按本批范围过滤会漏掉匹配行而重复插入。
+        """
+        predicates = []
+        
+        tenant_ids = sorted({value for value in self._column_values(rows, 'tenant_id') if value is not None})
+        if tenant_ids:
+            predicates.append(
+                f"T.tenant_id IN ({', '.join(self._sql_literal(tenant_id, 'STRING') for tenant_id in tenant_ids)})"
+            )
+        
+        if prune_column:
+            bq_type = next((field.field_type for field in schema if field.name == prune_column), None)
+            try:
+                values = [self._comparable_value(value, bq_type) for value in self._column_values(rows, prune_column)]
+                # 存在空值时目标表对应行同样为空，BETWEEN 会漏掉这些行
+                if bq_type is None or not values or any(value is None for value in values):
+                    raise ValueError("存在空值或列不存在")
+                low = self._sql_literal(min(values), bq_type)
+                high = self._sql_literal(max(values), bq_type)
+                if low is None or high is None:
+                    raise ValueError(f"不支持的类型 {bq_type}")
+                predicates.append(f"T.{prune_column} BETWEEN {low} AND {high}")
+            except (TypeError, ValueError) as e:
+                logger.warning(f"⚠️ 无法按 {prune_column} 裁剪MERGE: {e}")
+        
+        return predicates
+    
+    @staticmethod
+    def _log_query_job_stats(operation: str, query_job):
+        """输出查询作业的扫描字节数和槽时间"""
+        bytes_processed = getattr(query_job, 'total_bytes_processed', None)
+        bytes_billed = getattr(query_job, 'total_bytes_billed', None)
+        slot_millis = getattr(query_job, 'slot_millis', None)
+        if bytes_processed is None:
+            return
+        logger.info(f"  💰 {operation}扫描: {bytes_processed / 1024 / 1024:.2f} MB "
+                    f"(计费 {(bytes_billed or 0) / 1024 / 1024:.2f} MB, 槽时间 {(slot_millis or 0) / 1000:.1f} 秒)")
+    
+    def delete_rows_by_key(self, table_name: str, tenant_id: str,
+                           key_rows: List[Dict], table_info: Dict):
+        """按主键删除该租户在BigQuery中的行（用于CDC删除事件）"""
+        if not key_rows:
+            return
+        
+        primary_keys = table_info['primary_keys']
+        table_id = f"{self.params['bq_project']}.{self.params['bq_dataset']}.{table_name}"
+        key_schema = [field for field in table_info['schema'] if field.name in primary_keys or field.name == 'tenant_id']
+        
+        # 只保留主键列，并按目标表类型标准化
+        keys = []
+        for values in key_rows:
+            key = {}
+            for pk in primary_keys:
+                value = values.get(pk)
+                if isinstance(value, datetime):
+                    value = value.isoformat()
+                elif isinstance(value, Decimal):
+                    value = float(value)
+                key[pk] = value
+            keys.append(key)
+        keys = BatchDataProcessor.batch_normalize_data_types(
+            keys, {pk: table_info['field_types'][pk] for pk in primary_keys}
+        )
+        for key in keys:
+            key['tenant_id'] = tenant_id
+        
+        staging_table_id = self.staging_tables.table_id(table_name, 'delete')
+        self.load_rows(keys, staging_table_id, key_schema, bigquery.WriteDisposition.WRITE_TRUNCATE)
+        
+        pk_conditions = " AND ".join([f"T.{pk} = S.{pk}" for pk in primary_keys])
+        delete_sql = f"""
+        MERGE `{table_id}` T
+        USING `{staging_table_id}` S
+        ON {pk_conditions} AND T.tenant_id = S.tenant_id AND T.tenant_id = {self._sql_literal(tenant_id, 'STRING')}
+        WHEN MATCHED THEN
+          DELETE
+        """
+        
+        query_job = self._run_dml(table_id, delete_sql)
+        self._log_query_job_stats("按主键删除", query_job)
+        
+        logger.info(f"🗑️ 按主键删除完成: {len(keys)} 行 (租户: {tenant_id})")
+    
+    def _uses_tenant_batch(self, table_info: Dict, sync_mode: str) -> bool:
+        """有主键的增量同步在批量MERGE模式下先进入按表缓冲（使用 Storage Write API 时不缓冲）"""
+        return bool(self.tenant_batch_merge and sync_mode == 'INCREMENTAL' and table_info['primary_keys']
+                    and self.storage_write_sink is None)
+    
+    def _add_to_tenant_batch(self, table_name: str, chunk, table_info: Dict):
+        """将一个租户的数据块放入该表的批量MERGE缓冲，超过上限时立即写入"""
+        tenant_id = self._chunk_tenant_id(chunk)
+        with self._tenant_batches_lock:
+            batch = self._tenant_batches.setdefault(table_name, {
+                'table_info': table_info, 'chunks': [], 'rows': 0,
+                'row_tenants': set(), 'tenants': {}
+            })
+            batch['chunks'].append(chunk)
+            batch['rows'] += len(chunk)
+            batch['row_tenants'].add(tenant_id)
+            batch_full = batch['rows'] >= self.tenant_batch_max_rows
+        
+        if batch_full:
+            logger.info(f"🧺 批量MERGE缓冲已满 ({self.tenant_batch_max_rows} 行)，提前写入: {table_name}")
+            self.flush_tenant_batch(table_name)
+    
+    def _register_tenant_batch_status(self, db_name: str, table_name: str, table_info: Dict,
+                                      current_sync_time: datetime, records_synced: int,
+                                      watermark: Dict = None):
+        """租户数据已全部进入缓冲：同步状态推迟到包含这些数据的批量MERGE成功后更新"""
+        with self._tenant_batches_lock:
+            error = self._tenant_batch_failures.pop((db_name, table_name), None)
+            if error is None:
+                batch = self._tenant_batches.setdefault(table_name, {
+                    'table_info': table_info, 'chunks': [], 'rows': 0,
+                    'row_tenants': set(), 'tenants': {}
+                })
+                batch['tenants'][db_name] = (current_sync_time, records_synced, watermark)
+        
+        if error is not None:
+            raise RuntimeError(f"批量MERGE失败: {error}")
+        logger.info(f"⏳ {db_name}.{table_name} 已进入批量MERGE缓冲，同步状态将在MERGE成功后更新")
+    
+    @staticmethod
+    def _concat_chunks(chunks: List):
+        """合并多个数据块（行列表或Arrow记录批次）"""
+        if isinstance(chunks[0], list):
+            return [row for chunk in chunks for row in chunk]
+        return pa.Table.from_batches(chunks).combine_chunks().to_batches()[0]
+    
+    def flush_tenant_batch(self, table_name: str):
+        """将一张表缓冲的所有租户数据做一次暂存加载和一次MERGE，成功后更新各租户同步状态"""
+        with self._tenant_batches_lock:
+            batch = self._tenant_batches.pop(table_name, None)
+        if not batch:
+            return
+        
+        table_info = batch['table_info']
+        tenants = batch['tenants']
+        table_id = f"{self.params['bq_project']}.{self.params['bq_dataset']}.{table_name}"
         
-        # 创建数据集（如果不存在）
         try:
-            self.bq_client.get_dataset(dataset_id)
-        except:
-            dataset = bigquery.Dataset(f"{self.params['bq_project']}.{dataset_id}")
-            dataset.location = "US"
-            self.bq_client.create_dataset(dataset)
-            logger.info(f"🆕 创建数据集: {dataset_id}")
+            if batch['rows']:
+                logger.info(f"🧺 批量MERGE: {table_name} ({batch['rows']} 行, {len(batch['row_tenants'])} 个租户)")
+                self._merge_data(
+                    table_id, self._concat_chunks(batch['chunks']),
+                    table_info['primary_keys'], table_info['schema'],
+                    dedupe=True, dedupe_order_by=table_info['timestamp_field'],
+                    prune_column=self.merge_prune_columns.get(table_name)
+                )
+        except Exception as e:
+            logger.error(f"❌ 批量MERGE失败: {table_name}, 错误: {e}")
+            with self._tenant_batches_lock:
+                # 数据仍在读取中的租户在登记状态时失败
+                for tenant_id in batch['row_tenants'] - tenants.keys():
+                    self._tenant_batch_failures[(tenant_id, table_name)] = str(e)
+            for tenant_id, (sync_time, _, _) in tenants.items():
+                self.status_manager.update_sync_status(
+                    tenant_id, table_name, sync_time, 'INCREMENTAL', 0, 'FAILED', str(e)
+                )
+            raise
         
-        # 创建表（如果不存在）- 所有租户共享同一个表
-        table_id = f"{self.params['bq_project']}.{dataset_id}.{table_name}"
+        for tenant_id, (sync_time, records_synced, watermark) in tenants.items():
+            self.status_manager.update_sync_status(
+                tenant_id, table_name, sync_time, 'INCREMENTAL', records_synced, watermark=watermark
+            )
+    
+    def flush_tenant_batches(self) -> Dict[Tuple[str, str], str]:
+        """写入所有表的批量MERGE缓冲，返回失败的 {(租户, 表): 错误信息}"""
+        failures = {}
+        with self._tenant_batches_lock:
+            table_names = list(self._tenant_batches)
+        
+        for table_name in table_names:
+            with self._tenant_batches_lock:
+                batch = self._tenant_batches.get(table_name)
+                tenant_ids = list(batch['tenants']) if batch else []
+            try:
+                self.flush_tenant_batch(table_name)
+            except Exception as e:
+                for tenant_id in tenant_ids:
+                    failures[(tenant_id, table_name)] = str(e)
+        
+        return failures
+    
+    def stream_to_bigquery(self, table_name: str, chunks: Iterator[Tuple[List[Dict], Optional[tuple]]],
+                           table_info: Dict, sync_mode: str,
+                           replace_tenant_data: bool = True,
+                           on_chunk_committed: Callable[[int, Optional[tuple], int], None] = None,
+                           transform: Callable = None,
+                           stage_stats: Dict = None) -> int:
+        """通过 抽取 → 转换 → 加载 流水线将数据块写入BigQuery
+        
+        读取、标准化和写入分别在不同线程中重叠执行，阶段之间为有界队列；
+        写入按块顺序进行，同一时刻只有一个块在写入。
+        replace_tenant_data: 全量模式下第一块写入前是否删除该租户的现有数据
+        on_chunk_committed: 每块写入完成后按顺序回调 (块序号, 位置, 累计行数)，用于保存断点
+        transform: 原始行的标准化函数，为空时数据块已经标准化
+        stage_stats: 累加各阶段忙碌/等待时间的字典
+        """
+        pipeline = TablePipeline(self.transform_workers, self.pipeline_queue_size)
         try:
-            self.bq_client.get_table(table_id)
-        except:
-            table = bigquery.Table(table_id, schema=schema)
-            # 设置分区和聚簇
+            return pipeline.run(
+                chunks,
+                transform or (lambda rows: rows),
+                lambda chunk, first_chunk: self._write_chunk(
+                    table_name, chunk, table_info, sync_mode, first_chunk and replace_tenant_data
+                ),
+                on_chunk_committed
+            )
+        finally:
+            logger.info(f"  📊 流水线阶段耗时: {TablePipeline.format_stage_stats(pipeline.stage_stats)}")
+            if stage_stats is not None:
+                with self._pipeline_stats_lock:
+                    TablePipeline.merge_stage_stats(stage_stats, pipeline.stage_stats)
+    
+    def _write_chunk(self, table_name: str, chunk: List[Dict], table_info: Dict,
+                     sync_mode: str, first_chunk: bool) -> int:
+        """写入单个数据块，返回写入行数（批量MERGE模式下为放入缓冲的行数）"""
+        if self._uses_tenant_batch(table_info, sync_mode):
+            self._add_to_tenant_batch(table_name, chunk, table_info)
+            return len(chunk)
+        if self._uses_storage_write(sync_mode):
+            return self.append_via_storage_write(table_name, chunk, table_info)
+        
+        self.write_to_bigquery(
+            table_name, chunk, table_info['schema'],
+            table_info['primary_keys'], sync_mode,
+            replace_tenant_data=first_chunk
+        )
+        return len(chunk)
+
+    def _uses_storage_write(self, sync_mode: str) -> bool:
+        """增量数据块是否通过 Storage Write API 写入"""
+        return self.storage_write_sink is not None and sync_mode == 'INCREMENTAL'
+
+    def _changes_table_id(self, table_name: str) -> str:
+        """Storage Write 变更表：有主键的表的增量数据先追加到这里，再延迟MERGE到目标表"""
+        return f"{self.params['bq_project']}.{self.params['bq_dataset']}.{table_name}_changes"
+
+    @staticmethod
+    def _changes_table_schema(schema: List[bigquery.SchemaField]) -> List[bigquery.SchemaField]:
+        return list(schema) + [bigquery.SchemaField('_change_time', 'TIMESTAMP')]
+
+    def ensure_changes_table(self, table_name: str, schema: List[bigquery.SchemaField]):
+        """确保变更表存在：按 _change_time 分区，分区保留7天（远大于MERGE间隔）"""
+        def configure(table):
             table.time_partitioning = bigquery.TimePartitioning(
                 type_=bigquery.TimePartitioningType.DAY,
-                field="sync_timestamp"
+                field="_change_time",
+                expiration_ms=7 * 24 * 3600 * 1000
             )
             table.clustering_fields = ["tenant_id"]
-            table = self.bq_client.create_table(table)
-            logger.info(f"🆕 创建表: {table_name} (多租户共享)")
-    
-    def write_to_bigquery(self, table_name: str, rows: List[Dict], 
-                         schema: List[bigquery.SchemaField], 
-                         primary_keys: List[str], sync_mode: str):
-        """写入BigQuery"""
-        if not rows:
-            return
         
+        self.table_registry.ensure_table(self._changes_table_id(table_name), self._changes_table_schema(schema), configure)
+
+    def append_via_storage_write(self, table_name: str, chunk, table_info: Dict) -> int:
+        """通过 Storage Write API 写入增量数据块：无主键直接追加到目标表，有主键追加到变更表"""
+        if not table_info['primary_keys']:
+            table_id = f"{self.params['bq_project']}.{self.params['bq_dataset']}.{table_name}"
+            written = self.storage_write_sink.append(table_id, chunk, table_info['schema'])
+            logger.info(f"✅ Storage Write 追加完成: {written} 行（无主键，仅追加）")
+            return written
+
+        self.ensure_changes_table(table_name, table_info['schema'])
+
+        # 延迟MERGE确定合并水位时，等待所有已取得变更时间的追加完成
+        with self._storage_write_cond:
+            while table_name in self._storage_write_merging:
+                self._storage_write_cond.wait()
+            self._storage_write_appends[table_name] = self._storage_write_appends.get(table_name, 0) + 1
+            change_time = datetime.now(timezone.utc)
+        try:
+            rows = chunk if isinstance(chunk, list) else chunk.to_pylist()
+            written = self.storage_write_sink.append(
+                self._changes_table_id(table_name),
+                [dict(row, _change_time=change_time) for row in rows],
+                self._changes_table_schema(table_info['schema'])
+            )
+        finally:
+            with self._storage_write_cond:
+                self._storage_write_appends[table_name] -= 1
+                self._storage_write_cond.notify_all()
+
+        with self._storage_write_cond:
+            mark_pending = table_name not in self._storage_write_pending_marked
+            self._storage_write_pending_marked.add(table_name)
+            self._storage_write_tables[table_name] = table_info
+            self._storage_write_last_append[table_name] = change_time
+        if mark_pending:
+            # 持久化"有待合并变更"，进程中断后下次运行仍会合并
+            position = self.status_manager.get_cdc_position(self._storage_write_stream_id(table_name)) or {}
+            self.status_manager.save_cdc_position(self._storage_write_stream_id(table_name), dict(position, pending=True))
+
+        logger.info(f"✅ Storage Write 追加到变更表: {written} 行（等待延迟MERGE）")
+        return written
+
+    @staticmethod
+    def _storage_write_stream_id(table_name: str) -> str:
+        return f"storage_write:{table_name}"
+
+    def storage_write_pending(self, table_name: str) -> bool:
+        """变更表中是否有尚未MERGE到目标表的数据"""
+        position = self.status_manager.get_cdc_position(self._storage_write_stream_id(table_name)) or {}
+        with self._storage_write_cond:
+            last_append = self._storage_write_last_append.get(table_name)
+        if last_append and (not position.get('merged_until') or
+                            last_append > datetime.fromisoformat(position['merged_until'])):
+            return True
+        return bool(position.get('pending'))
+
+    def merge_storage_write_changes(self, table_name: str, table_info: Dict, force: bool = False) -> bool:
+        """将变更表中上次合并水位之后的数据去重后MERGE到目标表
+
+        未到 storage_write_merge_interval 时跳过（force=True 除外）。返回是否执行了MERGE。
+        MERGE失败时水位不前进，下次运行重新合并（MERGE幂等）。
+        """
+        stream_id = self._storage_write_stream_id(table_name)
+        if not self.storage_write_pending(table_name):
+            return False
+        position = self.status_manager.get_cdc_position(stream_id) or {}
+        merged_at = position.get('merged_at')
+        if not force and merged_at and datetime.now() - datetime.fromisoformat(merged_at) < self.storage_write_merge_interval:
+            logger.info(f"⏳ 变更表未到合并时间: {table_name} (上次合并: {merged_at})")
+            return False
+
+        # 确定合并水位：阻止新追加取得变更时间，等待进行中的追加完成
+        with self._storage_write_cond:
+            self._storage_write_merging.add(table_name)
+            while self._storage_write_appends.get(table_name):
+                self._storage_write_cond.wait()
+            merged_until = datetime.now(timezone.utc)
+            self._storage_write_merging.discard(table_name)
+            self._storage_write_cond.notify_all()
+
+        time_range = f"_change_time <= TIMESTAMP '{merged_until.isoformat()}'"
+        if position.get('merged_until'):
+            time_range = f"_change_time > TIMESTAMP '{position['merged_until']}' AND {time_range}"
+        partition_by = ", ".join(['tenant_id'] + table_info['primary_keys'])
+        source_sql = f"""(
+          SELECT * EXCEPT(_change_time) FROM `{self._changes_table_id(table_name)}`
+          WHERE {time_range}
+          QUALIFY ROW_NUMBER() OVER (PARTITION BY {partition_by} ORDER BY _change_time DESC) = 1
+        )"""
+
         table_id = f"{self.params['bq_project']}.{self.params['bq_dataset']}.{table_name}"
+        merge_sql = self._build_merge_sql(table_id, source_sql, table_info['primary_keys'], table_info['schema'])
+        query_job = self._run_dml(table_id, merge_sql)
+        self._log_query_job_stats("变更表MERGE", query_job)
+
+        with self._storage_write_cond:
+            last_append = self._storage_write_last_append.get(table_name)
+            pending = bool(last_append and last_append > merged_until)
+            if not pending:
+                self._storage_write_pending_marked.discard(table_name)
+            self.status_manager.save_cdc_position(stream_id, {
+                'merged_until': merged_until.isoformat(),
+                'merged_at': datetime.now().isoformat(),
+                'pending': pending
+            })
+        logger.info(f"🔀 变更表已合并到目标表: {table_name} (水位: {merged_until.isoformat()})")
+        return True
+
+    def merge_storage_write_tables(self, db_names: List[str], table_names: List[str]):
+        """运行结束时对到期的变更表执行延迟MERGE（失败只记录，数据保留在变更表中）"""
+        if self.storage_write_sink is None:
+            return
+        for table_name in table_names:
+            # 分片模式下所有进程的任务结束后才会到这里，每张表只由一个进程执行
+            if (self.shard_coordinator is not None
+                    and not self.shard_coordinator.acquire_once(f"storage_write_merge:{table_name}")):
+                continue
+            try:
+                with self._storage_write_cond:
+                    table_info = self._storage_write_tables.get(table_name)
+                if table_info is None:
+                    if not self.storage_write_pending(table_name):
+                        continue
+                    table_info = self.table_analyzer.get_table_info(db_names[0], table_name)
+                self.merge_storage_write_changes(table_name, table_info)
+            except Exception as e:
+                logger.error(f"❌ 变更表MERGE失败: {table_name}, 错误: {e}（下次运行重试）")
+
+    def _open_table_reader(self, db_name: str, table_name: str, table_info: Dict,
+                           sync_mode: str, last_sync_time: datetime = None,
+                           current_sync_time: datetime = None,
+                           extra_condition: Tuple[str, tuple] = None,
+                           start_position: tuple = None,
+                           normalize: bool = True,
+                           watermark: Dict = None) -> Iterator[Tuple[List[Dict], Optional[tuple]]]:
+        """根据同步模式选择数据读取方式，start_position 为断点位置，watermark 为增量水位"""
+        if self._uses_keyset_reader(table_info, sync_mode):
+            # 有主键：按主键键集分页，短查询、可续传
+            return self.iter_table_data_keyset(
+                db_name, table_name, table_info, current_sync_time,
+                start_after=start_position, extra_condition=extra_condition,
+                normalize=normalize
+            )
         
-        if sync_mode == 'FULL':
-            # 全量同步：先删除该租户的数据，再插入新数据
-            tenant_id = rows[0]['tenant_id'] if rows else None
-            if tenant_id:
-                # 删除该租户的现有数据
-                delete_sql = f"""
-                DELETE FROM `{table_id}` 
-                WHERE tenant_id = '{tenant_id}'
-                """
-                delete_job = self.bq_client.query(delete_sql)
-                delete_job.result()
-                logger.info(f"🗑️ 已删除租户 {tenant_id} 的现有数据")
-            
-            # 插入新数据
-            job_config = bigquery.LoadJobConfig(
-                write_disposition=bigquery.WriteDisposition.WRITE_APPEND,
-                schema=schema
+        if self._uses_seek_reader(table_info, sync_mode, last_sync_time):
+            # 有主键的增量：按 (时间戳, 主键) 游标分页，突发更新也不会返回超大结果集
+            return self.iter_table_data_seek(
+                db_name, table_name, table_info, last_sync_time, current_sync_time,
+                start_after=start_position, extra_condition=extra_condition,
+                normalize=normalize, watermark=watermark
             )
-            job = self.bq_client.load_table_from_json(rows, table_id, job_config=job_config)
-            job.result()
-            logger.info(f"✅ 全量写入完成: {len(rows)} 行 (租户: {tenant_id})")
-            
-        else:
-            # 增量同步：优先使用MERGE操作确保数据一致性
-            if primary_keys:
-                # 有主键：使用MERGE操作（支持插入和更新）
-                self._merge_data(table_id, rows, primary_keys, schema)
-                logger.info(f"✅ MERGE操作完成: {len(rows)} 行")
-            else:
-                # 无主键：使用APPEND模式（仅追加）
-                job_config = bigquery.LoadJobConfig(
-                    write_disposition=bigquery.WriteDisposition.WRITE_APPEND,
-                    schema=schema
-                )
-                job = self.bq_client.load_table_from_json(rows, table_id, job_config=job_config)
-                job.result()
-                logger.info(f"✅ 增量追加完成: {len(rows)} 行（无主键，仅追加）")
-    
-    def _merge_data(self, table_id: str, rows: List[Dict], primary_keys: List[str], schema: List[bigquery.SchemaField]):
-        """使用MERGE操作更新数据"""
-        # 创建临时表
-        temp_table_id = f"{table_id}_temp_{int(time.time())}"
         
-        # 上传数据到临时表，使用与目标表相同的schema
-        job_config = bigquery.LoadJobConfig(
-            write_disposition=bigquery.WriteDisposition.WRITE_TRUNCATE,
-            schema=schema
+        return self.iter_table_data(
+            db_name, table_name, table_info, sync_mode,
+            last_sync_time, current_sync_time, extra_condition,
+            resume_after=start_position, normalize=normalize, watermark=watermark
         )
-        job = self.bq_client.load_table_from_json(rows, temp_table_id, job_config=job_config)
-        job.result()
+    
+    def _uses_keyset_reader(self, table_info: Dict, sync_mode: str) -> bool:
+        """全量同步且有主键时使用键集分页读取"""
+        return sync_mode == 'FULL' and bool(table_info['primary_keys']) and self.keyset_full_sync
+    
+    def _uses_seek_reader(self, table_info: Dict, sync_mode: str, last_sync_time: datetime = None) -> bool:
+        """增量同步且有主键和时间戳字段时使用 (时间戳, 主键) 游标分页读取"""
+        return (sync_mode == 'INCREMENTAL' and bool(last_sync_time) and bool(table_info['timestamp_field'])
+                and bool(table_info['primary_keys']) and self.seek_incremental)
+    
+    def _checkpoint_resumable(self, checkpoint: Dict, table_info: Dict) -> bool:
+        """断点是否可以续传：增量需要时间戳字段，全量需要按主键键集分页读取"""
+        if checkpoint['sync_mode'] == 'INCREMENTAL':
+            return bool(table_info['timestamp_field'] and checkpoint['last_sync_time'])
         
-        # 构建MERGE SQL
-        pk_conditions = " AND ".join([f"T.{pk} = S.{pk}" for pk in primary_keys])
-        pk_conditions += " AND T.tenant_id = S.tenant_id"
+        # 全量流式读取没有可续传的位置，只能重新开始
+        return self._uses_keyset_reader(table_info, 'FULL')
+    
+    def _row_filter(self, db_name: str, table_name: str, table_info: Dict) -> Optional[Tuple[str, tuple]]:
+        """该租户该表的行过滤条件 (条件SQL, 参数)，无过滤时返回 None"""
+        predicates = [predicate for predicate in (self.table_filters.get(table_name),
+                                                  self.tenant_table_filters.get(db_name, {}).get(table_name))
+                      if predicate]
+        if not predicates:
+            return None
+        return self._combine_conditions(*(TableAnalyzer.validate_filter_predicate(predicate, table_info['field_types'])
+                                           for predicate in predicates))
+    
+    @staticmethod
+    def _combine_conditions(*conditions: Optional[Tuple[str, tuple]]) -> Optional[Tuple[str, tuple]]:
+        """合并多个 (条件SQL, 参数)，忽略 None"""
+        conditions = [condition for condition in conditions if condition]
+        if not conditions:
+            return None
+        return " AND ".join(sql for sql, _ in conditions), tuple(param for _, params in conditions for param in params)
+    
+    def _sync_segment(self, db_name: str, table_name: str, table_info: Dict,
+                      sync_mode: str, segment_id: str, checkpoint: Dict,
+                      last_sync_time: datetime = None, current_sync_time: datetime = None,
+                      extra_condition: Tuple[str, tuple] = None,
+                      replace_tenant_data: bool = True,
+                      watermark: Dict = None) -> int:
+        """同步一个分段（整表或一个主键范围），每提交一块就保存断点，返回该分段累计写入行数"""
+        segment = checkpoint['segments'].get(segment_id) if checkpoint else None
+        if segment and segment['done']:
+            logger.info(f"  ⏭️ 分段 {segment_id} 已在上次运行中完成，跳过")
+            return segment['records_synced']
         
-        # 获取所有字段（除了主键和系统字段）
-        sample_row = rows[0]
-        update_fields = []
-        insert_fields = []
-        insert_values = []
+        start_position = segment['position'] if segment else None
+        base_chunk_seq = segment['chunk_seq'] if segment else 0
+        base_records = segment['records_synced'] if segment else 0
+        if segment:
+            logger.info(f"  ♻️ 分段 {segment_id} 从断点继续: 第 {base_chunk_seq} 块之后, 位置 {start_position}")
         
-        for field in sample_row.keys():
-            # 所有字段都参与INSERT
-            insert_fields.append(field)
-            insert_values.append(f"S.{field}")
-            
-            # UPDATE时排除主键字段（主键不能被更新）
-            if field not in primary_keys:
-                update_fields.append(f"{field} = S.{field}")
+        def save_checkpoint(chunk_seq: int, position: Optional[tuple], records: int, done: bool = False):
+            self.status_manager.save_checkpoint(
+                db_name, table_name, sync_mode, current_sync_time, last_sync_time,
+                segment_id=segment_id, position=position if position is not None else start_position,
+                chunk_seq=base_chunk_seq + chunk_seq, records_synced=base_records + records,
+                done=done
+            )
         
-        merge_sql = f"""
-        MERGE `{table_id}` T
-        USING `{temp_table_id}` S
-        ON {pk_conditions}
-        WHEN MATCHED THEN
-          UPDATE SET {', '.join(update_fields)}
-        WHEN NOT MATCHED THEN
-          INSERT ({', '.join(insert_fields)})
-          VALUES ({', '.join(insert_values)})
+        chunks = self._open_table_reader(
+            db_name, table_name, table_info, sync_mode,
+            last_sync_time, current_sync_time, extra_condition, start_position,
+            normalize=False, watermark=watermark
+        )
+        with self._pipeline_stats_lock:
+            stage_stats = self._pipeline_stats.setdefault((db_name, table_name), {})
+        # 批量MERGE模式下数据块只进入内存缓冲，不能作为断点
+        checkpointing = not self._uses_tenant_batch(table_info, sync_mode)
+        records = self.stream_to_bigquery(
+            table_name, chunks, table_info, sync_mode,
+            replace_tenant_data=replace_tenant_data and not segment,
+            on_chunk_committed=save_checkpoint if checkpointing else None,
+            transform=lambda rows: self._prepare_rows(rows, db_name, table_info, sync_mode, current_sync_time),
+            stage_stats=stage_stats
+        )
+        return base_records + records
+    
+    def sync_ranges_parallel(self, db_name: str, table_name: str, table_info: Dict,
+                             sync_mode: str, key_ranges: List[Tuple],
+                             last_sync_time: datetime = None,
+                             current_sync_time: datetime = None,
+                             checkpoint: Dict = None,
+                             watermark: Dict = None,
+                             row_filter: Tuple[str, tuple] = None) -> int:
+        """按主键范围并行同步单个大表，每个并行读取的范围独占一个连接池连接
+        
+        表任务自身的连接读取一个范围，其余并行度从共享的空闲连接预算中借用，
+        预算不足时剩余范围排队串行读取。每个范围是一个断点分段 (range-N)，续传时已完成的范围直接跳过。
         """
+        split_key = table_info['primary_keys'][0]
         
-        # 执行MERGE
-        query_job = self.bq_client.query(merge_sql)
-        query_job.result()
+        if not checkpoint:
+            # 全量模式：所有范围写入前统一清空一次暂存表（或删除租户数据）
+            if sync_mode == 'FULL':
+                self.reset_full_sync_target(table_name, db_name, table_info['schema'])
+            
+            # 记录切分结果，续传时沿用同一组范围
+            self.status_manager.save_checkpoint(
+                db_name, table_name, sync_mode, current_sync_time, last_sync_time,
+                key_ranges=key_ranges
+            )
+        
+        def sync_range(range_index: int, key_range: Tuple) -> int:
+            segment_id = f"range-{range_index}"
+            range_condition = self._combine_conditions(
+                PKRangeSplitter.build_range_condition(split_key, key_range), row_filter
+            )
+            records = self._sync_segment(
+                db_name, table_name, table_info, sync_mode, segment_id, checkpoint,
+                last_sync_time, current_sync_time, range_condition,
+                replace_tenant_data=False, watermark=watermark
+            )
+            self.status_manager.save_checkpoint(
+                db_name, table_name, sync_mode, current_sync_time, last_sync_time,
+                segment_id=segment_id, records_synced=records, done=True
+            )
+            logger.info(f"  ✅ 范围同步完成: {split_key} ∈ [{key_range[0]}, {key_range[1]}) {records} 行")
+            return records
         
-        # 删除临时表
-        self.bq_client.delete_table(temp_table_id)
+        borrowed = 0
+        while borrowed < len(key_ranges) - 1 and self._range_reader_slots.acquire(blocking=False):
+            borrowed += 1
+        if borrowed < len(key_ranges) - 1:
+            logger.info(f"  🔗 空闲连接不足: {len(key_ranges)} 个范围使用 {borrowed + 1} 个并行读取")
         
-        logger.info(f"✅ MERGE操作完成: {len(rows)} 行")
+        total_records = 0
+        try:
+            with ThreadPoolExecutor(max_workers=borrowed + 1) as executor:
+                futures = [executor.submit(sync_range, i, key_range) for i, key_range in enumerate(key_ranges)]
+                for future in as_completed(futures):
+                    total_records += future.result()
+        finally:
+            for _ in range(borrowed):
+                self._range_reader_slots.release()
+        
+        return total_records
     
     def sync_table(self, db_name: str, table_name: str, force_full: bool = False) -> Dict:
         """同步单个表"""
@@ -638,6 +4255,11 @@ class OptimizedIncrementalSyncer:
             'start_time': current_sync_time
         }
         
+        with self._pipeline_stats_lock:
+            self._pipeline_stats.pop((db_name, table_name), None)
+        with self._tenant_batches_lock:
+            self._tenant_batch_failures.pop((db_name, table_name), None)
+        
         try:
             # 获取表信息（使用缓存）
             table_info = self.table_analyzer.get_table_info(db_name, table_name)
@@ -645,45 +4267,110 @@ class OptimizedIncrementalSyncer:
             # 确保BigQuery表存在
             self.ensure_bq_table(table_name, table_info['schema'])
             
+            # 检查上次未完成的断点
+            checkpoint = self.status_manager.get_checkpoint(db_name, table_name)
+            if checkpoint and ((force_full and checkpoint['sync_mode'] != 'FULL') or
+                               not self._checkpoint_resumable(checkpoint, table_info) or
+                               (checkpoint['sync_mode'] == 'FULL' and self.full_sync_strategy == 'staged_swap'
+                                and not self.renew_full_staging_table(table_name, db_name))):
+                logger.info(f"🗑️ 丢弃无法续传的断点: {checkpoint['sync_mode']} @ {checkpoint['run_started_at']}")
+                self.status_manager.clear_checkpoint(db_name, table_name)
+                checkpoint = None
+            
             # 决定同步模式
             last_sync_time = None if force_full else self.status_manager.get_last_sync_time(db_name, table_name)
             
-            if last_sync_time and table_info['timestamp_field'] and not force_full:
+            if checkpoint:
+                # 断点续传：沿用中断那次运行的模式、时间窗口和开始时间
+                sync_stats['sync_mode'] = checkpoint['sync_mode']
+                last_sync_time = checkpoint['last_sync_time']
+                current_sync_time = checkpoint['run_started_at']
+                completed_chunks = sum(segment['chunk_seq'] for segment in checkpoint['segments'].values())
+                logger.info(f"♻️ 从断点继续{checkpoint['sync_mode']}同步: 已提交 {completed_chunks} 块, 开始于 {current_sync_time}")
+            elif last_sync_time and table_info['timestamp_field'] and not force_full:
                 # 增量同步
                 sync_stats['sync_mode'] = 'INCREMENTAL'
                 logger.info(f"🔄 执行增量同步，上次同步时间: {last_sync_time}")
-                
-                rows = self.get_table_data(
-                    db_name, table_name, table_info, 'INCREMENTAL',
-                    last_sync_time, current_sync_time
-                )
             else:
                 # 全量同步
                 sync_stats['sync_mode'] = 'FULL'
                 reason = "强制全量" if force_full else ("首次同步" if not last_sync_time else "无时间戳字段")
                 logger.info(f"🔄 执行全量同步，原因: {reason}")
-                
-                rows = self.get_table_data(
-                    db_name, table_name, table_info, 'FULL',
-                    current_sync_time=current_sync_time
-                )
+                last_sync_time = None
             
-            # 写入BigQuery
-            if rows:
-                self.write_to_bigquery(
-                    table_name, rows, table_info['schema'], 
-                    table_info['primary_keys'], sync_stats['sync_mode']
+            # 新的运行以源库时钟为同步时间，避免同步主机与源库时钟偏差导致漏读
+            source_clock = None
+            if table_info['timestamp_field'] and not checkpoint:
+                source_clock = self.read_source_clock()
+                current_sync_time = source_clock['now']
+                lag_info = f"{source_clock['commit_lag']:.1f}s" if source_clock['commit_lag'] is not None else "未知"
+                logger.info(f"⏱️ 源库时间: {current_sync_time}, 提交延迟: {lag_info}")
+            watermark = (self.status_manager.get_watermark(db_name, table_name)
+                         if sync_stats['sync_mode'] == 'INCREMENTAL' else None)
+            with self._pipeline_stats_lock:
+                self._high_marks.pop((db_name, table_name), None)
+            
+            row_filter = self._row_filter(db_name, table_name, table_info)
+            if row_filter:
+                logger.info(f"🔎 行过滤条件: {row_filter[0]} 参数: {row_filter[1]}")
+            
+            # 全量替换前先合并变更表：否则延迟MERGE会用旧的变更覆盖全量数据
+            if (sync_stats['sync_mode'] == 'FULL' and self.storage_write_sink is not None
+                    and table_info['primary_keys'] and self.storage_write_pending(table_name)):
+                self.merge_storage_write_changes(table_name, table_info, force=True)
+            
+            # 大表按主键范围切分并行同步，否则单路流式写入（边读边写）
+            if checkpoint:
+                key_ranges = checkpoint['key_ranges'] or []
+            elif self._uses_tenant_batch(table_info, sync_stats['sync_mode']):
+                key_ranges = []
+            else:
+                key_ranges = self.range_splitter.split(
+                    db_name, table_name, table_info,
+                    self.range_split_parallelism, self.range_split_min_rows
                 )
-                sync_stats['records_synced'] = len(rows)
-                logger.info(f"✅ 同步完成: {len(rows)} 行数据")
+            if len(key_ranges) > 1:
+                records_synced = self.sync_ranges_parallel(
+                    db_name, table_name, table_info, sync_stats['sync_mode'],
+                    key_ranges, last_sync_time, current_sync_time, checkpoint, watermark, row_filter
+                )
+            else:
+                if (not checkpoint and sync_stats['sync_mode'] == 'FULL'
+                        and self.full_sync_strategy == 'staged_swap'):
+                    self.reset_full_sync_target(table_name, db_name, table_info['schema'])
+                records_synced = self._sync_segment(
+                    db_name, table_name, table_info, sync_stats['sync_mode'], 'all',
+                    checkpoint, last_sync_time, current_sync_time, row_filter, watermark=watermark
+                )
+            
+            if records_synced:
+                sync_stats['records_synced'] = records_synced
+                logger.info(f"✅ 同步完成: {records_synced} 行数据")
             else:
                 logger.info("ℹ️ 无新数据需要同步")
             
-            # 更新同步状态
-            self.status_manager.update_sync_status(
-                db_name, table_name, current_sync_time, 
-                sync_stats['sync_mode'], sync_stats['records_synced']
-            )
+            # 全量数据已全部写入暂存表：一次事务替换租户数据
+            staged_full_sync = sync_stats['sync_mode'] == 'FULL' and self.full_sync_strategy == 'staged_swap'
+            if staged_full_sync and records_synced:
+                self.swap_in_full_sync(table_name, db_name, table_info['schema'])
+            
+            # 更新同步状态（批量MERGE模式下推迟到MERGE成功后）
+            next_watermark = self._next_watermark(db_name, table_name, table_info, current_sync_time, source_clock)
+            if self._uses_tenant_batch(table_info, sync_stats['sync_mode']):
+                self._register_tenant_batch_status(
+                    db_name, table_name, table_info, current_sync_time, sync_stats['records_synced'],
+                    next_watermark
+                )
+            else:
+                self.status_manager.update_sync_status(
+                    db_name, table_name, current_sync_time, 
+                    sync_stats['sync_mode'], sync_stats['records_synced'],
+                    watermark=next_watermark
+                )
+            
+            # 状态（和断点）更新后再删除暂存表：替换后中断时续传仍能重新替换
+            if staged_full_sync:
+                self.drop_full_staging_table(table_name, db_name)
             
         except Exception as e:
             sync_stats['status'] = 'FAILED'
@@ -697,6 +4384,9 @@ class OptimizedIncrementalSyncer:
                 sync_stats['sync_mode'], 0, 'FAILED', str(e)
             )
         
+        with self._pipeline_stats_lock:
+            sync_stats['stage_stats'] = self._pipeline_stats.pop((db_name, table_name), {})
+        
         sync_stats['end_time'] = datetime.now()
         sync_stats['duration'] = (sync_stats['end_time'] - sync_stats['start_time']).total_seconds()
         
@@ -707,40 +4397,46 @@ class OptimizedIncrementalSyncer:
         logger.info(f"📂 并行处理数据库: {db_name} ({len(table_names)} 张表)")
         
         database_stats = []
-        max_workers = min(len(table_names), 3)  # 最多3个并发线程
+        max_workers = min(len(table_names), self.PER_DATABASE_MAX_WORKERS)
         
         with ThreadPoolExecutor(max_workers=max_workers) as executor:
             # 提交所有表的同步任务
-            future_to_table = {
-                executor.submit(self.sync_table_safe, db_name, table_name, force_full): table_name
+            futures = [
+                executor.submit(self.run_table_job, db_name, table_name, force_full)
                 for table_name in table_names
-            }
+            ]
             
             # 收集结果
-            for future in as_completed(future_to_table):
-                table_name = future_to_table[future]
-                try:
-                    table_stats = future.result()
-                    table_stats['database'] = db_name
-                    table_stats['table'] = table_name
-                    table_stats['status'] = 'SUCCESS'
-                    database_stats.append(table_stats)
-                    logger.info(f"✅ 表同步完成: {db_name}.{table_name}")
-                    
-                except Exception as e:
-                    logger.error(f"❌ 表同步失败: {db_name}.{table_name}, 错误: {e}")
-                    database_stats.append({
-                        'database': db_name,
-                        'table': table_name,
-                        'status': 'FAILED',
-                        'error_message': str(e),
-                        'records_synced': 0,
-                        'duration': 0,
-                        'sync_mode': 'UNKNOWN'
-                    })
+            for future in as_completed(futures):
+                database_stats.append(future.result())
         
         return database_stats
     
+    def run_table_job(self, db_name: str, table_name: str, force_full: bool = False) -> Dict:
+        """执行单个 (租户, 表) 同步任务，失败时返回失败统计而不抛出异常"""
+        try:
+            table_stats = self.sync_table_safe(db_name, table_name, force_full)
+            table_stats['database'] = db_name
+            table_stats['table'] = table_name
+            table_stats.setdefault('status', 'SUCCESS')
+            if table_stats['status'] == 'SUCCESS':
+                logger.info(f"✅ 表同步完成: {db_name}.{table_name}")
+            return table_stats
+            
+        except Exception as e:
+            logger.error(f"❌ 表同步失败: {db_name}.{table_name}, 错误: {e}")
+            return {
+                'database': db_name,
+                'table': table_name,
+                'tenant_id': db_name,
+                'table_name': table_name,
+                'status': 'FAILED',
+                'error_message': str(e),
+                'records_synced': 0,
+                'duration': 0,
+                'sync_mode': 'UNKNOWN'
+            }
+    
     def sync_table_safe(self, db_name: str, table_name: str, force_full: bool = False) -> Dict:
         """线程安全的表同步方法"""
         thread_id = threading.current_thread().ident
@@ -753,7 +4449,120 @@ class OptimizedIncrementalSyncer:
             raise
     
     def sync_all_tables(self, force_full: bool = False) -> Dict:
-        """安全并行同步所有表"""
+        """同步所有表：按配置选择时间戳轮询或binlog CDC数据源"""
+        db_names = [db.strip() for db in self.params['db_list'].split(",")]
+        table_names = [t.strip() for t in self.params['table_list'].split(",")]
+        self.table_analyzer.warm_cache(db_names, table_names)
+        
+        if self.sync_source == 'binlog':
+            return self.sync_binlog_changes(force_full)
+        return self.sync_all_tables_polling(force_full)
+    
+    def sync_binlog_changes(self, force_full: bool = False,
+                            cdc_source: BinlogCDCSource = None) -> Dict:
+        """基于binlog CDC同步所有表
+        
+        首次运行（或强制全量）时先记录当前binlog位置，再执行一次全量同步作为基线；
+        之后每次从已保存的位置读取行事件，插入/更新走 MERGE，删除按主键删除。
+        每个批次写入成功后才推进位置，失败时下次从上一个位置重放（操作幂等）。
+        """
+        db_names = [db.strip() for db in self.params['db_list'].split(",")]
+        table_names = [t.strip() for t in self.params['table_list'].split(",")]
+        
+        position = None if force_full else self.status_manager.get_cdc_position(BINLOG_STREAM_ID)
+        if position is None:
+            start_position = BinlogCDCSource.get_current_position(self.connection_pool)
+            logger.info(f"📍 记录binlog起点 {start_position}，执行全量基线同步")
+            stats = self.sync_all_tables_polling(force_full=True)
+            if stats['failed_count'] == 0:
+                self.status_manager.save_cdc_position(BINLOG_STREAM_ID, start_position)
+            return stats
+        
+        logger.info("🚀 开始binlog CDC增量同步")
+        logger.info("=" * 60)
+        logger.info(f"📍 起始位置: {position}")
+        
+        cdc_source = cdc_source or BinlogCDCSource(self.params, db_names, table_names, self.batch_size)
+        total_stats = {
+            'total_tables': 0,
+            'success_count': 0,
+            'failed_count': 0,
+            'full_sync_count': 0,
+            'incremental_sync_count': 0,
+            'total_records': 0,
+            'start_time': datetime.now(),
+            'table_stats': []
+        }
+        table_stats = {}
+        
+        def primary_keys_lookup(db_name: str, table_name: str) -> List[str]:
+            return self.table_analyzer.get_table_info(db_name, table_name)['primary_keys']
+        
+        try:
+            for batch in cdc_source.read_batches(position, primary_keys_lookup):
+                sync_time = datetime.now()
+                for (db_name, table_name), change in batch['changes'].items():
+                    stat = table_stats.setdefault((db_name, table_name), {
+                        'tenant_id': db_name, 'table_name': table_name, 'sync_mode': 'CDC',
+                        'records_synced': 0, 'status': 'SUCCESS', 'error_message': None
+                    })
+                    records = self.apply_cdc_changes(db_name, table_name, change, sync_time)
+                    stat['records_synced'] += records
+                    self.status_manager.update_sync_status(
+                        db_name, table_name, sync_time, 'CDC', records
+                    )
+                
+                # 批次全部写入后才推进binlog位置
+                self.status_manager.save_cdc_position(BINLOG_STREAM_ID, batch['position'])
+        except Exception as e:
+            logger.error(f"❌ binlog CDC同步失败: {e}")
+            logger.error(traceback.format_exc())
+            total_stats['table_stats'].append({
+                'tenant_id': '*', 'table_name': 'binlog', 'sync_mode': 'CDC',
+                'records_synced': 0, 'status': 'FAILED', 'error_message': str(e)
+            })
+            total_stats['failed_count'] += 1
+        
+        for stat in table_stats.values():
+            total_stats['table_stats'].append(stat)
+            total_stats['success_count'] += 1
+            total_stats['incremental_sync_count'] += 1
+            total_stats['total_records'] += stat['records_synced']
+        total_stats['total_tables'] = len(total_stats['table_stats'])
+        
+        total_stats['end_time'] = datetime.now()
+        total_stats['total_duration'] = (total_stats['end_time'] - total_stats['start_time']).total_seconds()
+        self._print_sync_report(total_stats)
+        
+        return total_stats
+    
+    def apply_cdc_changes(self, db_name: str, table_name: str, change: Dict,
+                          sync_time: datetime) -> int:
+        """将一个表的CDC变更写入BigQuery，返回变更行数"""
+        table_info = self.table_analyzer.get_table_info(db_name, table_name)
+        self.ensure_bq_table(table_name, table_info['schema'])
+        
+        if change['upserts']:
+            # binlog 行镜像包含所有字段，按字段投影丢弃被排除的字段
+            columns = table_info.get('columns')
+            rows = self._prepare_rows(
+                [{column: values.get(column) for column in columns} if columns else dict(values)
+                 for values in change['upserts']],
+                db_name, table_info, 'CDC', sync_time
+            )
+            self.write_to_bigquery(
+                table_name, rows, table_info['schema'],
+                table_info['primary_keys'], 'INCREMENTAL'
+            )
+        
+        if change['deletes']:
+            self.delete_rows_by_key(table_name, db_name, change['deletes'], table_info)
+        
+        logger.info(f"  ⚡ CDC {db_name}.{table_name}: {len(change['upserts'])} 行写入, {len(change['deletes'])} 行删除")
+        return len(change['upserts']) + len(change['deletes'])
+    
+    def sync_all_tables_polling(self, force_full: bool = False) -> Dict:
+        """安全并行同步所有表（基于时间戳轮询）"""
         logger.info("🚀 开始并行智能增量同步 - 性能优化版")
         logger.info("=" * 60)
         
@@ -766,6 +4575,11 @@ class OptimizedIncrementalSyncer:
         logger.info(f"📊 目标: {self.params['bq_project']}.{self.params['bq_dataset']}")
         logger.info(f"🔧 同步模式: {'强制全量' if force_full else '智能增量'}")
         logger.info(f"⚡ 性能优化: 连接池({self.params.get('pool_size', 5)}) + 表结构缓存 + 批量处理 + 并行同步")
+        if self.shard_coordinator is not None:
+            scheduling = f"多进程分片 (运行 {self.shard_coordinator.run_id})"
+        else:
+            scheduling = '全局共享队列' if self.scheduler_mode != 'per_database' else '逐库串行、库内并行'
+        logger.info(f"🧵 调度方式: {scheduling}")
         
         # 同步统计
         total_stats = {
@@ -779,32 +4593,64 @@ class OptimizedIncrementalSyncer:
             'table_stats': []
         }
         
-        # 数据库级串行处理，表级并行处理（安全方案）
-        for db_name in db_names:
-            logger.info(f"📂 开始处理数据库: {db_name}")
-            db_start_time = datetime.now()
+        table_stats = []
+        if self.scheduler_mode == 'per_database' and self.shard_coordinator is None:
+            # 数据库级串行处理，表级并行处理
+            for db_name in db_names:
+                logger.info(f"📂 开始处理数据库: {db_name}")
+                db_start_time = datetime.now()
+                
+                # 并行处理当前数据库的所有表
+                database_stats = self.sync_database_parallel(db_name, table_names, force_full)
+                table_stats.extend(database_stats)
+                self.status_manager.flush(db_name)
+                
+                db_duration = (datetime.now() - db_start_time).total_seconds()
+                db_records = sum(stat.get('records_synced', 0) for stat in database_stats if stat['status'] == 'SUCCESS')
+                logger.info(f"✅ 数据库处理完成: {db_name} ({db_records} 行, {db_duration:.1f}秒)")
+        else:
+            # 全局调度：所有租户×表任务共享队列（分片模式下由所有工作进程共享租约表）
+            scheduler = self.shard_coordinator or GlobalSyncScheduler(
+                self.global_workers,
+                max_per_tenant=self.max_concurrent_per_tenant,
+                max_per_table=self.max_concurrent_per_table
+            )
+            jobs = [(db_name, table_name) for db_name in db_names for table_name in table_names]
             
-            # 并行处理当前数据库的所有表
-            database_stats = self.sync_database_parallel(db_name, table_names, force_full)
+            # 租户的最后一个任务结束时落盘该租户的缓冲状态
+            remaining_jobs = {db_name: len(table_names) for db_name in db_names}
+            remaining_lock = threading.Lock()
             
-            # 汇总数据库统计
-            for table_stat in database_stats:
-                total_stats['table_stats'].append(table_stat)
-                
-                if table_stat['status'] == 'SUCCESS':
-                    total_stats['success_count'] += 1
-                    total_stats['total_records'] += table_stat.get('records_synced', 0)
-                    
-                    if table_stat.get('sync_mode') == 'FULL':
-                        total_stats['full_sync_count'] += 1
-                    else:
-                        total_stats['incremental_sync_count'] += 1
-                else:
-                    total_stats['failed_count'] += 1
+            def run_job(db_name: str, table_name: str) -> Dict:
+                try:
+                    return self.run_table_job(db_name, table_name, force_full)
+                finally:
+                    with remaining_lock:
+                        remaining_jobs[db_name] -= 1
+                        tenant_done = remaining_jobs[db_name] == 0
+                    if tenant_done:
+                        self.status_manager.flush(db_name)
             
-            db_duration = (datetime.now() - db_start_time).total_seconds()
-            db_records = sum(stat.get('records_synced', 0) for stat in database_stats if stat['status'] == 'SUCCESS')
-            logger.info(f"✅ 数据库处理完成: {db_name} ({db_records} 行, {db_duration:.1f}秒)")
+            table_stats = scheduler.run(jobs, run_job)
+            if self.shard_coordinator is not None:
+                # 只统计本进程执行的任务，整体进度见分片任务状态
+                total_stats['total_tables'] = len(table_stats)
+        
+        # 批量MERGE模式：所有租户读取完成后，每张表执行一次MERGE
+        batch_failures = self.flush_tenant_batches()
+        
+        # Storage Write 模式：到期的变更表延迟MERGE到目标表
+        self.merge_storage_write_tables(db_names, table_names)
+        
+        # 批量MERGE和延迟MERGE也会更新状态，统一落盘一次
+        self.status_manager.flush()
+        
+        # 汇总统计
+        for table_stat in table_stats:
+            error = batch_failures.get((table_stat['database'], table_stat['table']))
+            if error is not None:
+                table_stat.update({'status': 'FAILED', 'error_message': error, 'records_synced': 0})
+            self._accumulate_table_stats(total_stats, table_stat)
         
         total_stats['end_time'] = datetime.now()
         total_stats['total_duration'] = (total_stats['end_time'] - total_stats['start_time']).total_seconds()
@@ -814,6 +4660,22 @@ class OptimizedIncrementalSyncer:
         
         return total_stats
     
+    @staticmethod
+    def _accumulate_table_stats(total_stats: Dict, table_stat: Dict):
+        """将单表同步结果汇总到总统计"""
+        total_stats['table_stats'].append(table_stat)
+        
+        if table_stat['status'] == 'SUCCESS':
+            total_stats['success_count'] += 1
+            total_stats['total_records'] += table_stat.get('records_synced', 0)
+            
+            if table_stat.get('sync_mode') == 'FULL':
+                total_stats['full_sync_count'] += 1
+            else:
+                total_stats['incremental_sync_count'] += 1
+        else:
+            total_stats['failed_count'] += 1
+    
     def _print_sync_report(self, stats: Dict):
         """打印同步报告"""
         logger.info("\n" + "=" * 60)
@@ -837,7 +4699,21 @@ class OptimizedIncrementalSyncer:
         logger.info(f"  💾 表结构缓存命中: {len(self.table_cache._cache)} 张表")
         logger.info(f"  🔗 连接池复用: 减少连接建立开销")
         logger.info(f"  📦 批量数据处理: 提升处理效率")
-        logger.info(f"  🚀 并行同步: 数据库串行 + 表级并行（安全模式）")
+        if self.shard_coordinator is not None:
+            scheduling = '多进程分片租约调度'
+        else:
+            scheduling = '数据库串行 + 表级并行' if self.scheduler_mode == 'per_database' else '全局共享队列调度'
+        logger.info(f"  🚀 并行同步: {scheduling} + 单表抽取/转换/加载流水线")
+        
+        stage_stats = {}
+        for table_stat in stats['table_stats']:
+            TablePipeline.merge_stage_stats(stage_stats, table_stat.get('stage_stats', {}))
+        if stage_stats:
+            bottleneck = max(stage_stats, key=lambda stage: stage_stats[stage]['busy'])
+            stage_names = {'extract': '抽取(MySQL)', 'transform': '转换', 'load': '加载(BigQuery)'}
+            logger.info(f"\n🧪 流水线阶段耗时:")
+            logger.info(f"  {TablePipeline.format_stage_stats(stage_stats)}")
+            logger.info(f"  🐢 最忙阶段: {stage_names[bottleneck]}")
         
         if stats['failed_count'] > 0:
             logger.info(f"\n❌ 失败表详情:")
@@ -850,21 +4726,89 @@ class OptimizedIncrementalSyncer:
     def cleanup(self):
         """清理资源"""
         try:
+            self.staging_tables.cleanup()
+            self.table_cache.save()
             self.table_cache.clear()
+            self.status_manager.close()
+            if self.shard_coordinator is not None:
+                self.shard_coordinator.close()
             # 连接池会自动管理连接
             logger.info("✅ 资源清理完成")
         except Exception as e:
             logger.warning(f"⚠️ 资源清理警告: {e}")
 
+def run_sync(params: Dict, force_full: bool = False) -> int:
+    """执行一次同步并返回退出码（也是分片工作进程的入口）"""
+    syncer = OptimizedIncrementalSyncer(params)
+    try:
+        stats = syncer.sync_all_tables(force_full=force_full)
+        return 1 if stats['failed_count'] > 0 else 0
+    finally:
+        syncer.cleanup()
+
+def run_sharded(params: Dict, shard_count: int, force_full: bool = False) -> int:
+    """启动 shard_count 个本地工作进程共同完成 params['shard_run_id'] 这次运行
+    
+    工作进程之间不通信，只通过租约表协调；其他主机用相同的 --run-id 启动即可加入同一次运行
+    （租约库需放在各主机共享的存储上）。任一工作进程失败、或有任务最终失败时返回 1。
+    """
+    processes = [
+        multiprocessing.Process(target=_run_shard_worker, args=(params, force_full),
+                                name=f"sync-shard-{index + 1}")
+        for index in range(shard_count)
+    ]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join()
+    
+    failed_workers = [process.name for process in processes if process.exitcode != 0]
+    coordinator = ShardLeaseCoordinator(
+        params.get('shard_coordination_db',
+                   str(Path(params.get('status_dir', 'sync_status')) / "_shard_leases.db")),
+        params['shard_run_id']
+    )
+    try:
+        summary = coordinator.summary()
+    finally:
+        coordinator.close()
+    logger.info(f"🧩 分片运行 {params['shard_run_id']} 完成: {summary}"
+                + (f"，异常退出的工作进程: {failed_workers}" if failed_workers else ""))
+    return 1 if failed_workers or summary.get('failed') else 0
+
+def _run_shard_worker(params: Dict, force_full: bool):
+    sys.exit(run_sync(params, force_full))
+
 def main():
-    """主函数"""
-    if len(sys.argv) > 1 and sys.argv[1] == '--full':
-        force_full = True
+    """主函数
+    
+    用法: smart_sync_incremental_optimized.py [--full] [--shard N] [--run-id ID]
+      --full       强制全量同步
+      --shard N    启动 N 个工作进程，按 (租户, 表) 租约分片执行
+      --run-id ID  加入指定的分片运行（多台主机使用相同的 ID 共同完成一次同步）
+    """
+    args = sys.argv[1:]
+    force_full = '--full' in args
+    if force_full:
         print("🔄 强制全量同步模式")
     else:
-        force_full = False
         print("⚡ 智能增量同步模式")
     
+    def option_value(name: str) -> Optional[str]:
+        if name not in args:
+            return None
+        index = args.index(name)
+        if index + 1 >= len(args):
+            logger.error(f"❌ 参数 {name} 缺少取值")
+            sys.exit(1)
+        return args[index + 1]
+    
+    shard_count = option_value('--shard')
+    run_id = option_value('--run-id')
+    if shard_count is not None and (not shard_count.isdigit() or int(shard_count) < 1):
+        logger.error(f"❌ --shard 必须是正整数: {shard_count}")
+        sys.exit(1)
+    
     # 读取配置
     try:
         with open('params.json', 'r') as f:
@@ -876,19 +4820,14 @@ def main():
         logger.error("❌ 配置文件 params.json 格式错误")
         sys.exit(1)
     
-    # 创建优化版同步器并执行同步
-    syncer = OptimizedIncrementalSyncer(params)
+    if shard_count is not None or run_id is not None:
+        params['shard_run_id'] = run_id or f"{datetime.now().strftime('%Y%m%d%H%M%S')}_{uuid.uuid4().hex[:6]}"
+        print(f"🧩 分片运行: {params['shard_run_id']}")
     
-    try:
-        stats = syncer.sync_all_tables(force_full=force_full)
-        
-        # 根据结果设置退出码
-        if stats['failed_count'] > 0:
-            sys.exit(1)
-        else:
-            sys.exit(0)
-    finally:
-        syncer.cleanup()
+    # 根据结果设置退出码
+    if shard_count is not None and int(shard_count) > 1:
+        sys.exit(run_sharded(params, int(shard_count), force_full))
+    sys.exit(run_sync(params, force_full))
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -0,0 +1,655 @@
+#!/usr/bin/env python3
+"""
+测试 BigQuery 写入策略（使用内存中的 BigQuery 替身，无需真实GCP项目）
+"""
+
+import re
+import sys
+import copy
+import time
+import tempfile
+import threading
+from datetime import datetime, timedelta, timezone
+
+# 添加当前目录到路径
+sys.path.append('.')
+
+import pyarrow as pa
+from google.cloud import bigquery
+from google.api_core.exceptions import BadRequest, Forbidden, NotFound
+
+from smart_sync_incremental_optimized import (
+    BigQueryTableRegistry, LocalFileStatusManager, OptimizedIncrementalSyncer, ProtoRowEncoder, StagingTableManager,
+    StorageWriteSink
+)
+
+TARGET = "proj.ds.orders"
+
+class LocalQueryJob:
+    def result(self):
+        return []
+
+class LocalBigQuery:
+    """最小化的 BigQuery 替身：表保存为行列表，支持加载作业和同步生成的 DML/事务脚本
+
+    每个作业完成后记录一次表快照，用于检查读取方能看到的中间状态。
+    """
+
+    def __init__(self, tables=None):
+        self.tables = copy.deepcopy(tables or {})
+        self.snapshots = []
+        self.jobs = []
+        self.expires = {}
+
+    def _finish_job(self, description):
+        self.jobs.append(description)
+        self.snapshots.append(copy.deepcopy(self.tables))
+        return LocalQueryJob()
+
+    def load_table_from_json(self, rows, table_id, job_config=None):
+        if job_config.write_disposition == bigquery.WriteDisposition.WRITE_TRUNCATE:
+            self.tables[table_id] = []
+        self.tables.setdefault(table_id, []).extend(copy.deepcopy(list(rows)))
+        return self._finish_job(f"LOAD {table_id}")
+
+    def get_table(self, table_id):
+        if table_id not in self.tables:
+            raise NotFound(table_id)
+        return bigquery.Table(table_id)
+    
+    def create_table(self, table, exists_ok=False):
+        table_id = f"{table.project}.{table.dataset_id}.{table.table_id}"
+        if table_id in self.tables and not exists_ok:
+            raise KeyError(table_id)
+        self.tables.setdefault(table_id, [])
+        self.expires[table_id] = table.expires
+        return table
+
+    def update_table(self, table, fields):
+        table_id = f"{table.project}.{table.dataset_id}.{table.table_id}"
+        assert fields == ["expires"]
+        self.expires[table_id] = table.expires
+        return table
+
+    def delete_table(self, table_id, not_found_ok=False):
+        if table_id not in self.tables and not not_found_ok:
+            raise KeyError(table_id)
+        self.tables.pop(table_id, None)
+
+    def _run_statement(self, tables, statement):
+        delete = re.match(r"DELETE FROM `(.+)`\s+WHERE tenant_id = '(.+)'", statement)
+        if delete:
+            table_id, tenant_id = delete.groups()
+            tables[table_id] = [row for row in tables[table_id] if row['tenant_id'] != tenant_id]
+            return
+
+        insert = re.match(r"INSERT INTO `(.+)` \((.+)\)\s+SELECT (.+) FROM `(.+)`", statement, re.S)
+        if insert:
+            table_id, columns, _, source_id = insert.groups()
+            names = [name.strip() for name in columns.split(",")]
+            tables[table_id].extend({name: row.get(name) for name in names} for row in tables[source_id])
+            return
+
+        raise ValueError(f"不支持的语句: {statement}")
+
+    def query(self, sql):
+        statements = [statement.strip() for statement in sql.split(";") if statement.strip()]
+        if statements[0] == "BEGIN TRANSACTION":
+            # 事务：在副本上执行，COMMIT 时一次性生效
+            assert statements[-1] == "COMMIT TRANSACTION"
+            tables = copy.deepcopy(self.tables)
+            for statement in statements[1:-1]:
+                self._run_statement(tables, statement)
+            self.tables = tables
+            return self._finish_job("TRANSACTION")
+
+        if statements[0].startswith("MERGE"):
+            # MERGE 只记录语句，由测试检查生成的SQL
+            return self._finish_job(statements[0])
+        
+        for statement in statements:
+            self._run_statement(self.tables, statement)
+        return self._finish_job(statements[0].split()[0])
+
+def make_syncer(bq_client, strategy):
+    syncer = OptimizedIncrementalSyncer.__new__(OptimizedIncrementalSyncer)
+    syncer.params = {'bq_project': 'proj', 'bq_dataset': 'ds'}
+    syncer.bq_client = bq_client
+    syncer.table_registry = BigQueryTableRegistry(bq_client)
+    syncer.columnar_writer = None
+    syncer.full_sync_strategy = strategy
+    syncer.full_staging_expiration_hours = 168
+    syncer.staging_tables = LocalStagingTables()
+    syncer.max_retries = 3
+    syncer.retry_delay = 0
+    syncer._table_write_locks = {}
+    syncer._table_write_locks_guard = threading.Lock()
+    return syncer
+
+class LocalAppendRowsStream:
+    """Storage Write API 写入流替身：解码追加的行，committed 立即可见，pending 在 commit 时可见"""
+    
+    def __init__(self, factory, table_id, mode, descriptor_proto):
+        self.factory = factory
+        self.table_id = table_id
+        self.mode = mode
+        self.message_class = ProtoRowEncoder.message_class_for(descriptor_proto)
+        self.buffered = []
+    
+    def append(self, serialized_rows):
+        self.factory.append_requests += 1
+        if self.factory.fail_on_request == self.factory.append_requests:
+            raise RuntimeError("模拟追加失败")
+        rows = []
+        for serialized_row in serialized_rows:
+            message = self.message_class.FromString(serialized_row)
+            rows.append({field.name: value for field, value in message.ListFields()})
+        if self.mode == 'pending':
+            self.buffered.extend(rows)
+        else:
+            self.factory.bq.tables.setdefault(self.table_id, []).extend(rows)
+    
+    def commit(self):
+        self.factory.bq.tables.setdefault(self.table_id, []).extend(self.buffered)
+        self.buffered = []
+    
+    def close(self):
+        pass
+
+class LocalAppendRowsFactory:
+    """append-rows 接口替身，写入 LocalBigQuery 的表"""
+    
+    def __init__(self, bq, fail_on_request=None):
+        self.bq = bq
+        self.fail_on_request = fail_on_request
+        self.append_requests = 0
+    
+    def open_stream(self, table_path, mode, descriptor_proto):
+        _, project, _, dataset, _, table = table_path.split('/')
+        return LocalAppendRowsStream(self, f"{project}.{dataset}.{table}", mode, descriptor_proto)
+
+def enable_storage_write(syncer, factory, status_dir, interval_minutes=15):
+    syncer.sync_source = 'polling'
+    syncer.tenant_batch_merge = False
+    syncer.status_manager = LocalFileStatusManager(status_dir)
+    syncer.shard_coordinator = None
+    syncer.storage_write_sink = StorageWriteSink('committed', stream_factory=factory)
+    syncer.storage_write_merge_interval = timedelta(minutes=interval_minutes)
+    syncer._storage_write_tables = {}
+    syncer._storage_write_pending_marked = set()
+    syncer._storage_write_last_append = {}
+    syncer._storage_write_appends = {}
+    syncer._storage_write_merging = set()
+    syncer._storage_write_cond = threading.Condition()
+
+def make_rows(tenant_id, ids, version):
+    return [{'id': i, 'status': version, 'tenant_id': tenant_id,
+             'sync_timestamp': '2024-01-01T00:00:00', 'sync_mode': 'FULL'} for i in ids]
+
+SCHEMA = [bigquery.SchemaField(name, field_type) for name, field_type in [
+    ('id', 'INT64'), ('status', 'STRING'), ('tenant_id', 'STRING'),
+    ('sync_timestamp', 'TIMESTAMP'), ('sync_mode', 'STRING')
+]]
+
+def tenant_rows(tables, tenant_id):
+    return [row for row in tables.get(TARGET, []) if row['tenant_id'] == tenant_id]
+
+def run_full_sync(syncer, tenant_id, chunks):
+    """模拟 stream_to_bigquery 的分块全量写入，结束后执行替换"""
+    for i, chunk in enumerate(chunks):
+        syncer.write_to_bigquery('orders', chunk, SCHEMA, ['id'], 'FULL', replace_tenant_data=(i == 0))
+    if syncer.full_sync_strategy == 'staged_swap':
+        syncer.swap_in_full_sync('orders', tenant_id, SCHEMA)
+        syncer.drop_full_staging_table('orders', tenant_id)
+
+def test_staged_swap_full_sync():
+    """测试暂存表 + 事务替换：租户数据被完整替换，其他租户不受影响，且不出现空窗口"""
+    print("🧪 测试全量同步暂存表原子替换")
+    print("=" * 50)
+
+    bq = LocalBigQuery({TARGET: make_rows('shop1', [1, 2, 3], 'old') + make_rows('shop2', [1], 'old')})
+    syncer = make_syncer(bq, 'staged_swap')
+
+    run_full_sync(syncer, 'shop1', [make_rows('shop1', [1, 2], 'new'), make_rows('shop1', [4], 'new')])
+
+    assert sorted((row['id'], row['status']) for row in tenant_rows(bq.tables, 'shop1')) == [(1, 'new'), (2, 'new'), (4, 'new')]
+    assert tenant_rows(bq.tables, 'shop2') == make_rows('shop2', [1], 'old')
+    assert "proj.ds_staging.orders_full_shop1" not in bq.tables
+
+    # 每个作业结束时，读取方看到的要么是完整的旧数据，要么是完整的新数据
+    versions = [{row['status'] for row in tenant_rows(snapshot, 'shop1')} for snapshot in bq.snapshots]
+    assert all(version in ({'old'}, {'new'}) for version in versions)
+    assert [job for job in bq.jobs if job == f"LOAD {TARGET}" or job == "TRANSACTION"] == ["TRANSACTION"]
+    print(f"  ✅ 作业序列: {bq.jobs}")
+
+def test_staged_swap_resume():
+    """测试断点续传：续传的数据块追加到同一个暂存表，续传前延长暂存表过期时间"""
+    print("\n🧪 测试全量暂存表断点续传")
+    print("=" * 50)
+
+    bq = LocalBigQuery({TARGET: make_rows('shop1', [1], 'old')})
+    syncer = make_syncer(bq, 'staged_swap')
+    staging_table_id = "proj.ds_staging.orders_full_shop1"
+
+    # 暂存表在主数据集中，创建时设置过期时间
+    started = datetime.now(timezone.utc)
+    syncer.reset_full_sync_target('orders', 'shop1', SCHEMA)
+    created_expires = bq.expires[staging_table_id]
+    assert timedelta(hours=167) < created_expires - started < timedelta(hours=169)
+
+    # 第一次运行写入一块后中断
+    syncer.write_to_bigquery('orders', make_rows('shop1', [1, 2], 'new'), SCHEMA, ['id'], 'FULL', replace_tenant_data=True)
+    assert tenant_rows(bq.tables, 'shop1') == make_rows('shop1', [1], 'old')
+
+    # 续传：延长过期时间，后续块不清空暂存表
+    time.sleep(0.01)
+    assert syncer.renew_full_staging_table('orders', 'shop1')
+    assert bq.expires[staging_table_id] > created_expires
+    syncer.write_to_bigquery('orders', make_rows('shop1', [3], 'new'), SCHEMA, ['id'], 'FULL', replace_tenant_data=False)
+    syncer.swap_in_full_sync('orders', 'shop1', SCHEMA)
+
+    assert sorted(row['id'] for row in tenant_rows(bq.tables, 'shop1')) == [1, 2, 3]
+    print("  ✅ 续传数据已合并替换")
+
+    # 暂存表已过期（不存在）时不能续传，需重新全量
+    syncer.drop_full_staging_table('orders', 'shop1')
+    assert not syncer.renew_full_staging_table('orders', 'shop1')
+    print("  ✅ 暂存表过期后断点不可续传")
+
+def test_delete_append_gap():
+    """对照：DELETE + APPEND 方式在两个作业之间租户数据为空"""
+    print("\n🧪 测试 DELETE + APPEND 全量写入")
+    print("=" * 50)
+
+    bq = LocalBigQuery({TARGET: make_rows('shop1', [1, 2], 'old')})
+    syncer = make_syncer(bq, 'delete_append')
+
+    run_full_sync(syncer, 'shop1', [make_rows('shop1', [1, 2], 'new')])
+
+    assert [row['status'] for row in tenant_rows(bq.tables, 'shop1')] == ['new', 'new']
+    assert any(not tenant_rows(snapshot, 'shop1') for snapshot in bq.snapshots)
+    print("  ✅ DELETE 与 APPEND 之间存在空窗口")
+
+def test_storage_write_modes():
+    """测试 Storage Write 两种模式：committed 追加即可见；pending 中途失败时整块不可见"""
+    print("\n🧪 测试 Storage Write API 写入模式")
+    print("=" * 50)
+    
+    rows = make_rows('shop1', range(5), 'new')
+    for mode, expected_ids in (('committed', [0, 1]), ('pending', [])):
+        bq = LocalBigQuery()
+        sink = StorageWriteSink(mode, stream_factory=LocalAppendRowsFactory(bq, fail_on_request=2))
+        sink.MAX_REQUEST_BYTES = 60  # 强制每个请求两行
+        try:
+            sink.append(TARGET, rows, SCHEMA)
+            raise AssertionError("追加失败应抛出异常")
+        except RuntimeError:
+            pass
+        assert [row['id'] for row in bq.tables.get(TARGET, [])] == expected_ids, mode
+        print(f"  ✅ {mode}: 失败后可见 {len(expected_ids)} 行")
+    
+    bq = LocalBigQuery()
+    StorageWriteSink('pending', stream_factory=LocalAppendRowsFactory(bq)).append(TARGET, rows, SCHEMA)
+    written = bq.tables[TARGET]
+    assert [row['id'] for row in written] == list(range(5))
+    assert written[0]['tenant_id'] == 'shop1'
+    assert written[0]['sync_timestamp'] == 1704067200000000  # UTC 微秒
+    print("  ✅ pending: 提交后整块可见，时间戳按微秒编码")
+
+def test_storage_write_deferred_merge():
+    """测试有主键的表：增量追加到变更表，按间隔延迟MERGE并持久化合并水位"""
+    print("\n🧪 测试 Storage Write 延迟MERGE")
+    print("=" * 50)
+    
+    bq = LocalBigQuery()
+    syncer = make_syncer(bq, 'staged_swap')
+    table_info = {'schema': SCHEMA, 'primary_keys': ['id']}
+    
+    with tempfile.TemporaryDirectory() as status_dir:
+        enable_storage_write(syncer, LocalAppendRowsFactory(bq), status_dir)
+        
+        for tenant_id in ('shop1', 'shop2'):
+            syncer._write_chunk('orders', make_rows(tenant_id, [1, 2], 'v1'), table_info, 'INCREMENTAL', True)
+        changes = bq.tables["proj.ds.orders_changes"]
+        assert len(changes) == 4 and all('_change_time' in row for row in changes)
+        assert TARGET not in bq.tables
+        assert syncer.storage_write_pending('orders')
+        
+        # 首次合并：去重后MERGE，记录水位
+        syncer.merge_storage_write_tables(['shop1'], ['orders'])
+        merge_sql = bq.jobs[-1]
+        assert "QUALIFY ROW_NUMBER() OVER (PARTITION BY tenant_id, id ORDER BY _change_time DESC) = 1" in merge_sql
+        position = syncer.status_manager.get_cdc_position("storage_write:orders")
+        assert position['pending'] is False and position['merged_until']
+        print(f"  ✅ 已合并到水位 {position['merged_until']}")
+        
+        # 间隔内的新变更只追加，不MERGE
+        syncer._write_chunk('orders', make_rows('shop1', [3], 'v2'), table_info, 'INCREMENTAL', True)
+        jobs = len(bq.jobs)
+        syncer.merge_storage_write_tables(['shop1'], ['orders'])
+        assert len(bq.jobs) == jobs and syncer.storage_write_pending('orders')
+        
+        # 强制合并（如全量同步前）：只合并上次水位之后的变更
+        assert syncer.merge_storage_write_changes('orders', table_info, force=True)
+        assert f"_change_time > TIMESTAMP '{position['merged_until']}'" in bq.jobs[-1]
+        assert not syncer.storage_write_pending('orders')
+        print("  ✅ 间隔内跳过，强制合并从上次水位继续")
+
+class LocalStagingTables:
+    """暂存表管理器替身：每个目标表、每种用途固定一张暂存表"""
+    
+    def table_id(self, table_name, purpose):
+        return f"proj.ds_staging.{table_name}_{purpose}"
+    
+    def shared_table_id(self, table_name):
+        return f"proj.ds_staging.{table_name}"
+
+class FailingMergeBigQuery(LocalBigQuery):
+    """MERGE 作业失败的 BigQuery 替身"""
+    
+    def query(self, sql):
+        if sql.strip().startswith("MERGE"):
+            raise RuntimeError("模拟MERGE失败")
+        return super().query(sql)
+
+def enable_tenant_batch(syncer, status_dir, prune_columns=None):
+    syncer.tenant_batch_merge = True
+    syncer.tenant_batch_max_rows = 100000
+    syncer._tenant_batches = {}
+    syncer._tenant_batch_failures = {}
+    syncer._tenant_batches_lock = threading.Lock()
+    syncer.storage_write_sink = None
+    syncer.staging_tables = LocalStagingTables()
+    syncer.merge_prune_columns = prune_columns or {}
+    syncer.status_manager = LocalFileStatusManager(status_dir)
+
+def make_timed_rows(tenant_id, ids, version, updated_at, created_at='2024-01-01T00:00:00'):
+    return [dict(row, updated_at=updated_at, created_at=created_at) for row in make_rows(tenant_id, ids, version)]
+
+TIMED_SCHEMA = SCHEMA + [bigquery.SchemaField('updated_at', 'TIMESTAMP'), bigquery.SchemaField('created_at', 'TIMESTAMP')]
+
+def test_tenant_batch_merge():
+    """测试批量MERGE：多个租户一次暂存加载 + 一次去重MERGE，成功后更新各租户状态，失败时全部标记失败"""
+    print("\n🧪 测试多租户批量MERGE")
+    print("=" * 50)
+    
+    table_info = {'schema': TIMED_SCHEMA, 'primary_keys': ['id'], 'timestamp_field': 'updated_at'}
+    sync_time = datetime(2024, 1, 2, 3, 0, 0)
+    
+    with tempfile.TemporaryDirectory() as status_dir:
+        bq = LocalBigQuery()
+        syncer = make_syncer(bq, 'staged_swap')
+        enable_tenant_batch(syncer, status_dir, {'orders': 'created_at'})
+        
+        # shop1 的 id=1 在两个块中各出现一次，MERGE 时按 updated_at 只保留最新一行
+        syncer._write_chunk('orders', make_timed_rows('shop1', [1, 2], 'v1', '2024-01-02T01:00:00'), table_info, 'INCREMENTAL', True)
+        syncer._write_chunk('orders', make_timed_rows('shop1', [1], 'v2', '2024-01-02T02:00:00'), table_info, 'INCREMENTAL', False)
+        syncer._write_chunk('orders', make_timed_rows('shop2', [1], 'v1', '2024-01-02T01:30:00',
+                                                      created_at='2024-01-01T12:00:00'), table_info, 'INCREMENTAL', True)
+        assert bq.jobs == [], "数据块应只进入缓冲"
+        
+        for tenant_id, records in (('shop1', 3), ('shop2', 1)):
+            syncer._register_tenant_batch_status(tenant_id, 'orders', table_info, sync_time, records)
+        assert syncer.status_manager.get_last_sync_time('shop1', 'orders') is None
+        
+        syncer.flush_tenant_batch('orders')
+        assert bq.jobs[0] == "LOAD proj.ds_staging.orders_merge" and len(bq.jobs) == 2
+        assert [row['tenant_id'] for row in bq.tables["proj.ds_staging.orders_merge"]] == ['shop1', 'shop1', 'shop1', 'shop2']
+        
+        merge_sql = bq.jobs[1]
+        assert merge_sql.startswith(f"MERGE `{TARGET}` T")
+        assert "FROM `proj.ds_staging.orders_merge`" in merge_sql
+        assert "QUALIFY ROW_NUMBER() OVER (PARTITION BY tenant_id, id ORDER BY updated_at DESC) = 1" in merge_sql
+        assert re.search(r"ON T\.id = S\.id AND T\.tenant_id = S\.tenant_id "
+                         r"AND T\.tenant_id IN \('shop1', 'shop2'\) "
+                         r"AND T\.created_at BETWEEN TIMESTAMP '2024-01-01T00:00:00' AND TIMESTAMP '2024-01-01T12:00:00'\s",
+                         merge_sql), merge_sql
+        assert ("UPDATE SET status = S.status, tenant_id = S.tenant_id, sync_timestamp = S.sync_timestamp, "
+                "sync_mode = S.sync_mode, updated_at = S.updated_at, created_at = S.created_at\n") in merge_sql
+        assert "INSERT (id, status, tenant_id, sync_timestamp, sync_mode, updated_at, created_at)" in merge_sql
+        for tenant_id in ('shop1', 'shop2'):
+            assert syncer.status_manager.get_last_sync_time(tenant_id, 'orders') == sync_time
+        assert syncer._tenant_batches == {}
+        print("  ✅ 2 个租户 1 次暂存加载 + 1 次MERGE，成功后更新同步状态")
+        
+        # MERGE 失败：已登记的租户标记失败，仍在读取的租户在登记时收到错误
+        bq = FailingMergeBigQuery()
+        syncer.bq_client = bq
+        syncer._write_chunk('orders', make_timed_rows('shop1', [3], 'v3', '2024-01-03T00:00:00'), table_info, 'INCREMENTAL', True)
+        syncer._write_chunk('orders', make_timed_rows('shop3', [1], 'v1', '2024-01-03T00:00:00'), table_info, 'INCREMENTAL', True)
+        syncer._register_tenant_batch_status('shop1', 'orders', table_info, datetime(2024, 1, 3), 1)
+        failures = syncer.flush_tenant_batches()
+        assert failures == {('shop1', 'orders'): "模拟MERGE失败"}, failures
+        assert syncer.status_manager.get_last_sync_time('shop1', 'orders') == sync_time
+        try:
+            syncer._register_tenant_batch_status('shop3', 'orders', table_info, datetime(2024, 1, 3), 1)
+        except RuntimeError as e:
+            assert "模拟MERGE失败" in str(e)
+        else:
+            raise AssertionError("读取中的租户应收到批量MERGE失败")
+        print("  ✅ MERGE失败时保留上次同步时间，读取中的租户登记时报错")
+
+def test_merge_prune_predicates():
+    """测试MERGE裁剪条件：租户集合、不变列取值范围，空值/不支持的类型不裁剪"""
+    print("\n🧪 测试MERGE裁剪条件")
+    print("=" * 50)
+    
+    syncer = make_syncer(LocalBigQuery(), 'staged_swap')
+    schema = SCHEMA + [bigquery.SchemaField('created_at', 'TIMESTAMP'), bigquery.SchemaField('biz_date', 'DATE'),
+                       bigquery.SchemaField('amount', 'NUMERIC'), bigquery.SchemaField('flag', 'BOOLEAN')]
+    rows = [
+        {'tenant_id': "o'brien", 'created_at': '2024-03-01T10:00:00', 'biz_date': '2024-03-01', 'amount': 2.5, 'flag': True},
+        {'tenant_id': 'shop1', 'created_at': '2024-01-15T08:30:00', 'biz_date': '2024-01-15', 'amount': -1, 'flag': False},
+        {'tenant_id': 'shop1', 'created_at': '2024-02-01T00:00:00', 'biz_date': '2024-02-01', 'amount': 0.5, 'flag': True},
+    ]
+    
+    assert syncer._merge_prune_predicates(rows, schema) == ["T.tenant_id IN ('o\\'brien', 'shop1')"]
+    assert syncer._merge_prune_predicates(rows, schema, 'created_at')[1] == \
+        "T.created_at BETWEEN TIMESTAMP '2024-01-15T08:30:00' AND TIMESTAMP '2024-03-01T10:00:00'"
+    assert syncer._merge_prune_predicates(rows, schema, 'biz_date')[1] == \
+        "T.biz_date BETWEEN DATE '2024-01-15' AND DATE '2024-03-01'"
+    assert syncer._merge_prune_predicates(rows, schema, 'amount')[1] == "T.amount BETWEEN -1 AND 2.5"
+    
+    # 空值、列不存在、不支持的类型：只保留租户条件
+    with_null = rows + [{'tenant_id': 'shop2', 'created_at': None}]
+    assert syncer._merge_prune_predicates(with_null, schema, 'created_at') == \
+        ["T.tenant_id IN ('o\\'brien', 'shop1', 'shop2')"]
+    assert len(syncer._merge_prune_predicates(rows, schema, 'missing')) == 1
+    assert len(syncer._merge_prune_predicates(rows, schema, 'flag')) == 1
+    
+    # 列式数据块（Arrow记录批次）同样可以裁剪
+    batch = pa.RecordBatch.from_pylist([
+        {'tenant_id': 'shop1', 'created_at': datetime(2024, 1, 15, 8, 30)},
+        {'tenant_id': 'shop2', 'created_at': datetime(2024, 3, 1, 10)},
+    ])
+    assert syncer._merge_prune_predicates(batch, schema, 'created_at') == [
+        "T.tenant_id IN ('shop1', 'shop2')",
+        "T.created_at BETWEEN TIMESTAMP '2024-01-15T08:30:00' AND TIMESTAMP '2024-03-01T10:00:00'"
+    ]
+    
+    # 裁剪条件作为附加 ON 条件写入 MERGE
+    merge_sql = syncer._build_merge_sql(TARGET, "`proj.ds_staging.orders_merge`", ['id'], SCHEMA,
+                                        syncer._merge_prune_predicates(rows, schema, 'created_at'))
+    assert "ON T.id = S.id AND T.tenant_id = S.tenant_id AND T.tenant_id IN (" in merge_sql
+    assert "AND T.created_at BETWEEN TIMESTAMP '2024-01-15T08:30:00'" in merge_sql
+    assert "sync_timestamp BETWEEN" not in merge_sql
+    print("  ✅ 租户集合与不变列范围裁剪，空值/不支持类型时只按租户裁剪")
+
+class CountingBigQuery(LocalBigQuery):
+    """记录数据集/表的元数据请求次数，创建表时稍作等待以放大并发竞争"""
+    
+    def __init__(self):
+        super().__init__()
+        self.datasets = set()
+        self.calls = []
+    
+    def get_dataset(self, dataset_id):
+        self.calls.append('get_dataset')
+        if dataset_id not in self.datasets:
+            raise NotFound(dataset_id)
+    
+    def create_dataset(self, dataset, exists_ok=False):
+        self.calls.append('create_dataset')
+        self.datasets.add(f"{dataset.project}.{dataset.dataset_id}")
+        return dataset
+    
+    def get_table(self, table_id):
+        self.calls.append('get_table')
+        return super().get_table(table_id)
+    
+    def create_table(self, table, exists_ok=False):
+        self.calls.append('create_table')
+        time.sleep(0.05)
+        return super().create_table(table, exists_ok)
+
+class ConflictingBigQuery(LocalBigQuery):
+    """前 conflicts 个查询作业因其他进程并发修改同一张表而失败的 BigQuery 替身"""
+    
+    def __init__(self, tables=None, conflicts=0, error="Could not serialize access to table {} due to concurrent update"):
+        super().__init__(tables)
+        self.conflicts = conflicts
+        self.error = error
+        self.attempts = 0
+    
+    def query(self, sql):
+        self.attempts += 1
+        if self.conflicts > 0:
+            self.conflicts -= 1
+            raise BadRequest(self.error.format(TARGET))
+        return super().query(sql)
+
+def test_dml_conflict_retry():
+    """测试跨进程并发DML冲突：退避重试直到成功，超过重试次数或其他错误时抛出"""
+    print("\n🧪 测试 BigQuery DML 并发冲突重试")
+    print("=" * 50)
+    
+    # 事务替换冲突两次后成功，租户数据完整替换
+    bq = ConflictingBigQuery({TARGET: make_rows('shop1', [1, 2], 'old')})
+    syncer = make_syncer(bq, 'staged_swap')
+    syncer.reset_full_sync_target('orders', 'shop1', SCHEMA)
+    syncer.write_to_bigquery('orders', make_rows('shop1', [3], 'new'), SCHEMA, ['id'], 'FULL', replace_tenant_data=False)
+    bq.conflicts = 2
+    syncer.swap_in_full_sync('orders', 'shop1', SCHEMA)
+    assert bq.attempts == 3
+    assert [(row['id'], row['status']) for row in tenant_rows(bq.tables, 'shop1')] == [(3, 'new')]
+    print("  ✅ 冲突 2 次后第 3 次替换成功")
+    
+    # 冲突次数超过 max_retries：抛出最后一次的错误，数据不变
+    bq = ConflictingBigQuery({TARGET: make_rows('shop1', [1, 2], 'old')}, conflicts=5)
+    syncer = make_syncer(bq, 'delete_append')
+    syncer.max_retries = 2
+    try:
+        syncer.delete_tenant_data('orders', 'shop1')
+        raise AssertionError("超过重试次数应抛出异常")
+    except BadRequest as e:
+        assert "concurrent update" in str(e)
+    assert bq.attempts == 3 and len(tenant_rows(bq.tables, 'shop1')) == 2
+    print("  ✅ 超过重试次数后抛出冲突错误")
+    
+    # 其他错误不重试
+    bq = ConflictingBigQuery({TARGET: make_rows('shop1', [1], 'old')}, conflicts=1, error="Syntax error at [2:9]")
+    syncer = make_syncer(bq, 'delete_append')
+    try:
+        syncer.delete_tenant_data('orders', 'shop1')
+        raise AssertionError("非冲突错误应直接抛出")
+    except BadRequest:
+        pass
+    assert bq.attempts == 1
+    print("  ✅ 非冲突错误不重试")
+
+class DatasetBigQuery:
+    """只支持数据集元数据操作的 BigQuery 替身"""
+    
+    def __init__(self, datasets=None, get_error=None, update_error=None):
+        self.datasets = datasets or {}
+        self.get_error = get_error
+        self.update_error = update_error
+        self.created = []
+        self.updated = []
+    
+    def get_dataset(self, dataset_id):
+        if self.get_error:
+            raise self.get_error
+        if dataset_id not in self.datasets:
+            raise NotFound(dataset_id)
+        dataset = bigquery.Dataset(dataset_id)
+        dataset.default_table_expiration_ms = self.datasets[dataset_id]
+        return dataset
+    
+    def create_dataset(self, dataset, exists_ok=False):
+        self.created.append(dataset.dataset_id)
+        self.datasets[f"{dataset.project}.{dataset.dataset_id}"] = dataset.default_table_expiration_ms
+        return dataset
+    
+    def update_dataset(self, dataset, fields):
+        assert fields == ["default_table_expiration_ms"]
+        if self.update_error:
+            raise self.update_error
+        self.updated.append(dataset.dataset_id)
+        self.datasets[f"{dataset.project}.{dataset.dataset_id}"] = dataset.default_table_expiration_ms
+        return dataset
+
+def test_staging_dataset_expiration():
+    """测试暂存数据集：不存在时创建，已存在但没有默认过期时间时补上，其他错误不当作不存在"""
+    print("\n🧪 测试暂存数据集默认过期时间")
+    print("=" * 50)
+    
+    day_ms = 24 * 3600 * 1000
+    cases = [
+        ({}, ['ds_staging'], []),
+        ({'proj.ds_staging': None}, [], ['ds_staging']),
+        ({'proj.ds_staging': 2 * day_ms}, [], []),
+    ]
+    for datasets, created, updated in cases:
+        bq = DatasetBigQuery(dict(datasets))
+        StagingTableManager(bq, 'proj', 'ds', expiration_hours=24, run_id='r1').table_id('orders', 'merge')
+        assert (bq.created, bq.updated) == (created, updated), datasets
+        assert bq.datasets['proj.ds_staging'] == (datasets.get('proj.ds_staging') or day_ms)
+    print("  ✅ 新建 / 补设过期时间 / 保留已有过期时间")
+    
+    # 无法修改数据集时只告警，暂存表仍可使用
+    bq = DatasetBigQuery({'proj.ds_staging': None}, update_error=Forbidden("update denied"))
+    staging_tables = StagingTableManager(bq, 'proj', 'ds', expiration_hours=24, run_id='r1')
+    assert staging_tables.table_id('orders', 'merge') == "proj.ds_staging.orders_merge_r1_w1"
+    
+    # 权限、认证等错误不是"数据集不存在"，不尝试创建
+    bq = DatasetBigQuery(get_error=Forbidden("access denied"))
+    try:
+        StagingTableManager(bq, 'proj', 'ds', run_id='r1').table_id('orders', 'merge')
+        raise AssertionError("读取数据集失败应抛出")
+    except Forbidden:
+        pass
+    assert bq.created == []
+    print("  ✅ 无法修改时告警继续，读取失败时不创建数据集")
+
+def test_table_registry_single_flight():
+    """测试表登记：并发租户只创建一次表，之后不再访问BigQuery元数据接口"""
+    print("\n🧪 测试 BigQuery 表登记单飞创建")
+    print("=" * 50)
+    
+    bq = CountingBigQuery()
+    syncer = make_syncer(bq, 'staged_swap')
+    
+    threads = [threading.Thread(target=syncer.ensure_bq_table, args=('orders', SCHEMA)) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert sorted(bq.calls) == ['create_dataset', 'create_table', 'get_dataset', 'get_table'], bq.calls
+    
+    syncer.ensure_bq_table('orders', SCHEMA)
+    assert len(bq.calls) == 4
+    print(f"  ✅ 8 个并发租户共 {len(bq.calls)} 次元数据请求: {bq.calls}")
+
+if __name__ == "__main__":
+    test_staged_swap_full_sync()
+    test_staged_swap_resume()
+    test_delete_append_gap()
+    test_storage_write_modes()
+    test_storage_write_deferred_merge()
+    test_tenant_batch_merge()
+    test_merge_prune_predicates()
+    test_dml_conflict_retry()
+    test_staging_dataset_expiration()
+    test_table_registry_single_flight()
+    print("\n🎉 所有测试完成！")
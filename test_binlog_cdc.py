@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+"""
+测试 binlog CDC 数据源（使用录制的binlog事件，无需真实MySQL）
+"""
+
+import sys
+import json
+import tempfile
+from pathlib import Path
+from datetime import datetime
+
+# 添加当前目录到路径
+sys.path.append('.')
+
+from pymysqlreplication.row_event import UpdateRowsEvent
+
+from smart_sync_incremental_optimized import (
+    BINLOG_STREAM_ID, BinlogCDCSource, LocalFileStatusManager, OptimizedIncrementalSyncer
+)
+
+FIXTURE_FILE = Path(__file__).parent / "fixtures" / "binlog_events.json"
+
+def load_recorded_events(position):
+    """按起始位置重放录制的binlog事件"""
+    with open(FIXTURE_FILE, 'r', encoding='utf-8') as f:
+        events = json.load(f)
+    
+    start = (position['log_file'], position['log_pos'])
+    for event in events:
+        if (event['log_file'], event['log_pos']) > start:
+            yield event
+
+def test_read_batches():
+    """测试事务边界切分和主键压缩"""
+    print("🧪 测试binlog批次读取")
+    print("=" * 50)
+    
+    source = BinlogCDCSource({}, ['shop1', 'shop2'], ['orders'], batch_size=1,
+                             event_stream_factory=load_recorded_events)
+    batches = list(source.read_batches(
+        {'log_file': 'mysql-bin.000012', 'log_pos': 4}, lambda db, table: ['id']
+    ))
+    
+    # batch_size=1：每个事务一个批次
+    assert [batch['position']['log_pos'] for batch in batches] == [1350, 1900, 2000, 150]
+    
+    second = batches[1]['changes'][('shop1', 'orders')]
+    assert [row['status'] for row in second['upserts']] == ['paid']
+    assert [row['id'] for row in second['deletes']] == [2]
+    
+    # 更新改变了主键 (1 -> 3)：删除旧主键的行，写入新主键的行
+    third = batches[2]['changes'][('shop1', 'orders')]
+    assert [row['id'] for row in third['upserts']] == [3]
+    assert [row['id'] for row in third['deletes']] == [1]
+    print(f"  ✅ {len(batches)} 个批次, 最后位置 {batches[-1]['position']}")
+    
+    # 大批次：同一主键的多次变更只保留最后一次
+    source.batch_size = 1000
+    batches = list(source.read_batches(
+        {'log_file': 'mysql-bin.000012', 'log_pos': 4}, lambda db, table: ['id']
+    ))
+    assert len(batches) == 1
+    shop1 = batches[0]['changes'][('shop1', 'orders')]
+    assert [(row['id'], row['status']) for row in shop1['upserts']] == [(3, 'paid')]
+    assert [row['id'] for row in shop1['deletes']] == [2, 1]
+    print("  ✅ 批次内主键变更已压缩")
+
+class RecordedUpdateEvent(UpdateRowsEvent):
+    """不需要解析binlog数据包的 UpdateRowsEvent"""
+    
+    def __init__(self, schema, table, rows):
+        self.schema = schema
+        self.table = table
+        self._RowsEvent__rows = rows
+
+def test_normalize_update_event():
+    """测试更新事件保留更新前的行，用于识别主键变更"""
+    print("\n🧪 测试binlog更新事件转换")
+    print("=" * 50)
+    
+    stream = type('Stream', (), {'log_file': 'mysql-bin.000012', 'log_pos': 1950})()
+    event = RecordedUpdateEvent('shop1', 'orders', [
+        {'before_values': {'id': 1, 'status': 'paid'}, 'after_values': {'id': 3, 'status': 'paid'}}
+    ])
+    assert BinlogCDCSource._normalize_event(event, stream) == {
+        'type': 'update', 'schema': 'shop1', 'table': 'orders',
+        'rows': [{'id': 3, 'status': 'paid'}], 'before_rows': [{'id': 1, 'status': 'paid'}],
+        'log_file': 'mysql-bin.000012', 'log_pos': 1950
+    }
+    print("  ✅ 更新事件包含更新前后的行")
+
+def test_sync_binlog_changes():
+    """测试CDC变更写入路径和位置推进"""
+    print("\n🧪 测试binlog CDC同步")
+    print("=" * 50)
+    
+    syncer = OptimizedIncrementalSyncer.__new__(OptimizedIncrementalSyncer)
+    syncer.params = {'db_list': 'shop1,shop2', 'table_list': 'orders'}
+    syncer.batch_size = 1000
+    syncer.status_manager = LocalFileStatusManager(tempfile.mkdtemp())
+    syncer.status_manager.save_cdc_position(BINLOG_STREAM_ID, {'log_file': 'mysql-bin.000012', 'log_pos': 4})
+    
+    applied = []
+    syncer.table_analyzer = type('Analyzer', (), {
+        'get_table_info': lambda self, db, table: {'primary_keys': ['id']}
+    })()
+    syncer.apply_cdc_changes = lambda db, table, change, sync_time: applied.append(
+        (db, len(change['upserts']), len(change['deletes']))
+    ) or len(change['upserts']) + len(change['deletes'])
+    syncer._print_sync_report = lambda stats: None
+    
+    source = BinlogCDCSource({}, ['shop1', 'shop2'], ['orders'], batch_size=1000,
+                             event_stream_factory=load_recorded_events)
+    stats = syncer.sync_binlog_changes(cdc_source=source)
+    
+    assert stats['failed_count'] == 0
+    assert sorted(applied) == [('shop1', 1, 2), ('shop2', 1, 0)]
+    assert syncer.status_manager.get_cdc_position(BINLOG_STREAM_ID) == {'log_file': 'mysql-bin.000013', 'log_pos': 150}
+    assert syncer.status_manager.get_last_sync_time('shop2', 'orders') is not None
+    print(f"  ✅ 已应用 {stats['total_records']} 行变更，位置已推进")
+
+if __name__ == "__main__":
+    test_read_batches()
+    test_normalize_update_event()
+    test_sync_binlog_changes()
+    print("\n🎉 所有测试完成！")
@@ -0,0 +1,679 @@
+#!/usr/bin/env python3
+"""
+测试 MySQL 分页读取（使用 SQLite 替身执行同步工具生成的SQL，无需真实MySQL）
+"""
+
+import sys
+import sqlite3
+import tempfile
+import threading
+from datetime import datetime, timedelta, timezone
+
+# 添加当前目录到路径
+sys.path.append('.')
+
+import mysql.connector
+
+from smart_sync_incremental_optimized import (
+    LocalFileStatusManager, OptimizedIncrementalSyncer, PKRangeSplitter, TableAnalyzer
+)
+
+sqlite3.register_adapter(datetime, lambda value: value.isoformat(" "))
+sqlite3.register_converter("DATETIME", lambda value: datetime.fromisoformat(value.decode()))
+
+class SQLiteMySQLCursor:
+    def __init__(self, connection, dictionary):
+        self.connection = connection
+        self.dictionary = dictionary
+        self._rows = []
+
+    def execute(self, query, params=()):
+        query = query.strip()
+        if query.upper().startswith("USE "):
+            self.connection.use(query.split()[1])
+            return
+
+        pool = self.connection.pool
+        with pool.lock:
+            pool.queries.append((query, tuple(params)))
+        if query.startswith("SELECT TABLE_ROWS FROM INFORMATION_SCHEMA.TABLES"):
+            # 估算行数：默认返回实际行数，table_rows 可模拟过期的统计信息
+            db_name, table_name = params
+            count = pool.table_rows.get((db_name, table_name))
+            if count is None:
+                count = pool.database(db_name).execute(f"SELECT COUNT(*) FROM {table_name}").fetchone()[0]
+            self._rows = [{'TABLE_ROWS': count} if self.dictionary else (count,)]
+            return
+
+        cursor = self.connection.db.execute(query.replace("%s", "?"), tuple(params))
+        names = [column[0] for column in cursor.description]
+        self._rows = [dict(zip(names, row)) if self.dictionary else row for row in cursor.fetchall()]
+
+    def fetchall(self):
+        rows, self._rows = self._rows, []
+        return rows
+
+    def fetchmany(self, size):
+        rows, self._rows = self._rows[:size], self._rows[size:]
+        return rows
+
+    def fetchone(self):
+        return self._rows.pop(0) if self._rows else None
+
+    def close(self):
+        pass
+
+class SQLiteMySQLConnection:
+    def __init__(self, pool):
+        self.pool = pool
+        self.db = None
+        self.closed = False
+
+    def use(self, db_name):
+        self.db = self.pool.database(db_name)
+
+    def cursor(self, dictionary=False, buffered=False):
+        return SQLiteMySQLCursor(self, dictionary)
+
+    def commit(self):
+        pass
+
+    def close(self):
+        if not self.closed:
+            self.closed = True
+            with self.pool.lock:
+                self.pool.in_use -= 1
+
+class SQLiteMySQLPool:
+    """MySQL 连接池替身：每个库是一个 SQLite 数据库，生成的SQL把 %s 换成 ? 后原样执行
+
+    pool_size 限制同时借出的连接数，耗尽时与 mysql.connector 一样抛出 PoolError。
+    DATETIME 列以 datetime 返回，分页游标与真实驱动一样是 Python 值。
+    """
+
+    def __init__(self, databases, pool_size=5):
+        self.directory = tempfile.mkdtemp()
+        self.pool_size = pool_size
+        self.in_use = 0
+        self.max_in_use = 0
+        self.queries = []
+        self.table_rows = {}
+        self.lock = threading.Lock()
+        for db_name, script in databases.items():
+            self.database(db_name).executescript(script)
+
+    def database(self, db_name):
+        return sqlite3.connect(f"{self.directory}/{db_name}.db", detect_types=sqlite3.PARSE_DECLTYPES,
+                               check_same_thread=False)
+
+    def get_connection(self):
+        with self.lock:
+            if self.in_use >= self.pool_size:
+                raise mysql.connector.errors.PoolError("Failed getting connection; pool exhausted")
+            self.in_use += 1
+            self.max_in_use = max(self.max_in_use, self.in_use)
+        return SQLiteMySQLConnection(self)
+
+    def data_queries(self):
+        return [(query, params) for query, params in self.queries if query.startswith("SELECT") and " FROM " in query
+                and "INFORMATION_SCHEMA" not in query]
+
+def make_reader(pool, batch_size=3):
+    """只初始化读取路径需要的字段"""
+    syncer = OptimizedIncrementalSyncer.__new__(OptimizedIncrementalSyncer)
+    syncer.connection_pool = pool
+    syncer.batch_size = batch_size
+    syncer.lookback_minutes = 10
+    syncer._source_utc_offset = None
+    syncer._high_marks = {}
+    syncer._pipeline_stats_lock = threading.Lock()
+    return syncer
+
+def table_info(primary_keys, field_types, timestamp_field=None, columns=None):
+    return {'primary_keys': primary_keys, 'field_types': field_types,
+            'timestamp_field': timestamp_field, 'columns': columns, 'schema': []}
+
+ORDER_ITEMS = """
+    CREATE TABLE order_items (order_id INTEGER NOT NULL, line_no INTEGER NOT NULL, sku TEXT,
+                              PRIMARY KEY (order_id, line_no));
+""" + "".join(
+    f"INSERT INTO order_items VALUES ({order_id}, {line_no}, 'sku-{order_id}-{line_no}');\n"
+    for order_id in (1, 2, 3, 5) for line_no in (1, 2, 3)
+)
+ORDER_ITEMS_INFO = table_info(['order_id', 'line_no'], {'order_id': 'int(11)', 'line_no': 'int(11)', 'sku': 'varchar(20)'})
+
+def read_all(chunks):
+    rows, positions = [], []
+    for chunk, position in chunks:
+        rows.extend(chunk)
+        positions.append(position)
+    return rows, positions
+
+def test_keyset_predicate():
+    """测试键集分页条件：单主键和复合主键展开为 OR 形式"""
+    print("🧪 测试键集分页条件")
+    print("=" * 50)
+
+    syncer = make_reader(None)
+    assert syncer._build_keyset_predicate(['id'], (5,)) == ("((id > %s))", (5,))
+
+    predicate, params = syncer._build_keyset_predicate(['order_id', 'line_no', 'sku'], (2, 3, 'b'))
+    assert predicate == ("((order_id > %s) OR (order_id = %s AND line_no > %s) "
+                         "OR (order_id = %s AND line_no = %s AND sku > %s))")
+    assert params == (2, 2, 3, 2, 3, 'b')
+    print(f"  ✅ {predicate}")
+
+def test_keyset_paging_composite_key():
+    """测试复合主键键集分页：按主键顺序读完所有行，不重复、不遗漏，可从保存的游标继续"""
+    print("\n🧪 测试复合主键键集分页")
+    print("=" * 50)
+
+    pool = SQLiteMySQLPool({'shop1': ORDER_ITEMS})
+    syncer = make_reader(pool, batch_size=4)
+    expected = [(order_id, line_no) for order_id in (1, 2, 3, 5) for line_no in (1, 2, 3)]
+
+    rows, positions = read_all(syncer.iter_table_data_keyset(
+        'shop1', 'order_items', ORDER_ITEMS_INFO, datetime.now(), normalize=False
+    ))
+    assert [(row['order_id'], row['line_no']) for row in rows] == expected
+    # 每页的游标是该页最后一行的主键；12 行、每页 4 行：第 4 页为空
+    assert positions == [(2, 1), (3, 2), (5, 3)]
+    assert len(pool.data_queries()) == 4
+    assert pool.in_use == 0
+
+    # 页边界落在同一个 order_id 内部：(2, 1) 之后应从 (2, 2) 开始
+    rows, _ = read_all(syncer.iter_table_data_keyset(
+        'shop1', 'order_items', ORDER_ITEMS_INFO, datetime.now(), start_after=(2, 1), normalize=False
+    ))
+    assert [(row['order_id'], row['line_no']) for row in rows] == expected[4:]
+    print(f"  ✅ {len(expected)} 行分 {len(positions)} 页读取，游标 {positions}，从 (2, 1) 续读 {len(rows)} 行")
+
+def test_keyset_paging_with_condition():
+    """测试附加条件（主键范围、行过滤）与键集条件同时生效，参数顺序正确"""
+    print("\n🧪 测试键集分页附加条件")
+    print("=" * 50)
+
+    pool = SQLiteMySQLPool({'shop1': ORDER_ITEMS})
+    syncer = make_reader(pool, batch_size=2)
+    rows, _ = read_all(syncer.iter_table_data_keyset(
+        'shop1', 'order_items', ORDER_ITEMS_INFO, datetime.now(),
+        extra_condition=("order_id >= %s AND line_no != %s", (2, 2)), normalize=False
+    ))
+    assert [(row['order_id'], row['line_no']) for row in rows] == [(2, 1), (2, 3), (3, 1), (3, 3), (5, 1), (5, 3)]
+    print(f"  ✅ 附加条件生效: {len(rows)} 行")
+
+ORDERS = """
+    CREATE TABLE orders (id INTEGER PRIMARY KEY, code TEXT NOT NULL, status TEXT, updated_at DATETIME);
+    CREATE TABLE empty_orders (id INTEGER PRIMARY KEY);
+    CREATE TABLE tiny (id INTEGER PRIMARY KEY);
+    INSERT INTO tiny VALUES (10), (11), (12), (13), (14);
+""" + "".join(
+    f"INSERT INTO orders VALUES ({i}, 'c{i:03d}', '{'deleted' if i % 10 == 0 else 'paid'}', "
+    f"'2024-01-01 00:{i // 60:02d}:{i % 60:02d}');\n"
+    for i in range(1, 101)
+)
+ORDERS_INFO = table_info(['id'], {'id': 'int(11)', 'code': 'varchar(10)', 'status': 'varchar(10)',
+                                  'updated_at': 'datetime'}, 'updated_at')
+
+def range_row_ids(pool, db_name, table_name, split_key, key_ranges):
+    """按切分结果逐段查询，返回每段的主键列表"""
+    database = pool.database(db_name)
+    result = []
+    for key_range in key_ranges:
+        condition, params = PKRangeSplitter.build_range_condition(split_key, key_range)
+        result.append([row[0] for row in database.execute(
+            f"SELECT {split_key} FROM {table_name} WHERE {condition.replace('%s', '?')} ORDER BY {split_key}", params
+        )])
+    return result
+
+def test_range_condition():
+    """测试主键范围条件：下界包含、上界不包含，无界的一侧不生成条件"""
+    print("\n🧪 测试主键范围条件")
+    print("=" * 50)
+
+    build = PKRangeSplitter.build_range_condition
+    assert build('id', (None, None)) == ("1 = 1", ())
+    assert build('id', (None, 26)) == ("id < %s", (26,))
+    assert build('id', (76, None)) == ("id >= %s", (76,))
+    assert build('code', ('c010', 'c020')) == ("code >= %s AND code < %s", ('c010', 'c020'))
+    print("  ✅ [下界, 上界) 条件正确")
+
+def test_range_split():
+    """测试主键范围切分：各段互不相交且覆盖所有行；小表、空表、统计信息过期时不切分"""
+    print("\n🧪 测试主键范围切分")
+    print("=" * 50)
+
+    pool = SQLiteMySQLPool({'shop1': ORDERS + ORDER_ITEMS})
+    splitter = PKRangeSplitter(pool)
+    all_ids = list(range(1, 101))
+
+    # 整数主键：按 MIN/MAX 等分
+    ranges = splitter.split('shop1', 'orders', ORDERS_INFO, 4)
+    assert ranges == [(None, 26), (26, 51), (51, 76), (76, None)], ranges
+    segments = range_row_ids(pool, 'shop1', 'orders', 'id', ranges)
+    assert [len(ids) for ids in segments] == [25, 25, 25, 25]
+    assert sorted(sum(segments, [])) == all_ids
+
+    # 非整数主键：按偏移量采样分界点
+    code_info = table_info(['code'], {'code': 'varchar(10)'})
+    ranges = splitter.split('shop1', 'orders', code_info, 4)
+    assert ranges == [(None, 'c026'), ('c026', 'c051'), ('c051', 'c076'), ('c076', None)], ranges
+    assert sorted(sum(range_row_ids(pool, 'shop1', 'orders', 'code', ranges), [])) == [f"c{i:03d}" for i in all_ids]
+
+    # 键值范围比并行度窄：分界点去重后仍然覆盖所有行
+    ranges = splitter.split('shop1', 'tiny', table_info(['id'], {'id': 'int(11)'}), 4)
+    segments = range_row_ids(pool, 'shop1', 'tiny', 'id', ranges)
+    assert sorted(sum(segments, [])) == [10, 11, 12, 13, 14] and all(segments), segments
+
+    # 复合主键按第一列切分：同一订单的所有行落在同一段
+    ranges = splitter.split('shop1', 'order_items', ORDER_ITEMS_INFO, 2)
+    segments = range_row_ids(pool, 'shop1', 'order_items', 'order_id', ranges)
+    assert sorted(sum(segments, [])) == sorted(order_id for order_id in (1, 2, 3, 5) for _ in range(3))
+    assert not set(segments[0]) & set(segments[1])
+
+    # 不切分：并行度 1、无主键、行数低于阈值、空表、统计信息过期（估算有行但表已清空）
+    assert splitter.split('shop1', 'orders', ORDERS_INFO, 1) == []
+    assert splitter.split('shop1', 'orders', table_info([], ORDERS_INFO['field_types']), 4) == []
+    assert splitter.split('shop1', 'orders', ORDERS_INFO, 4, min_rows=1000) == []
+    empty_info = table_info(['id'], {'id': 'int(11)'})
+    assert splitter.split('shop1', 'empty_orders', empty_info, 4) == []
+    pool.table_rows[('shop1', 'empty_orders')] = 5000
+    assert splitter.split('shop1', 'empty_orders', empty_info, 4) == []
+    assert pool.in_use == 0
+    print("  ✅ 整数/字符串/复合主键切分覆盖全部行，小表和空表不切分")
+
+def make_range_syncer(pool, status_dir, spare_connections):
+    """范围并行同步需要的字段；写入BigQuery替换为记录写入的行"""
+    syncer = make_reader(pool, batch_size=10)
+    syncer.status_manager = LocalFileStatusManager(status_dir)
+    syncer.keyset_full_sync = True
+    syncer.seek_incremental = True
+    syncer.tenant_batch_merge = False
+    syncer.storage_write_sink = None
+    syncer._pipeline_stats = {}
+    syncer._range_reader_slots = threading.Semaphore(spare_connections)
+    syncer.written = []
+    
+    def stream_to_bigquery(table_name, chunks, table_info, sync_mode, replace_tenant_data=True,
+                           on_chunk_committed=None, transform=None, stage_stats=None):
+        records = 0
+        for chunk_seq, (rows, position) in enumerate(chunks, start=1):
+            with syncer._pipeline_stats_lock:
+                syncer.written.extend(row['id'] for row in rows)
+            records += len(rows)
+            on_chunk_committed(chunk_seq, position, records)
+        return records
+    
+    syncer.stream_to_bigquery = stream_to_bigquery
+    return syncer
+
+def test_range_resume_and_connection_budget():
+    """测试范围并行同步：续传跳过已完成的 range-N，并行度受空闲连接预算限制"""
+    print("\n🧪 测试主键范围并行同步续传与连接预算")
+    print("=" * 50)
+
+    key_ranges = [(None, 26), (26, 51), (51, 76), (76, None)]
+    run_started_at = datetime(2025, 9, 29, 10, 0, 0)
+    
+    for spare_connections, expected_max_connections in ((1, 2), (0, 1)):
+        pool = SQLiteMySQLPool({'shop1': ORDERS})
+        syncer = make_range_syncer(pool, tempfile.mkdtemp(), spare_connections)
+        
+        # 上次运行已完成 range-1
+        status_manager = syncer.status_manager
+        status_manager.save_checkpoint('shop1', 'orders', 'FULL', run_started_at, key_ranges=key_ranges)
+        status_manager.save_checkpoint('shop1', 'orders', 'FULL', run_started_at, segment_id='range-1',
+                                       position=(50,), chunk_seq=3, records_synced=25, done=True)
+        checkpoint = status_manager.get_checkpoint('shop1', 'orders')
+        assert list(checkpoint['key_ranges']) == key_ranges
+        
+        records = syncer.sync_ranges_parallel('shop1', 'orders', ORDERS_INFO, 'FULL', checkpoint['key_ranges'],
+                                              current_sync_time=run_started_at, checkpoint=checkpoint)
+        assert records == 100
+        assert sorted(syncer.written) == [i for i in range(1, 101) if not 26 <= i < 51]
+        assert pool.max_in_use == expected_max_connections, pool.max_in_use
+        # 借用的连接已归还
+        assert syncer._range_reader_slots.acquire(blocking=False) == (spare_connections > 0)
+        
+        segments = status_manager.get_checkpoint('shop1', 'orders')['segments']
+        assert all(segments[f"range-{i}"]['done'] for i in range(4))
+        print(f"  ✅ 空闲连接 {spare_connections}: 跳过 range-1，其余 75 行最多占用 {pool.max_in_use} 个连接")
+
+class ClockCursor:
+    """read_source_clock 用的游标替身：NOW(6) 返回会话时区的固定时间，INNODB_TRX 返回预置的延迟或抛出权限错误"""
+
+    def __init__(self, pool):
+        self.pool = pool
+        self._row = None
+
+    def execute(self, query, params=()):
+        self.pool.queries.append(query.strip())
+        if "INNODB_TRX" in query:
+            if self.pool.trx_error:
+                raise mysql.connector.errors.ProgrammingError("Access denied; you need the PROCESS privilege")
+            self._row = (self.pool.lag_us,)
+        else:
+            # NOW(6) 是会话时区的时间，UTC_TIMESTAMP(6) 是同一时刻的UTC时间
+            utc_now = self.pool.now.replace(tzinfo=self.pool.session_tz).astimezone(timezone.utc)
+            self._row = (self.pool.now, utc_now.replace(tzinfo=None))
+
+    def fetchone(self):
+        return self._row
+
+    def close(self):
+        pass
+
+class ClockPool:
+    def __init__(self, now, lag_us=None, trx_error=False, session_tz=None):
+        self.now = now
+        self.session_tz = session_tz or datetime.now().astimezone().tzinfo
+        self.lag_us = lag_us
+        self.trx_error = trx_error
+        self.queries = []
+        self.connections = 0
+
+    def get_connection(self):
+        pool = self
+        pool.connections += 1
+
+        class Connection:
+            def cursor(self):
+                return ClockCursor(pool)
+
+            def close(self):
+                pool.connections -= 1
+        return Connection()
+
+def make_watermark_syncer(pool, adaptive_lookback=True, safety_seconds=0):
+    syncer = make_reader(pool)
+    syncer.adaptive_lookback = adaptive_lookback
+    syncer.watermark_safety_seconds = safety_seconds
+    syncer._innodb_trx_unavailable = False
+    return syncer
+
+def test_read_source_clock():
+    """测试源库时钟：提交延迟取最早写事务的持续时间，无写事务为0，无 PROCESS 权限时回退且不再查询"""
+    print("\n🧪 测试源库时钟与提交延迟...")
+
+    now = datetime(2024, 1, 1, 12, 0, 0, 500000)
+    syncer = make_watermark_syncer(ClockPool(now, lag_us=2500000))
+    clock = syncer.read_source_clock()
+    assert clock == {'now': now, 'commit_lag': 2.5}, clock
+
+    syncer = make_watermark_syncer(ClockPool(now, lag_us=None))
+    assert syncer.read_source_clock()['commit_lag'] == 0.0
+
+    # 源库与同步主机时钟不同步时 TIMESTAMPDIFF 可能为负，按0处理
+    syncer = make_watermark_syncer(ClockPool(now, lag_us=-3))
+    assert syncer.read_source_clock()['commit_lag'] == 0.0
+
+    pool = ClockPool(now, trx_error=True)
+    syncer = make_watermark_syncer(pool)
+    assert syncer.read_source_clock() == {'now': now, 'commit_lag': None}
+    assert syncer._innodb_trx_unavailable
+    pool.queries.clear()
+    assert syncer.read_source_clock()['commit_lag'] is None
+    assert not any("INNODB_TRX" in query for query in pool.queries)
+    assert pool.connections == 0
+
+    pool = ClockPool(now, lag_us=100)
+    syncer = make_watermark_syncer(pool, adaptive_lookback=False)
+    assert syncer.read_source_clock()['commit_lag'] is None
+    assert len(pool.queries) == 1
+    print("  ✅ 提交延迟 2.5s / 无写事务 0s / 无权限回退并不再查询 / 关闭自适应")
+
+    # 源库会话时区与同步主机不同：源库时间仍是会话时区的时间（与 DATETIME 字段一致），不按主机时区换算
+    host_offset = datetime.now().astimezone().utcoffset()
+    session_tz = timezone(host_offset + timedelta(hours=5))
+    syncer = make_watermark_syncer(ClockPool(now, lag_us=0, session_tz=session_tz))
+    assert syncer.read_source_clock() == {'now': now, 'commit_lag': 0.0}
+    # Unix时间戳字段按会话时区换算为真实的Unix时间
+    unix_info = table_info(['id'], {'id': 'int(11)', 'updated_at': 'int(11)'}, 'updated_at')
+    unix_now = int(now.replace(tzinfo=session_tz).timestamp())
+    assert syncer._incremental_upper_bound(unix_info, now) == unix_now
+    assert syncer._incremental_upper_bound(ORDERS_INFO, now) == now
+    print(f"  ✅ 会话时区 {session_tz} 与主机时区不同时源库时间不偏移，Unix时间戳按会话时区换算")
+
+def test_next_watermark():
+    """测试水位：最大位置早于安全点时从 (ts, pk) 之后读取，否则从安全点（含）读取"""
+    print("\n🧪 测试增量水位计算...")
+
+    now = datetime(2024, 1, 1, 0, 5, 0)
+    syncer = make_watermark_syncer(None, safety_seconds=5)
+
+    def next_watermark(high_mark, source_clock, info=ORDERS_INFO):
+        if high_mark is not None:
+            syncer._record_high_mark('shop1', 'orders', high_mark)
+        return syncer._next_watermark('shop1', 'orders', info, now, source_clock)
+
+    # 安全点 = 00:05:00 - 30s - 5s = 00:04:25
+    clock = {'now': now, 'commit_lag': 30.0}
+    assert next_watermark((datetime(2024, 1, 1, 0, 4, 0), 42), clock) == \
+        {'ts': datetime(2024, 1, 1, 0, 4, 0), 'pk': (42,), 'inclusive': False}
+    assert next_watermark((datetime(2024, 1, 1, 0, 4, 50), 42), clock) == \
+        {'ts': datetime(2024, 1, 1, 0, 4, 25), 'pk': None, 'inclusive': True}
+    # 没有读取到行：从安全点开始
+    assert next_watermark(None, clock) == {'ts': datetime(2024, 1, 1, 0, 4, 25), 'pk': None, 'inclusive': True}
+    # 高水位在读取后被取走，不影响下一次计算
+    assert syncer._high_marks == {}
+
+    # 无法测量提交延迟：按 lookback_minutes（10分钟）计算安全点，已读到的位置仍可使用
+    unmeasured = {'now': now, 'commit_lag': None}
+    assert next_watermark((datetime(2023, 12, 31, 23, 50, 0), 7), unmeasured) == \
+        {'ts': datetime(2023, 12, 31, 23, 50, 0), 'pk': (7,), 'inclusive': False}
+    assert next_watermark((datetime(2024, 1, 1, 0, 0, 0), 7), unmeasured)['ts'] == datetime(2023, 12, 31, 23, 54, 55)
+
+    # 断点续传（没有本次的时钟快照）：不信任读取位置，从回看窗口的安全点开始
+    assert next_watermark((datetime(2023, 12, 31, 23, 0, 0), 7), None) == \
+        {'ts': datetime(2023, 12, 31, 23, 54, 55), 'pk': None, 'inclusive': True}
+
+    # Unix时间戳字段：安全点为整数秒，datetime 位置与类型不符时不使用
+    unix_info = table_info(['id'], {'id': 'int(11)', 'updated_at': 'int(11)'}, 'updated_at')
+    safe_unix = int(now.timestamp()) - 35
+    assert next_watermark((safe_unix - 100, 3), clock, unix_info) == {'ts': safe_unix - 100, 'pk': (3,), 'inclusive': False}
+    assert next_watermark((datetime(2024, 1, 1), 3), clock, unix_info) == {'ts': safe_unix, 'pk': None, 'inclusive': True}
+    # 源库会话时区为 UTC+09:00：源库时间 00:05:00 是 UTC 前一天 15:05:00
+    syncer._source_utc_offset = timedelta(hours=9)
+    utc_safe_unix = int(datetime(2023, 12, 31, 15, 5, 0, tzinfo=timezone.utc).timestamp()) - 35
+    assert next_watermark(None, clock, unix_info) == {'ts': utc_safe_unix, 'pk': None, 'inclusive': True}
+    assert next_watermark(None, clock)['ts'] == datetime(2024, 1, 1, 0, 4, 25)
+    syncer._source_utc_offset = None
+
+    assert next_watermark(None, clock, table_info(['id'], {'id': 'int(11)'})) is None
+    print("  ✅ 安全点前排他 (ts, pk) / 安全点后包含 / 回看窗口兜底 / Unix时间戳")
+
+def test_watermark_handover_to_seek():
+    """测试水位交接给增量分页读取：排他水位不重读同一时间戳下已读的行，包含水位不漏读延迟提交的行"""
+    print("\n🧪 测试水位与增量分页读取的交接...")
+
+    pool = SQLiteMySQLPool({'shop1': ORDERS})
+    syncer = make_watermark_syncer(pool)
+    last_sync_time = datetime(2024, 1, 1, 0, 0, 0)
+    upper = datetime(2024, 1, 1, 0, 10, 0)
+
+    def read_ids(watermark):
+        chunks = syncer.iter_table_data_seek('shop1', 'orders', ORDERS_INFO, last_sync_time, upper,
+                                             normalize=False, watermark=watermark)
+        rows, _ = read_all(chunks)
+        return [row['id'] for row in rows]
+
+    assert read_ids(None) == list(range(1, 101))
+    # 源库时间 00:05:00、无写事务：最后一行 (00:01:40, 100) 早于安全点，排他水位
+    watermark = syncer._next_watermark('shop1', 'orders', ORDERS_INFO, datetime(2024, 1, 1, 0, 5, 0),
+                                       {'now': datetime(2024, 1, 1, 0, 5, 0), 'commit_lag': 0.0})
+    assert watermark == {'ts': datetime(2024, 1, 1, 0, 1, 40), 'pk': (100,), 'inclusive': False}
+
+    # 之后写入：与最后一行同一时间戳但主键更大的行、更晚的行
+    db = pool.database('shop1')
+    db.executescript("""
+        INSERT INTO orders VALUES (101, 'c101', 'paid', '2024-01-01 00:01:40');
+        INSERT INTO orders VALUES (102, 'c102', 'paid', '2024-01-01 00:03:00');
+        UPDATE orders SET updated_at = '2024-01-01 00:03:00' WHERE id = 7;
+    """)
+    db.commit()
+    assert read_ids(watermark) == [101, 7, 102]
+    print("  ✅ 排他水位：只读取 (ts, pk) 之后的 3 行，不重读第 100 行")
+
+    # 长事务延迟提交：安全点 00:01:20 之后的行重读，事务提交的旧时间戳行不会漏掉
+    watermark = syncer._next_watermark('shop1', 'orders', ORDERS_INFO, datetime(2024, 1, 1, 0, 3, 30),
+                                       {'now': datetime(2024, 1, 1, 0, 3, 30), 'commit_lag': 130.0})
+    assert watermark == {'ts': datetime(2024, 1, 1, 0, 1, 20), 'pk': None, 'inclusive': True}
+    db.executescript("INSERT INTO orders VALUES (103, 'c103', 'paid', '2024-01-01 00:01:25');")
+    db.commit()
+    ids = read_ids(watermark)
+    assert 103 in ids and ids[:6] == [80, 81, 82, 83, 84, 85] and 79 not in ids
+    print(f"  ✅ 包含水位：从安全点重读 {len(ids)} 行，延迟提交的第 103 行被读取")
+
+BURST = """
+    CREATE TABLE events (shop_id INTEGER NOT NULL, id INTEGER NOT NULL, updated_at DATETIME,
+                         PRIMARY KEY (shop_id, id));
+""" + "".join(
+    # 10 行同在 00:00:01，7 行同在 00:00:02（其中主键交错插入），1 行恰好在上界，1 行超过上界
+    f"INSERT INTO events VALUES ({shop_id}, {i}, '2024-01-01 00:00:0{ts}');\n"
+    for shop_id, i, ts in [(2, 5, 1), (1, 9, 1), (1, 1, 1), (2, 1, 1), (1, 3, 1), (3, 2, 1), (1, 2, 1),
+                           (2, 2, 1), (3, 1, 1), (1, 4, 1),
+                           (1, 8, 2), (2, 7, 2), (1, 5, 2), (2, 3, 2), (1, 6, 2), (3, 3, 2), (1, 7, 2),
+                           (1, 10, 3), (1, 11, 4)]
+)
+BURST_INFO = table_info(['shop_id', 'id'], {'shop_id': 'int(11)', 'id': 'int(11)', 'updated_at': 'datetime'},
+                        'updated_at')
+
+def test_seek_timestamp_ties():
+    """测试增量分页：同一时间戳的大量行跨页时按 (ts, 主键) 游标不重不漏，可从突发更新的中间续传"""
+    print("\n🧪 测试增量分页时间戳并列跨页...")
+
+    pool = SQLiteMySQLPool({'shop1': BURST})
+    expected = sorted(pool.database('shop1').execute(
+        "SELECT updated_at, shop_id, id FROM events WHERE updated_at <= '2024-01-01 00:00:03'").fetchall())
+    last_sync_time = datetime(2024, 1, 1, 0, 10, 0)
+    upper = datetime(2024, 1, 1, 0, 0, 3)
+    watermark = {'ts': datetime(2024, 1, 1, 0, 0, 0), 'pk': None, 'inclusive': True}
+
+    for batch_size in (1, 3, 4, 10, 18):
+        syncer = make_reader(pool, batch_size)
+        rows, positions = read_all(syncer.iter_table_data_seek(
+            'shop1', 'events', BURST_INFO, last_sync_time, upper, normalize=False, watermark=watermark))
+        keys = [(row['updated_at'], row['shop_id'], row['id']) for row in rows]
+        assert keys == expected, (batch_size, keys)
+        # 每页的位置是该页最后一行，用作下一页的游标
+        assert positions[-1] == expected[-1] and len(positions) == -(-len(expected) // batch_size)
+        assert syncer._high_marks[('shop1', 'events')] == expected[-1]
+    print(f"  ✅ {len(expected)} 行（17 行并列在两个时间戳）在不同页大小下均不重不漏，上界含边界值")
+
+    # 从并列时间戳中间的断点继续（同一时间戳下主键更大的行）
+    syncer = make_reader(pool, 3)
+    start_after = expected[5]
+    pool.queries.clear()
+    rows, _ = read_all(syncer.iter_table_data_seek(
+        'shop1', 'events', BURST_INFO, last_sync_time, upper, start_after=start_after, normalize=False))
+    assert [(row['updated_at'], row['shop_id'], row['id']) for row in rows] == expected[6:]
+    first_query, first_params = pool.data_queries()[0]
+    # 展开的 (ts, shop_id, id) > 断点 条件，最后一组为完整断点
+    assert "(updated_at = %s AND shop_id = %s AND id > %s)" in first_query and first_params[3:6] == start_after
+    print(f"  ✅ 从 {start_after} 之后继续读取 {len(rows)} 行")
+
+    # 早期断点只记录了时间戳：从该时间戳（含）重读整组并列行
+    rows, _ = read_all(syncer.iter_table_data_seek(
+        'shop1', 'events', BURST_INFO, last_sync_time, upper, start_after=(expected[5][0],), normalize=False))
+    assert [(row['updated_at'], row['shop_id'], row['id']) for row in rows] == expected
+    print("  ✅ 仅有时间戳的断点从该时间戳（含）重读")
+
+def test_row_filter_validation():
+    """测试行过滤条件校验：只能调用允许的函数，字符串字面量（含 %s）改为查询参数"""
+    print("\n🧪 测试行过滤条件校验...")
+
+    field_types = ORDERS_INFO['field_types']
+    validate = TableAnalyzer.validate_filter_predicate
+    assert validate("code LIKE '%sale%'", field_types) == ("(code LIKE %s)", ('%sale%',))
+    assert validate("status <> 'it''s' AND id % 2 = 0", field_types) == ("(status <> %s AND id % 2 = 0)", ("it's",))
+    assert validate(r"code LIKE 'c\_0%' ESCAPE '\\'", field_types) == ("(code LIKE %s ESCAPE %s)", ('c\\_0%', '\\'))
+    assert validate('status IN ("paid", "a""b")', field_types) == ("(status IN (%s, %s))", ('paid', 'a"b'))
+    assert validate("updated_at >= DATE_SUB(NOW(), INTERVAL 7 DAY) AND COALESCE(`status`, '') != ''",
+                    field_types) == ("(updated_at >= DATE_SUB(NOW(), INTERVAL 7 DAY) AND COALESCE(`status`, %s) != %s)",
+                                     ('', ''))
+    print("  ✅ 允许的函数、关键字和字面量（含 %s、重复引号、反斜杠转义）通过校验")
+
+    rejected = {
+        "SLEEP(10) = 0": "不能调用函数: SLEEP",
+        "id > 0 AND BENCHMARK(100000000, MD5(code))": "不能调用函数: BENCHMARK",
+        "`sleep`(1) = 0": "不能调用函数: sleep",
+        "LOAD_FILE('/etc/passwd') IS NOT NULL": "不能调用函数: LOAD_FILE",
+        "id %status": "不能包含 %s",
+        "status = 'paid'; DROP TABLE orders": "多条语句",
+        "status = 'paid' -- x": "注释",
+        "status = 'paid": "未闭合",
+        'status = "paid': "未闭合",
+        "id IN (SELECT id FROM orders)": "子查询",
+        "amount > 0": "字段: amount",
+        "`secret` = 'x'": "字段: secret",
+    }
+    for predicate, message in rejected.items():
+        try:
+            validate(predicate, field_types)
+        except ValueError as e:
+            assert message in str(e), (predicate, str(e))
+        else:
+            raise AssertionError(f"未拒绝: {predicate}")
+    print(f"  ✅ 拒绝 {len(rejected)} 个不安全或引用未知字段的条件")
+
+def test_row_filter_injection():
+    """测试行过滤条件注入全量流式、增量流式、键集分页、增量分页和主键范围读取，参数顺序正确"""
+    print("\n🧪 测试行过滤条件注入各读取路径...")
+
+    pool = SQLiteMySQLPool({'shop1': ORDERS})
+    syncer = make_range_syncer(pool, tempfile.mkdtemp(), 1)
+    syncer.table_filters = {'orders': "status <> 'deleted' AND code NOT LIKE '%s%'"}
+    syncer.tenant_table_filters = {'shop1': {'orders': "id % 3 = 0"}}
+    row_filter = syncer._row_filter('shop1', 'orders', ORDERS_INFO)
+    filter_sql = "(status <> %s AND code NOT LIKE %s) AND (id % 3 = 0)"
+    assert row_filter == (filter_sql, ('deleted', '%s%'))
+    assert syncer._row_filter('shop2', 'orders', ORDERS_INFO) == ("(status <> %s AND code NOT LIKE %s)",
+                                                                 ('deleted', '%s%'))
+    assert syncer._row_filter('shop1', 'tiny', table_info(['id'], {'id': 'int(11)'})) is None
+
+    expected = [i for i in range(1, 101) if i % 10 != 0 and i % 3 == 0]
+    last_sync_time = datetime(2024, 1, 1, 0, 0, 0)
+    upper = datetime(2024, 1, 1, 0, 10, 0)
+    watermark = {'ts': last_sync_time, 'pk': None, 'inclusive': True}
+    readers = {
+        'FULL 流式': lambda: syncer.iter_table_data('shop1', 'orders', ORDERS_INFO, 'FULL',
+                                                    extra_condition=row_filter, normalize=False),
+        '增量流式': lambda: syncer.iter_table_data('shop1', 'orders', ORDERS_INFO, 'INCREMENTAL', last_sync_time, upper,
+                                                 extra_condition=row_filter, normalize=False, watermark=watermark),
+        '键集分页': lambda: syncer.iter_table_data_keyset('shop1', 'orders', ORDERS_INFO, upper,
+                                                       extra_condition=row_filter, normalize=False),
+        '增量分页': lambda: syncer.iter_table_data_seek('shop1', 'orders', ORDERS_INFO, last_sync_time, upper,
+                                                     extra_condition=row_filter, normalize=False, watermark=watermark),
+    }
+    for name, read in readers.items():
+        pool.queries.clear()
+        rows, _ = read_all(read())
+        assert [row['id'] for row in rows] == expected, (name, [row['id'] for row in rows])
+        assert all(filter_sql in query for query, _ in pool.data_queries()), name
+        print(f"  ✅ {name}: {len(rows)} 行")
+
+    # 主键范围并行读取：范围条件与行过滤条件合并
+    key_ranges = [(None, 26), (26, 51), (51, 76), (76, None)]
+    syncer.status_manager.save_checkpoint('shop1', 'orders', 'FULL', upper, key_ranges=key_ranges)
+    pool.queries.clear()
+    records = syncer.sync_ranges_parallel('shop1', 'orders', ORDERS_INFO, 'FULL', key_ranges, current_sync_time=upper,
+                                          checkpoint=syncer.status_manager.get_checkpoint('shop1', 'orders'),
+                                          row_filter=row_filter)
+    assert records == len(expected) and sorted(syncer.written) == expected
+    assert all(filter_sql in query for query, _ in pool.data_queries())
+    print(f"  ✅ 主键范围: {records} 行")
+
+if __name__ == "__main__":
+    test_keyset_predicate()
+    test_keyset_paging_composite_key()
+    test_keyset_paging_with_condition()
+    test_range_condition()
+    test_range_split()
+    test_range_resume_and_connection_budget()
+    test_read_source_clock()
+    test_next_watermark()
+    test_watermark_handover_to_seek()
+    test_seek_timestamp_ties()
+    test_row_filter_validation()
+    test_row_filter_injection()
+    print("\n🎉 所有测试完成！")
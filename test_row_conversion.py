@@ -0,0 +1,238 @@
+#!/usr/bin/env python3
+"""
+测试行数据类型转换：编译行转换器与原有两遍处理一致，列式标准化（Parquet加载）与编译行转换器（JSON加载）一致
+"""
+
+import sys
+from datetime import date, datetime, timedelta, timezone
+from decimal import Decimal, ROUND_HALF_UP
+
+# 添加当前目录到路径
+sys.path.append('.')
+
+import pyarrow as pa
+
+from smart_sync_incremental_optimized import (
+    BatchDataProcessor, ColumnarLoadWriter, ColumnarNormalizer, CompiledRowConverter, TableAnalyzer, mysql_to_bq_type
+)
+
+SYNC_TIME = datetime(2024, 5, 1, 12, 0, 0)
+
+COLUMNS = [
+    ('id', 'int(11)'),
+    ('amount', 'decimal(10,2)'),
+    ('rate', 'decimal(20,13)'),
+    ('big_amount', 'decimal(40,2)'),
+    ('huge_amount', 'decimal(65,10)'),
+    ('ratio', 'double'),
+    ('created_at', 'datetime'),
+    ('birthday', 'date'),
+    ('open_time', 'time'),
+    ('tags', "set('a','b')"),
+    ('name', 'varchar(32)'),
+]
+
+ROWS = [
+    {'id': 1, 'amount': Decimal('12.50'), 'rate': Decimal('1.1234567890123'),
+     'big_amount': Decimal('123456789012345678901234567890123456.78'),
+     'huge_amount': Decimal('1' * 45), 'ratio': 0.25,
+     'created_at': datetime(2024, 1, 2, 3, 4, 5, 123456), 'birthday': date(1990, 7, 1),
+     'open_time': timedelta(hours=9, minutes=30), 'tags': {'a'}, 'name': '张三'},
+    {'id': 2, 'amount': Decimal('-0.01'), 'rate': Decimal('-2.5000000005'),
+     'big_amount': Decimal('-1.5'), 'huge_amount': Decimal('0'), 'ratio': 3,
+     'created_at': datetime(2024, 2, 29, 23, 59, 59), 'birthday': date(2000, 1, 1),
+     'open_time': timedelta(days=1, seconds=5), 'tags': {'b'}, 'name': ''},
+    {'id': 3, 'amount': None, 'rate': None, 'big_amount': None, 'huge_amount': None, 'ratio': None,
+     'created_at': None, 'birthday': None, 'open_time': None, 'tags': None, 'name': None},
+]
+
+def table_info():
+    return TableAnalyzer.build_table_info(COLUMNS, ['id'])
+
+def stored_value(value, bq_type):
+    """按 BigQuery 存储后的取值归一化（JSON数值按十进制文本解析，NUMERIC 舍入到9位）"""
+    if value is None:
+        return None
+    if bq_type == 'NUMERIC':
+        return Decimal(str(value)).quantize(Decimal('1e-9'), rounding=ROUND_HALF_UP)
+    if bq_type == 'BIGNUMERIC':
+        return Decimal(str(value)).normalize()
+    if bq_type == 'FLOAT64':
+        return float(value)
+    if bq_type == 'TIMESTAMP':
+        if isinstance(value, str):
+            value = datetime.fromisoformat(value).replace(tzinfo=timezone.utc)
+        return value
+    if bq_type == 'DATE':
+        return date.fromisoformat(value) if isinstance(value, str) else value
+    return value
+
+LEGACY_FIELD_TYPES = {
+    'id': 'bigint(20)',
+    'amount': 'decimal(10,2)',
+    'discount': 'double',
+    'status': 'tinyint(4)',
+    'remark': 'text',
+    'created_at': 'datetime',
+    'updated_at': 'timestamp',
+    'biz_date': 'date',
+    'pay_time': 'time',
+    'tags': "set('a','b','c')",
+    'avatar': 'blob',
+    'token': 'varbinary(16)',
+}
+
+LEGACY_ROWS = [
+    {'id': 1, 'amount': Decimal('12.50'), 'discount': 0.1, 'status': 1, 'remark': 'ok',
+     'created_at': datetime(2024, 1, 1, 8, 0, 0, 250000), 'updated_at': datetime(2024, 1, 1, 9, 0),
+     'biz_date': date(2024, 1, 1), 'pay_time': timedelta(hours=13, minutes=5, seconds=7),
+     'tags': {'a', 'c'}, 'avatar': b'\x89PNG', 'token': bytearray(b'\x00\x01'), 'extra': 7},
+    # 零日期：连接参数不同，驱动可能返回 None 或原始字符串
+    {'id': 2, 'amount': Decimal('0.00'), 'discount': 1, 'status': '3', 'remark': '',
+     'created_at': '0000-00-00 00:00:00', 'updated_at': None,
+     'biz_date': '0000-00-00', 'pay_time': timedelta(days=-1, seconds=3600),
+     'tags': set(), 'avatar': b'', 'token': None, 'extra': None},
+    {'id': 3, 'amount': None, 'discount': None, 'status': None, 'remark': None,
+     'created_at': None, 'updated_at': None, 'biz_date': None, 'pay_time': None,
+     'tags': None, 'avatar': None, 'token': None, 'extra': 'x'},
+]
+
+def legacy_prepare_rows(rows, field_types, tenant_id, sync_timestamp, sync_mode):
+    """原有实现：添加系统字段 + 基础类型处理，再批量标准化"""
+    for row in rows:
+        row['tenant_id'] = tenant_id
+        row['sync_timestamp'] = sync_timestamp
+        row['sync_mode'] = sync_mode
+
+        for key, value in row.items():
+            if isinstance(value, datetime):
+                row[key] = value.isoformat()
+            elif isinstance(value, Decimal):
+                row[key] = float(value)
+
+    return BatchDataProcessor.batch_normalize_data_types(rows, field_types)
+
+def test_compiled_converter_matches_legacy():
+    """测试编译行转换器与原有两遍处理结果一致（TIME、SET、二进制、零日期、NULL、未知字段）"""
+    print("\n🧪 测试编译行转换器与原实现一致...")
+
+    sync_timestamp = SYNC_TIME.isoformat()
+    legacy_rows = legacy_prepare_rows([dict(row) for row in LEGACY_ROWS], LEGACY_FIELD_TYPES,
+                                      'shop1', sync_timestamp, 'FULL')
+    converter = CompiledRowConverter(tuple(LEGACY_ROWS[0].keys()), LEGACY_FIELD_TYPES)
+    compiled_rows = converter.convert(LEGACY_ROWS, 'shop1', sync_timestamp, 'FULL')
+
+    assert compiled_rows == legacy_rows, (compiled_rows, legacy_rows)
+    assert compiled_rows[0]['pay_time'] == '13:05:07'
+    assert compiled_rows[1]['pay_time'] == '-1 day, 1:00:00'
+    assert compiled_rows[0]['avatar'] == str(b'\x89PNG')
+    assert compiled_rows[1]['created_at'] == '0000-00-00 00:00:00'
+    assert compiled_rows[1]['biz_date'] == '0000-00-00'
+    assert compiled_rows[1]['status'] == 3
+    assert compiled_rows[0]['extra'] == '7'
+    assert all(compiled_rows[2][name] is None for name in LEGACY_FIELD_TYPES if name != 'id')
+    assert converter.conversions['extra'] == ('unknown', 'STRING')
+
+    # 行中已含系统字段时按列名取值，结果不变
+    with_system = [dict(row, tenant_id='old', sync_mode='X') for row in LEGACY_ROWS]
+    assert converter.convert(with_system, 'shop1', sync_timestamp, 'FULL') == legacy_rows
+
+    print("✅ 编译行转换器与原实现一致测试通过")
+
+def test_mysql_to_bq_type():
+    """测试 DECIMAL 按整数位数选择 NUMERIC / BIGNUMERIC / FLOAT64"""
+    print("\n🧪 测试 DECIMAL 类型映射...")
+
+    assert mysql_to_bq_type('decimal(10,2)') == 'NUMERIC'
+    assert mysql_to_bq_type('decimal(20,13)') == 'NUMERIC'
+    assert mysql_to_bq_type('decimal(38,9)') == 'NUMERIC'
+    assert mysql_to_bq_type('decimal(38,8)') == 'BIGNUMERIC'
+    assert mysql_to_bq_type('DECIMAL(40, 2)') == 'BIGNUMERIC'
+    assert mysql_to_bq_type('decimal(65,30)') == 'BIGNUMERIC'
+    assert mysql_to_bq_type('decimal(65,10)') == 'FLOAT64'
+    assert mysql_to_bq_type('decimal') == 'NUMERIC'
+    assert mysql_to_bq_type('int(11) unsigned') == 'INT64'
+    assert mysql_to_bq_type('geometry') == 'STRING'
+
+    types = {field.name: field.field_type for field in table_info()['schema']}
+    assert types['big_amount'] == 'BIGNUMERIC' and types['huge_amount'] == 'FLOAT64'
+
+    print("✅ DECIMAL 类型映射测试通过")
+
+def test_columnar_matches_row_converter():
+    """测试列式标准化与JSON行转换器写入BigQuery后的取值一致"""
+    print("\n🧪 测试列式标准化与行转换器一致...")
+
+    info = table_info()
+    json_rows = CompiledRowConverter(tuple(ROWS[0].keys()), info['field_types']).convert(
+        ROWS, 'tenant_a', SYNC_TIME.isoformat(), 'FULL'
+    )
+    batch = ColumnarNormalizer.normalize(ROWS, info, 'tenant_a', 'FULL', SYNC_TIME)
+    columnar_rows = batch.to_pylist()
+
+    assert batch.schema.names == [field.name for field in info['schema']]
+    assert len(columnar_rows) == len(json_rows) == len(ROWS)
+    for json_row, columnar_row in zip(json_rows, columnar_rows):
+        for field in info['schema']:
+            expected = stored_value(json_row[field.name], field.field_type)
+            actual = stored_value(columnar_row[field.name], field.field_type)
+            assert expected == actual, (field.name, field.field_type, expected, actual)
+
+    # 小数位超过9位的值按远离零舍入
+    assert columnar_rows[0]['rate'] == Decimal('1.123456789')
+    assert columnar_rows[1]['rate'] == Decimal('-2.500000001')
+    assert columnar_rows[0]['big_amount'] == Decimal('123456789012345678901234567890123456.78')
+    assert columnar_rows[0]['open_time'] == '9:30:00'
+    assert columnar_rows[1]['open_time'] == '1 day, 0:00:05'
+    assert columnar_rows[0]['tags'] == str({'a'})
+    assert all(value is None for name, value in columnar_rows[2].items()
+               if name not in CompiledRowConverter.SYSTEM_FIELDS and name != 'id')
+
+    print("✅ 列式标准化与行转换器一致测试通过")
+
+def test_columnar_conversion_count():
+    """测试转换统计只计取值被改变的值"""
+    print("\n🧪 测试列式转换统计...")
+
+    _, count = ColumnarNormalizer._normalize_column(
+        [Decimal('1.1234567890123'), Decimal('2.5'), None, Decimal('3.0000000001')], 'NUMERIC'
+    )
+    assert count == 2
+    _, count = ColumnarNormalizer._normalize_column([Decimal('12.50'), None], 'NUMERIC')
+    assert count == 0
+    _, count = ColumnarNormalizer._normalize_column([1, 2, None], 'FLOAT64')
+    assert count == 0
+    _, count = ColumnarNormalizer._normalize_column([datetime(2024, 1, 1), None], 'TIMESTAMP')
+    assert count == 0
+
+    print("✅ 列式转换统计测试通过")
+
+def test_columnar_writer_numeric():
+    """测试行转换后的 NUMERIC 列按十进制构建：取值精确，超出范围的值使本批失败"""
+    print("\n🧪 测试列式写入器 NUMERIC 列...")
+
+    writer = ColumnarLoadWriter()
+    column = writer._build_column(
+        [Decimal('12345678901234567890.123456789'), 0.1, 1e-05, Decimal('1.1234567890125'), -2.5000000005, '7', None],
+        'NUMERIC'
+    )
+    assert column.type == pa.decimal128(38, 9)
+    assert column.to_pylist() == [Decimal('12345678901234567890.123456789'), Decimal('0.1'), Decimal('0.00001'),
+                                  Decimal('1.123456789'), Decimal('-2.500000001'), Decimal('7'), None]
+
+    for bad in (Decimal('1e30'), float('nan'), float('inf')):
+        try:
+            writer._build_column([Decimal('1.5'), bad], 'NUMERIC')
+        except pa.ArrowInvalid:
+            pass
+        else:
+            raise AssertionError(f"超出范围的值未报错: {bad}")
+    print("  ✅ 大数值不经过 float64 精确保留，超出范围 / NaN / inf 报错")
+
+if __name__ == "__main__":
+    test_compiled_converter_matches_legacy()
+    test_mysql_to_bq_type()
+    test_columnar_matches_row_converter()
+    test_columnar_conversion_count()
+    test_columnar_writer_numeric()
+    print("\n🎉 所有测试完成！")
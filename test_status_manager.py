@@ -5,6 +5,10 @@
 
 import sys
 import json
+import multiprocessing
+import tempfile
+import threading
+import time
 from pathlib import Path
 from datetime import datetime
 
@@ -12,7 +16,10 @@ from datetime import datetime
 sys.path.append('.')
 
 # 导入状态管理器
-from smart_sync_incremental_optimized import LocalFileStatusManager
+from smart_sync_incremental_optimized import (
+    LocalFileStatusManager, SQLiteStatusManager, ShardLeaseCoordinator, write_file_atomic
+)
+from migrate_status_files import migrate_to_sqlite
 
 def test_status_manager():
     """测试状态管理器功能"""
@@ -63,6 +70,112 @@ def test_status_manager():
     
     print("\n🎉 所有测试完成！")
 
+def test_checkpoint(status_manager=None):
+    """测试断点保存、失败保留与成功清除"""
+    print(f"\n🧪 测试断点续传状态 ({type(status_manager or LocalFileStatusManager).__name__})")
+    print("=" * 50)
+    
+    status_manager = status_manager or LocalFileStatusManager(tempfile.mkdtemp())
+    tenant_id = "shop1"
+    table_name = "orders"
+    run_started_at = datetime(2025, 9, 29, 10, 0, 0)
+    
+    # 保存两个块的断点（复合主键，含时间类型）
+    status_manager.save_checkpoint(
+        tenant_id, table_name, "FULL", run_started_at,
+        segment_id="all", position=(42, datetime(2025, 9, 1, 8, 30)),
+        chunk_seq=2, records_synced=2000
+    )
+    
+    # 失败状态不能覆盖断点和上次同步时间
+    status_manager.update_sync_status(
+        tenant_id, table_name, datetime.now(), "FULL", 0, "FAILED", "boom"
+    )
+    assert status_manager.get_last_sync_time(tenant_id, table_name) is None
+    
+    checkpoint = status_manager.get_checkpoint(tenant_id, table_name)
+    assert checkpoint['sync_mode'] == "FULL"
+    assert checkpoint['run_started_at'] == run_started_at
+    segment = checkpoint['segments']['all']
+    assert segment['position'] == (42, datetime(2025, 9, 1, 8, 30))
+    assert segment['chunk_seq'] == 2 and segment['records_synced'] == 2000
+    print(f"  ✅ 断点: 第 {segment['chunk_seq']} 块, 位置 {segment['position']}")
+    
+    # 同步成功后断点被清除
+    status_manager.update_sync_status(
+        tenant_id, table_name, run_started_at, "FULL", 3000, "SUCCESS"
+    )
+    assert status_manager.get_checkpoint(tenant_id, table_name) is None
+    assert status_manager.get_last_sync_time(tenant_id, table_name) == run_started_at
+    print("  ✅ 同步成功后断点已清除")
+    
+    # 增量水位随成功状态保存，失败时保留
+    watermark = {'ts': datetime(2025, 9, 29, 9, 59, 58), 'pk': (42,), 'inclusive': False}
+    status_manager.update_sync_status(
+        tenant_id, table_name, run_started_at, "INCREMENTAL", 10, "SUCCESS", watermark=watermark
+    )
+    status_manager.update_sync_status(
+        tenant_id, table_name, datetime.now(), "INCREMENTAL", 0, "FAILED", "boom"
+    )
+    assert status_manager.get_watermark(tenant_id, table_name) == watermark
+    print(f"  ✅ 增量水位: {watermark['ts']} / {watermark['pk']}")
+
+def test_sqlite_concurrent_updates():
+    """测试SQLite状态库：多线程并发按行更新，互不覆盖"""
+    print("\n🧪 测试SQLite状态库并发更新")
+    print("=" * 50)
+    
+    status_dir = tempfile.mkdtemp()
+    status_manager = SQLiteStatusManager(f"{status_dir}/sync_status.db")
+    sync_time = datetime(2025, 9, 29, 10, 0, 0)
+    
+    def worker(worker_id):
+        for i in range(50):
+            status_manager.update_sync_status(f"shop{worker_id}", f"table{i}", sync_time, "INCREMENTAL", i)
+    
+    threads = [threading.Thread(target=worker, args=(worker_id,)) for worker_id in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    
+    summary = status_manager.get_database_summary("shop3")
+    assert summary['total_tables'] == 50 and summary['tables']['table7']['records_synced'] == 7
+    assert status_manager.get_last_sync_time("shop7", "table49") == sync_time
+    
+    status_manager.save_cdc_position("binlog", {'log_file': 'mysql-bin.000012', 'log_pos': 4567})
+    assert status_manager.get_cdc_position("binlog") == {'log_file': 'mysql-bin.000012', 'log_pos': 4567}
+    status_manager.close()
+    print("  ✅ 8 个线程 × 50 张表状态全部写入")
+
+def test_migrate_to_sqlite():
+    """测试JSON状态（含断点和CDC位置）一次性导入SQLite"""
+    print("\n🧪 测试JSON状态导入SQLite")
+    print("=" * 50)
+    
+    status_dir = tempfile.mkdtemp()
+    json_manager = LocalFileStatusManager(status_dir)
+    run_started_at = datetime(2025, 9, 29, 10, 0, 0)
+    json_manager.update_sync_status("shop1", "users", run_started_at, "FULL", 10)
+    json_manager.save_checkpoint("shop1", "orders", "FULL", run_started_at,
+                                 segment_id="all", position=(42,), chunk_seq=1, records_synced=1000)
+    json_manager.save_cdc_position("binlog", {'log_file': 'mysql-bin.000001', 'log_pos': 4})
+    
+    # 旧的单表状态文件
+    with open(Path(status_dir) / "shop2_order_items.json", 'w', encoding='utf-8') as f:
+        json.dump({'table_name': 'order_items', 'last_sync_time': run_started_at.isoformat(),
+                   'sync_status': 'SUCCESS', 'sync_mode': 'INCREMENTAL', 'records_synced': 5}, f)
+    
+    migrate_to_sqlite(status_dir)
+    
+    status_manager = SQLiteStatusManager(f"{status_dir}/sync_status.db")
+    assert status_manager.get_last_sync_time("shop1", "users") == run_started_at
+    assert status_manager.get_checkpoint("shop1", "orders")['segments']['all']['position'] == (42,)
+    assert status_manager.get_last_sync_time("shop2", "order_items") == run_started_at
+    assert status_manager.get_cdc_position("binlog") == {'log_file': 'mysql-bin.000001', 'log_pos': 4}
+    status_manager.close()
+    print("  ✅ 状态、断点、旧单表文件和CDC位置已导入")
+
 def show_all_databases():
     """显示所有数据库状态"""
     print("\n🗄️ 所有数据库状态概览")
@@ -113,9 +226,157 @@ def show_all_databases():
         except Exception as e:
             print(f"❌ 读取数据库文件失败 {db_file.name}: {e}")
 
+def test_write_behind():
+    """测试写缓冲：状态只在 flush 时落盘，全量断点立即落盘，损坏文件不被当作空状态"""
+    print("\n🧪 测试写缓冲状态更新")
+    print("=" * 50)
+    
+    status_dir = tempfile.mkdtemp()
+    status_manager = LocalFileStatusManager(status_dir, write_behind=True, flush_interval=3600)
+    sync_time = datetime(2025, 9, 29, 10, 0, 0)
+    status_file = Path(status_dir) / "shop1.json"
+    
+    for i in range(20):
+        status_manager.update_sync_status("shop1", f"table{i}", sync_time, "INCREMENTAL", i)
+    assert not status_file.exists(), "增量状态应只写入内存"
+    assert status_manager.get_last_sync_time("shop1", "table7") == sync_time
+    
+    status_manager.flush("shop1")
+    with open(status_file, 'r', encoding='utf-8') as f:
+        assert len(json.load(f)['tables']) == 20
+    assert not list(Path(status_dir).glob(".*.tmp")), "临时文件应已被原子替换"
+    
+    # 全量同步断点决定重启后的追加位置，保存和清除都立即落盘
+    status_manager.save_checkpoint("shop2", "orders", "FULL", sync_time,
+                                   segment_id="all", position=(42,), chunk_seq=1, records_synced=1000)
+    assert LocalFileStatusManager(status_dir).get_checkpoint("shop2", "orders") is not None
+    status_manager.update_sync_status("shop2", "orders", sync_time, "FULL", 1000)
+    assert LocalFileStatusManager(status_dir).get_checkpoint("shop2", "orders") is None
+    
+    status_manager.update_sync_status("shop1", "table0", sync_time, "INCREMENTAL", 99)
+    status_manager.close()
+    assert LocalFileStatusManager(status_dir).get_database_summary("shop1")['tables']['table0']['records_synced'] == 99
+    
+    status_file.write_text('{"tables": {', encoding='utf-8')
+    try:
+        LocalFileStatusManager(status_dir).get_last_sync_time("shop1", "table0")
+        raise AssertionError("损坏的状态文件不应被当作空状态")
+    except RuntimeError:
+        pass
+    print("  ✅ 缓冲落盘、全量断点立即落盘、损坏文件报错")
+
+def _update_tables_in_process(status_dir, worker_id):
+    status_manager = LocalFileStatusManager(status_dir, process_lock=True)
+    sync_time = datetime(2025, 9, 29, 10, 0, 0)
+    for i in range(25):
+        status_manager.update_sync_status("shop1", f"w{worker_id}_table{i}", sync_time, "INCREMENTAL", i)
+
+def test_process_locked_status():
+    """测试多进程共享本地状态文件：文件锁保护读-改-写，各进程的更新互不覆盖"""
+    print("\n🧪 测试多进程共享状态文件")
+    print("=" * 50)
+    
+    status_dir = tempfile.mkdtemp()
+    processes = [multiprocessing.Process(target=_update_tables_in_process, args=(status_dir, worker_id))
+                 for worker_id in range(4)]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join()
+    
+    assert all(process.exitcode == 0 for process in processes)
+    summary = LocalFileStatusManager(status_dir).get_database_summary("shop1")
+    assert summary['total_tables'] == 100, summary['total_tables']
+    print("  ✅ 4 个进程 × 25 张表状态全部写入同一个租户文件")
+
+def _write_file_in_process(path, worker_id):
+    for i in range(50):
+        write_file_atomic(path, json.dumps({'worker': worker_id, 'i': i, 'padding': 'x' * (50000 + worker_id)}))
+
+def test_concurrent_atomic_writes():
+    """测试多个进程同时原子写同一个文件（如共享的表结构缓存）：各自使用唯一的临时文件，结果总是完整的"""
+    print("\n🧪 测试多进程原子写同一文件")
+    print("=" * 50)
+    
+    directory = Path(tempfile.mkdtemp())
+    path = directory / "table_info_cache.json"
+    processes = [multiprocessing.Process(target=_write_file_in_process, args=(path, worker_id))
+                 for worker_id in range(4)]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join()
+    
+    assert all(process.exitcode == 0 for process in processes)
+    content = json.loads(path.read_text(encoding='utf-8'))
+    assert content['i'] == 49 and len(content['padding']) == 50000 + content['worker']
+    assert [file.name for file in directory.iterdir()] == [path.name]
+    print("  ✅ 4 个进程 × 50 次写入，最终文件完整且没有残留临时文件")
+
+def test_shard_leases():
+    """测试分片租约：领取、跨进程并发上限、崩溃后过期接管、租约所有权和收尾任务去重"""
+    print("\n🧪 测试分片租约协调")
+    print("=" * 50)
+    
+    db_path = f"{tempfile.mkdtemp()}/_shard_leases.db"
+    jobs = [("shop1", "orders"), ("shop1", "users"), ("shop2", "orders")]
+    crashed = ShardLeaseCoordinator(db_path, "run1", max_per_tenant=1, lease_seconds=0.3,
+                                    max_attempts=2, worker_id="host-a:1")
+    alive = ShardLeaseCoordinator(db_path, "run1", max_per_tenant=1, lease_seconds=60,
+                                  max_attempts=2, worker_id="host-b:2")
+    crashed.register_jobs(jobs)
+    alive.register_jobs(jobs)
+    
+    assert crashed.claim() == ("shop1", "orders")
+    # shop1 已有一个有效租约，另一个进程只能领取 shop2 的任务
+    assert alive.claim() == ("shop2", "orders")
+    assert alive.claim() is None and alive.open_jobs() == 3
+    
+    # host-a 不再续约，租约过期：优先领取从未执行的任务，租户并发上限仍然生效
+    time.sleep(0.4)
+    assert alive.claim() == ("shop1", "users")
+    assert alive.claim() is None
+    assert alive.complete("shop1", "users", True)
+    
+    # 过期任务由 host-b 接管；host-a 恢复后无法再提交结果
+    assert alive.claim() == ("shop1", "orders")
+    assert not crashed.complete("shop1", "orders", True)
+    assert alive.complete("shop1", "orders", True)
+    assert alive.complete("shop2", "orders", False, "boom")
+    assert alive.claim() is None and alive.open_jobs() == 0
+    assert alive.summary() == {'done': 2, 'failed': 1}
+    
+    # 每次领取后都崩溃的任务，租约过期达到 max_attempts 次后标记为失败
+    poison = ShardLeaseCoordinator(db_path, "run-poison", lease_seconds=0.3, max_attempts=2, worker_id="host-a:1")
+    poison.register_jobs([("shop3", "orders")])
+    for _ in range(2):
+        assert poison.claim() == ("shop3", "orders")
+        time.sleep(0.4)
+    assert poison.claim() is None and poison.summary() == {'failed': 1}
+    poison.close()
+    
+    assert alive.acquire_once("storage_write_merge:orders")
+    assert not crashed.acquire_once("storage_write_merge:orders")
+    
+    # run() 在任务全部结束后返回，只返回本进程执行的结果
+    runner = ShardLeaseCoordinator(db_path, "run2", worker_count=2, worker_id="host-c:3")
+    results = runner.run(jobs, lambda db_name, table_name: {'status': 'SUCCESS', 'table': table_name})
+    assert len(results) == 3 and runner.summary() == {'done': 3}
+    for coordinator in (crashed, alive, runner):
+        coordinator.close()
+    print("  ✅ 并发上限、过期接管、所有权校验、失败上限、收尾任务去重")
+
 if __name__ == "__main__":
     if len(sys.argv) > 1 and sys.argv[1] == '--overview':
         show_all_databases()
     else:
         test_status_manager()
+        test_checkpoint()
+        test_checkpoint(SQLiteStatusManager(f"{tempfile.mkdtemp()}/sync_status.db"))
+        test_sqlite_concurrent_updates()
+        test_migrate_to_sqlite()
+        test_write_behind()
+        test_process_locked_status()
+        test_concurrent_atomic_writes()
+        test_shard_leases()
         show_all_databases()
\ No newline at end of file
@@ -0,0 +1,175 @@
+#!/usr/bin/env python3
+"""
+测试全局调度器（租户/表并发上限）与单表流水线（顺序写入、背压、异常传播）
+"""
+
+import sys
+import time
+import random
+import threading
+
+# 添加当前目录到路径
+sys.path.append('.')
+
+from smart_sync_incremental_optimized import GlobalSyncScheduler, TablePipeline
+
+class ConcurrencyProbe:
+    """记录任务执行期间各租户/各表的最大并发数"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.running_by_tenant = {}
+        self.running_by_table = {}
+        self.max_by_tenant = {}
+        self.max_by_table = {}
+        self.running = 0
+        self.max_running = 0
+
+    def _enter(self, running, maximum, key):
+        running[key] = running.get(key, 0) + 1
+        maximum[key] = max(maximum.get(key, 0), running[key])
+
+    def job(self, db_name, table_name):
+        with self.lock:
+            self._enter(self.running_by_tenant, self.max_by_tenant, db_name)
+            self._enter(self.running_by_table, self.max_by_table, table_name)
+            self.running += 1
+            self.max_running = max(self.max_running, self.running)
+        time.sleep(random.uniform(0.005, 0.02))
+        with self.lock:
+            self.running_by_tenant[db_name] -= 1
+            self.running_by_table[table_name] -= 1
+            self.running -= 1
+        return {'db_name': db_name, 'table_name': table_name}
+
+def make_jobs(tenant_count, tables):
+    return [(f"shop{i}", table) for i in range(tenant_count) for table in tables]
+
+def test_scheduler_limits():
+    """测试全局调度器遵守每租户、每表并发上限，且所有任务都执行一次"""
+    print("\n🧪 测试全局调度器并发上限...")
+
+    random.seed(7)
+    jobs = make_jobs(4, ['orders', 'items', 'members', 'logs'])
+
+    for max_per_tenant, max_per_table in [(1, None), (None, 2), (2, 1)]:
+        probe = ConcurrencyProbe()
+        scheduler = GlobalSyncScheduler(8, max_per_tenant=max_per_tenant, max_per_table=max_per_table)
+        results = scheduler.run(jobs, probe.job)
+
+        assert sorted((r['db_name'], r['table_name']) for r in results) == sorted(jobs)
+        assert probe.max_running <= 8
+        if max_per_tenant:
+            assert max(probe.max_by_tenant.values()) <= max_per_tenant, probe.max_by_tenant
+        if max_per_table:
+            assert max(probe.max_by_table.values()) <= max_per_table, probe.max_by_table
+        assert all(count == 0 for count in scheduler._running_by_tenant.values())
+        print(f"  ✅ 每租户≤{max_per_tenant or '不限'}, 每表≤{max_per_table or '不限'}: "
+              f"租户最大并发 {max(probe.max_by_tenant.values())}, 表最大并发 {max(probe.max_by_table.values())}")
+
+    # 受限任务排在队首时不阻塞后面可执行的任务
+    probe = ConcurrencyProbe()
+    scheduler = GlobalSyncScheduler(4, max_per_tenant=1)
+    jobs = [('shop0', 'a'), ('shop0', 'b'), ('shop0', 'c'), ('shop1', 'a'), ('shop2', 'a'), ('shop3', 'a')]
+    scheduler.run(jobs, probe.job)
+    assert probe.max_by_tenant['shop0'] == 1 and probe.max_running > 1
+    print(f"  ✅ 受限任务不阻塞其他租户: 最大并发 {probe.max_running}")
+
+    assert GlobalSyncScheduler(4).run([], probe.job) == []
+    print("✅ 全局调度器测试通过")
+
+def make_chunks(count, size=3, closed=None):
+    """生成带位置的数据块，生成器关闭时记录"""
+    try:
+        for seq in range(1, count + 1):
+            yield [{'id': seq * 100 + i} for i in range(size)], (seq,)
+    finally:
+        if closed is not None:
+            closed.set()
+
+def test_pipeline_order_and_backpressure():
+    """测试多个转换线程乱序完成时按块顺序写入，且上游受有界队列限制"""
+    print("\n🧪 测试流水线顺序写入与背压...")
+
+    extracted = []
+    loaded = []
+    committed = []
+    max_in_flight = [0]
+
+    def chunks():
+        for rows, position in make_chunks(20):
+            extracted.append(position[0])
+            yield rows, position
+
+    def transform(rows):
+        time.sleep(random.uniform(0, 0.01))
+        return [dict(row, converted=True) for row in rows]
+
+    def load(chunk, first):
+        assert first == (not loaded)
+        seq = chunk[0]['id'] // 100
+        max_in_flight[0] = max(max_in_flight[0], len(extracted) - seq)
+        time.sleep(0.005)
+        loaded.append(seq)
+        return len(chunk)
+
+    pipeline = TablePipeline(transform_workers=3, queue_size=2)
+    written = pipeline.run(chunks(), transform, load,
+                           lambda seq, position, total: committed.append((seq, position, total)))
+
+    assert written == 60
+    assert loaded == list(range(1, 21))
+    assert committed == [(seq, (seq,), seq * 3) for seq in range(1, 21)]
+    # 在途块数：两个队列 + 转换线程手中 + 加载阶段重排等待，不会无界增长
+    bound = 2 * pipeline.queue_size + 2 * pipeline.transform_workers + 1
+    assert max_in_flight[0] <= bound, (max_in_flight[0], bound)
+    assert all(stats['busy'] >= 0 and stats['idle'] >= 0 for stats in pipeline.stage_stats.values())
+    print(f"  ✅ 20 块按序写入，抽取最多领先加载 {max_in_flight[0]} 块（上限 {bound}）")
+    print("✅ 流水线顺序写入与背压测试通过")
+
+def test_pipeline_errors():
+    """测试任一阶段异常都会传播给调用方，并关闭数据源、结束所有阶段线程"""
+    print("\n🧪 测试流水线异常传播...")
+
+    def failing_source(closed):
+        yield from make_chunks(2, closed=closed)
+        raise RuntimeError("extract failed")
+
+    def fail_on(seq_to_fail, message):
+        def stage(chunk, *args):
+            if chunk[0]['id'] // 100 == seq_to_fail:
+                raise RuntimeError(message)
+            return chunk if not args else len(chunk)
+        return stage
+
+    cases = [
+        ('extract', lambda closed: failing_source(closed), lambda rows: rows, lambda chunk, first: len(chunk)),
+        ('transform', lambda closed: make_chunks(50, closed=closed), fail_on(3, "transform failed"),
+         lambda chunk, first: len(chunk)),
+        ('load', lambda closed: make_chunks(50, closed=closed), lambda rows: rows, fail_on(2, "load failed")),
+    ]
+
+    for stage, source, transform, load in cases:
+        closed = threading.Event()
+        threads_before = threading.active_count()
+        pipeline = TablePipeline(transform_workers=2, queue_size=1)
+        started = time.perf_counter()
+        try:
+            pipeline.run(source(closed), transform, load)
+        except RuntimeError as e:
+            assert str(e) == f"{stage} failed", e
+        else:
+            raise AssertionError(f"{stage} 阶段异常未传播")
+
+        assert closed.is_set(), f"{stage}: 数据源未关闭"
+        assert threading.active_count() == threads_before, f"{stage}: 阶段线程未退出"
+        assert time.perf_counter() - started < 5
+        print(f"  ✅ {stage} 阶段异常已传播，数据源已关闭，线程已退出")
+
+    print("✅ 流水线异常传播测试通过")
+
+if __name__ == "__main__":
+    test_scheduler_limits()
+    test_pipeline_order_and_backpressure()
+    test_pipeline_errors()
+    print("\n🎉 所有测试完成！")
@@ -0,0 +1,246 @@
+#!/usr/bin/env python3
+"""
+测试表结构分析：磁盘缓存的结构指纹校验、批量分析时相同结构的共享、字段投影规则
+"""
+
+import sys
+import hashlib
+import tempfile
+from pathlib import Path
+
+# 添加当前目录到路径
+sys.path.append('.')
+
+from smart_sync_incremental_optimized import TableAnalyzer, TableInfoCache
+
+ORDERS = [('id', 'bigint(20)', 'PRI'), ('status', 'varchar(16)', ''), ('updated_at', 'datetime', '')]
+ITEMS = [('order_id', 'bigint(20)', 'PRI'), ('line_no', 'int(11)', 'PRI'), ('sku', 'varchar(32)', '')]
+
+class SchemaCursor:
+    """按 INFORMATION_SCHEMA 查询返回预置表结构的游标"""
+
+    def __init__(self, pool):
+        self.pool = pool
+        self.rows = []
+
+    def execute(self, sql, params=()):
+        self.pool.queries.append(sql)
+        tables = [(schema, table) for (schema, table) in sorted(self.pool.tables)
+                  if schema in params and table in params]
+        if 'MD5(GROUP_CONCAT' in sql:
+            self.rows = [(schema, table, hashlib.md5(','.join(
+                ':'.join(column) for column in self.pool.tables[(schema, table)]).encode()).hexdigest())
+                for schema, table in tables]
+        elif 'KEY_COLUMN_USAGE' in sql:
+            self.rows = [(schema, table, name) for schema, table in tables
+                         for name, _, key in self.pool.tables[(schema, table)] if key == 'PRI']
+        elif 'INFORMATION_SCHEMA.COLUMNS' in sql:
+            self.rows = [(schema, table, name, column_type) for schema, table in tables
+                         for name, column_type, _ in self.pool.tables[(schema, table)]]
+        else:
+            self.rows = []
+
+    def fetchall(self):
+        return self.rows
+
+    def close(self):
+        pass
+
+class SchemaConnection:
+    def __init__(self, pool):
+        self.pool = pool
+
+    def cursor(self):
+        return SchemaCursor(self.pool)
+
+    def close(self):
+        pass
+
+class SchemaPool:
+    """连接池替身：tables 为 {(库, 表): [(字段, 类型, 键)]}"""
+
+    def __init__(self, tables):
+        self.tables = {key: list(columns) for key, columns in tables.items()}
+        self.queries = []
+
+    def get_connection(self):
+        return SchemaConnection(self)
+
+    def bulk_queries(self):
+        return [sql for sql in self.queries if 'ORDER BY TABLE_SCHEMA, TABLE_NAME, ORDINAL_POSITION' in sql]
+
+def make_pool():
+    return SchemaPool({
+        ('shop1', 'orders'): ORDERS, ('shop2', 'orders'): ORDERS, ('shop3', 'orders'): ORDERS,
+        ('shop1', 'order_items'): ITEMS, ('shop2', 'order_items'): ITEMS,
+    })
+
+DBS = ['shop1', 'shop2', 'shop3']
+TABLES = ['orders', 'order_items']
+
+def test_fingerprint_invalidation():
+    """测试磁盘缓存：结构未变的表复用缓存，指纹变化的表丢弃缓存并重新分析"""
+    print("\n🧪 测试表结构缓存指纹校验...")
+
+    with tempfile.TemporaryDirectory() as cache_dir:
+        cache_file = Path(cache_dir) / "_table_info_cache.json"
+        pool = make_pool()
+
+        # 首次运行：批量分析并保存
+        cache = TableInfoCache(str(cache_file))
+        TableAnalyzer(pool, cache).warm_cache(DBS, TABLES)
+        assert len(pool.bulk_queries()) == 2
+        cache.save()
+        assert cache_file.exists()
+
+        # 结构未变：全部复用，不再执行批量分析
+        pool.queries.clear()
+        cache = TableInfoCache(str(cache_file))
+        TableAnalyzer(pool, cache).warm_cache(DBS, TABLES)
+        assert pool.bulk_queries() == []
+        assert cache.get_table_info('shop2', 'orders')['field_types']['status'] == 'varchar(16)'
+        print("  ✅ 结构未变：5 张表全部复用磁盘缓存")
+
+        # shop2.orders 修改字段类型：只有这张表的缓存失效并重新分析
+        pool.tables[('shop2', 'orders')] = [('id', 'bigint(20)', 'PRI'), ('status', 'varchar(64)', ''),
+                                            ('updated_at', 'datetime', '')]
+        pool.queries.clear()
+        cache = TableInfoCache(str(cache_file))
+        assert cache.validate(TableAnalyzer(pool, cache).load_schema_fingerprints(DBS, TABLES)) == 4
+        assert cache.get_table_info('shop2', 'orders') is None
+        TableAnalyzer(pool, cache).warm_cache(DBS, TABLES)
+        assert pool.bulk_queries() and all(sql.count('%s') == 2 for sql in pool.bulk_queries())
+        assert cache.get_table_info('shop2', 'orders')['field_types']['status'] == 'varchar(64)'
+        assert cache.get_table_info('shop1', 'orders')['field_types']['status'] == 'varchar(16)'
+
+        # 保存后再次启动：新指纹生效
+        cache.save()
+        pool.queries.clear()
+        cache = TableInfoCache(str(cache_file))
+        TableAnalyzer(pool, cache).warm_cache(DBS, TABLES)
+        assert pool.bulk_queries() == []
+        assert cache.get_table_info('shop2', 'orders')['field_types']['status'] == 'varchar(64)'
+        print("  ✅ 字段类型变化：只重新分析 shop2.orders，保存后按新指纹复用")
+
+        # 表被删除：不在指纹中的条目不会被复用
+        del pool.tables[('shop3', 'orders')]
+        cache = TableInfoCache(str(cache_file))
+        TableAnalyzer(pool, cache).warm_cache(DBS, TABLES)
+        assert cache.get_table_info('shop3', 'orders') is None
+        print("  ✅ 已删除的表不复用缓存")
+
+    print("✅ 表结构缓存指纹校验测试通过")
+
+def test_bulk_analysis_sharing():
+    """测试批量分析：两次查询覆盖所有表，结构（指纹）相同的租户表共享表信息，结构不同的各自独立"""
+    print("\n🧪 测试批量分析共享表信息...")
+
+    pool = make_pool()
+    # shop3.orders 主键不同，shop2.order_items 多一个字段
+    pool.tables[('shop3', 'orders')] = [('id', 'bigint(20)', ''), ('status', 'varchar(16)', 'PRI'),
+                                        ('updated_at', 'datetime', '')]
+    pool.tables[('shop2', 'order_items')] = ITEMS + [('qty', 'int(11)', '')]
+    cache = TableInfoCache()
+    analyzer = TableAnalyzer(pool, cache)
+
+    assert analyzer.analyze_tables_bulk(DBS, TABLES) == 5
+    assert len(pool.queries) == 2
+    fingerprints = analyzer.load_schema_fingerprints(DBS, TABLES)
+
+    infos = {key: cache.get_table_info(*key.split('.', 1)) for key in fingerprints}
+    for key_a, info_a in infos.items():
+        for key_b, info_b in infos.items():
+            same_table = key_a.split('.', 1)[1] == key_b.split('.', 1)[1]
+            shared = same_table and fingerprints[key_a] == fingerprints[key_b]
+            assert (info_a is info_b) == shared, (key_a, key_b)
+
+    assert infos['shop1.orders'] is infos['shop2.orders']
+    assert infos['shop3.orders']['primary_keys'] == ['status']
+    assert infos['shop1.orders']['primary_keys'] == ['id']
+    assert infos['shop1.order_items']['primary_keys'] == ['order_id', 'line_no']
+    assert 'qty' in infos['shop2.order_items']['field_types']
+    assert 'qty' not in infos['shop1.order_items']['field_types']
+    assert infos['shop1.orders']['timestamp_field'] == 'updated_at'
+    print(f"  ✅ 5 张表 2 次查询, {len({id(info) for info in infos.values()})} 种不同结构")
+
+    print("✅ 批量分析共享表信息测试通过")
+
+WIDE = [('ID', 'bigint(20)', 'PRI'), ('Title', 'varchar(64)', ''), ('Body', 'longtext', ''),
+        ('Payload', 'json', ''), ('updated_at', 'datetime', '')]
+
+def test_column_projection():
+    """测试字段投影：include/exclude 不区分大小写，主键和时间戳字段不能被排除，规则变化使缓存失效"""
+    print("\n🧪 测试字段投影规则...")
+
+    # 配置格式校验
+    for bad_rules in ([], {'posts': []}, {'posts': {}}, {'posts': {'only': ['a']}},
+                      {'posts': {'exclude': 'body'}}, {'posts': {'include': ['a', 1]}}):
+        try:
+            TableAnalyzer.validate_column_rules(bad_rules)
+        except ValueError:
+            continue
+        raise AssertionError(f"应拒绝字段配置: {bad_rules}")
+    assert TableAnalyzer.validate_column_rules({'posts': {'exclude': ['body']}}) == {'posts': {'exclude': ['body']}}
+
+    names = [name for name, _, _ in WIDE]
+    project = TableAnalyzer.project_columns
+    # 大小写不敏感，保持表中字段顺序
+    assert project(names, ['ID'], 'updated_at', {'exclude': ['body', 'PAYLOAD']}) == ['ID', 'Title', 'updated_at']
+    assert project(names, ['ID'], 'updated_at', {'include': ['payload', 'title']}) == \
+        ['ID', 'Title', 'Payload', 'updated_at']
+    # 不存在的字段忽略
+    assert project(names, ['ID'], None, {'exclude': ['missing']}) == names
+    assert project(names, ['ID'], None, None) == names
+
+    # 显式排除主键或时间戳字段被拒绝
+    for rule in ({'exclude': ['id']}, {'exclude': ['Body', 'UPDATED_AT']}):
+        try:
+            project(names, ['ID'], 'updated_at', rule)
+        except ValueError as e:
+            assert "主键或时间戳" in str(e)
+        else:
+            raise AssertionError(f"应拒绝排除主键/时间戳字段: {rule}")
+    print("  ✅ 大小写不敏感、include 自动保留主键/时间戳、排除主键/时间戳被拒绝")
+
+    # build_table_info：schema、field_types 和 SELECT 字段随投影变化
+    columns = [(name, column_type) for name, column_type, _ in WIDE]
+    info = TableAnalyzer.build_table_info(columns, ['ID'], {'exclude': ['BODY', 'payload']})
+    assert info['columns'] == ['ID', 'Title', 'updated_at']
+    assert [field.name for field in info['schema']] == ['ID', 'Title', 'updated_at', 'tenant_id', 'sync_timestamp', 'sync_mode']
+    assert set(info['field_types']) == {'ID', 'Title', 'updated_at'}
+    assert info['timestamp_field'] == 'updated_at'
+    assert TableAnalyzer.build_table_info(columns, ['ID'])['columns'] is None
+
+    # 规则参与缓存指纹：修改 table_columns 后缓存失效；配置错误的表不缓存，其余表照常分析
+    pool = SchemaPool({('shop1', 'posts'): WIDE, ('shop2', 'posts'): WIDE, ('shop1', 'orders'): ORDERS})
+    with tempfile.TemporaryDirectory() as cache_dir:
+        cache_file = str(Path(cache_dir) / "_table_info_cache.json")
+        rules = {'posts': {'exclude': ['body']}}
+        cache = TableInfoCache(cache_file)
+        TableAnalyzer(pool, cache, rules).warm_cache(['shop1', 'shop2'], ['posts', 'orders'])
+        cache.save()
+        before = TableAnalyzer(pool, cache, rules).load_schema_fingerprints(['shop1'], ['posts', 'orders'])
+
+        changed = {'posts': {'exclude': ['body', 'payload']}}
+        after = TableAnalyzer(pool, cache, changed).load_schema_fingerprints(['shop1'], ['posts', 'orders'])
+        assert before['shop1.posts'] != after['shop1.posts']
+        assert before['shop1.orders'] == after['shop1.orders']
+
+        cache = TableInfoCache(cache_file)
+        TableAnalyzer(pool, cache, changed).warm_cache(['shop1', 'shop2'], ['posts', 'orders'])
+        assert cache.get_table_info('shop1', 'posts')['columns'] == ['ID', 'Title', 'updated_at']
+
+        cache = TableInfoCache()
+        analyzer = TableAnalyzer(pool, cache, {'posts': {'exclude': ['id']}})
+        analyzer.analyze_tables_bulk(['shop1', 'shop2'], ['posts', 'orders'])
+        assert cache.get_table_info('shop1', 'posts') is None
+        assert cache.get_table_info('shop1', 'orders') is not None
+    print("  ✅ 规则变化使缓存失效，配置错误的表单独报错")
+
+    print("✅ 字段投影规则测试通过")
+
+if __name__ == "__main__":
+    test_fingerprint_invalidation()
+    test_bulk_analysis_sharing()
+    test_column_projection()
+    print("\n🎉 所有测试完成！")